@@ -6,22 +6,40 @@ password = 'testpass123'
 base_url = 'http://127.0.0.1:8000/api/'
 
 
-# retrieve all courses
-r = requests.get(f'{base_url}courses/')
-courses = r.json()
+# retrieve all courses, following the cursor
+# of the next page until the last page. Only
+# the id and the title of the courses are used.
+courses = []
+url = f'{base_url}courses/?fields=id,title'
+while url:
+    r = requests.get(url)
+    page = r.json()
+    courses += page['results']
+    url = page['next']
 
 avaible_courses = ', '.join([course['title'] for course in courses])
 print(f'Avaible courses: {avaible_courses}')
 
 
 
-for course in courses:
-    course_id = course['id']
-    course_title = course['title']
-    r = requests.post(f'{base_url}courses/{course_id}/enroll/',
-                      auth=(username, password))
-    if r.status_code == 200:
-        # successful request
+# exchange the password for an API token once, and
+# authenticate the next requests with the token
+r = requests.post(f'{base_url}tokens/',
+                  json={'name': 'enroll_all', 'lifetime': 1},
+                  auth=(username, password))
+r.raise_for_status()
+headers = {'Authorization': f"Token {r.json()['token']}"}
+
+# enroll in all the courses with a single request
+titles = {course['id']: course['title'] for course in courses}
+r = requests.post(f'{base_url}courses/enroll/',
+                  json={'courses': list(titles)},
+                  headers=headers)
+r.raise_for_status()
+for result in r.json()['results']:
+    course_title = titles[result['course']]
+    if result['enrolled']:
+        # successful enrollment
         print(f'Successfully enroll in {course_title}')
     else:
         print(f'Unsuccessfully enroll in {course_title}')
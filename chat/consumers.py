@@ -1,8 +1,16 @@
 import json
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from asgiref.sync import async_to_sync
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
 from django.utils import timezone
 
+from courses import enrollment, ratelimit
+
+# messages of each user, whatever the room
+chat_messages = ratelimit.TokenBucket.from_rate('chat',
+                                                settings.CHAT_MESSAGE_RATE)
+
 class ChatConsumer(AsyncWebsocketConsumer):
     
     async def connect(self):
@@ -12,6 +20,17 @@ class ChatConsumer(AsyncWebsocketConsumer):
         # retrieve the course id from scope. 
         self.id = self.scope['url_route']['kwargs']['course_id']
         self.room_group_name = f'chat_{self.id}'
+        # refuse new connections while the server is overloaded
+        if await sync_to_async(ratelimit.load.overloaded,
+                               thread_sensitive=False)():
+            await self.close(code=ratelimit.CLOSE_TRY_AGAIN_LATER)
+            return
+        # only the students of the course can join its room,
+        # as in the view of the room
+        if not await database_sync_to_async(enrollment.is_enrolled)(
+                                                self.user, self.id):
+            await self.close()
+            return
         
         # join room group
         await self.channel_layer.group_add(
@@ -31,6 +50,31 @@ class ChatConsumer(AsyncWebsocketConsumer):
     
     # receive messages from WebSocket
     async def receive(self, text_data):
+        # close the connection of clients sending messages
+        # faster than the rate limit, or while the site is overloaded.
+        # Messages are counted with the requests in progress.
+        close_code, token = await sync_to_async(self.admit,
+                                                thread_sensitive=False)()
+        if close_code:
+            await self.close(code=close_code)
+            return
+        try:
+            await self.send_message(text_data)
+        finally:
+            await sync_to_async(ratelimit.load.finish,
+                                thread_sensitive=False)(token)
+
+    def admit(self):
+        allowed, _ = chat_messages.consume(self.user.id)
+        if not allowed:
+            return ratelimit.CLOSE_RATE_LIMITED, None
+        token = ratelimit.load.start()
+        if ratelimit.load.overloaded():
+            ratelimit.load.finish(token)
+            return ratelimit.CLOSE_TRY_AGAIN_LATER, None
+        return None, token
+
+    async def send_message(self, text_data):
         # json.loads() parse the valid text_data JSON and
         # convert it into dict.
         text_data_json = json.loads(text_data)
@@ -1,3 +1,55 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+from courses import ratelimit
+from courses.tests import CoursesTestCase
+
+from . import consumers
+
+
+class ChatRoomTests(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.student = User.objects.create_user('student',
+                                                password='password')
+        self.course = self.create_course()
+        self.url = reverse('chat:course_chat_room', args=[self.course.id])
+
+    def test_only_students_join_the_room(self):
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.students.add(self.student)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['course'], self.course)
+
+    def test_login_required(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+
+class ChatAdmissionTests(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.consumer = consumers.ChatConsumer()
+        self.consumer.user = User.objects.create_user('student')
+
+    def test_rate_limited(self):
+        with mock.patch.object(consumers.chat_messages, 'capacity', 1), \
+                mock.patch('time.time', return_value=1000):
+            code, token = self.consumer.admit()
+            self.assertIsNone(code)
+            ratelimit.load.finish(token)
+            self.assertEqual(self.consumer.admit(),
+                             (ratelimit.CLOSE_RATE_LIMITED, None))
+
+    def test_overloaded(self):
+        with mock.patch.object(ratelimit.load, 'max_in_flight', 0):
+            self.assertEqual(self.consumer.admit(),
+                             (ratelimit.CLOSE_TRY_AGAIN_LATER, None))
+        self.assertEqual(ratelimit.load.local_in_flight, 0)
@@ -2,14 +2,21 @@ from django.contrib.auth.decorators import login_required
 from django.http import HttpResponseForbidden
 from django.shortcuts import render, get_list_or_404
 
+from courses import enrollment
+from courses.models import Course
+
 
 @ login_required
 def course_chat_room(request, course_id):
-    try:
-        # retrieve course with given id joined by the current user
-        course = request.user.courses_joined.get(id=course_id)
-    except:
-        # user is not a student of the course or course does not exist
+    # check the enrollment of the current user
+    # in the cached enrollments of the user
+    if not enrollment.is_enrolled(request.user, course_id):
+        # user is not a student of the course
+        return HttpResponseForbidden()
+    # retrieve course with given id
+    course = Course.objects.filter(id=course_id).first()
+    if course is None:
+        # course does not exist
         return HttpResponseForbidden()
     
     return render(request, 'chat/room.html', {'course': course})
@@ -0,0 +1,147 @@
+import hashlib
+import re
+import secrets
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.authentication import (BaseAuthentication,
+                                           get_authorization_header)
+from rest_framework.exceptions import AuthenticationFailed
+
+from courses.localcache import LocalCache
+from courses.models import APIToken
+
+
+# Clients exchange their password for a token once (POST /api/tokens/)
+# and send "Authorization: Token <token>" afterwards. Checking a token
+# is a SHA-256 and a cache lookup, instead of the PBKDF2 hash of the
+# password that BasicAuthentication computes on every request.
+#
+# The owner of a token is cached in the process for LOCAL_CACHE_TIMEOUT
+# seconds and in the shared cache for TOKEN_CACHE_TIMEOUT seconds.
+# Revoking a token, or changing its user, removes it from the shared
+# cache and the cache of the current process: the other processes stop
+# accepting it after LOCAL_CACHE_TIMEOUT seconds at most.
+TOKEN_LIFETIME = timedelta(days=30)
+MAX_TOKEN_LIFETIME = timedelta(days=365)
+TOKEN_CACHE_TIMEOUT = 60 * 5  # 5 minutes
+LOCAL_CACHE_TIMEOUT = 30
+LOCAL_CACHE_SIZE = 1024
+# Only the fields of the user needed to authorize requests are cached,
+# not the password hash. The other fields are loaded on first access.
+# They are in the order of the fields of the model, as Model.from_db()
+# expects.
+TOKEN_USER_FIELDS = ['id', 'is_superuser', 'username', 'first_name',
+                     'last_name', 'email', 'is_staff', 'is_active']
+# Tokens made by issue_token(): anything else is rejected without
+# looking it up.
+TOKEN_RE = re.compile(r'[\w-]{43}')
+
+
+local_tokens = LocalCache(LOCAL_CACHE_SIZE, LOCAL_CACHE_TIMEOUT)
+
+
+def hash_token(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def token_cache_key(key_hash):
+    return f'api_token_{key_hash}'
+
+
+def issue_token(user, name='', lifetime=TOKEN_LIFETIME):
+    """
+    Create a token for the given user and return the APIToken and the
+    token itself, which cannot be found again once this returns.
+    """
+    key = secrets.token_urlsafe(32)
+    token = APIToken.objects.create(user=user,
+                                    key_hash=hash_token(key),
+                                    prefix=key[:8],
+                                    name=name[:100],
+                                    expires=timezone.now() + lifetime)
+    return token, key
+
+
+def forget_tokens(key_hashes):
+    """
+    Remove the given tokens from the caches, after they were revoked
+    or their user changed.
+    """
+    key_hashes = list(key_hashes)
+    cache.delete_many([token_cache_key(key_hash) for key_hash in key_hashes])
+    for key_hash in key_hashes:
+        local_tokens.delete(key_hash)
+
+
+def _load_token(key_hash):
+    # Return the cached entry of a token: the values of the
+    # TOKEN_USER_FIELDS of its user and its expiration time.
+    values = APIToken.objects.filter(key_hash=key_hash) \
+                             .values_list(*(f'user__{field}'
+                                            for field in TOKEN_USER_FIELDS),
+                                          'expires').first()
+    if values is None:
+        return None
+    *user_values, expires = values
+    return tuple(user_values), expires.timestamp()
+
+
+def get_token_user(key):
+    """
+    Return the active user of the given token, or None if the token
+    does not exist or expired.
+    """
+    if not TOKEN_RE.fullmatch(key):
+        return None
+    key_hash = hash_token(key)
+    entry = local_tokens.get(key_hash)
+    if entry is None:
+        entry = cache.get(token_cache_key(key_hash))
+        if entry is None:
+            entry = _load_token(key_hash)
+            if entry is None:
+                # Unknown tokens are only remembered by the process,
+                # whose cache has a bounded size.
+                entry = (None, 0)
+            else:
+                cache.set(token_cache_key(key_hash), entry,
+                          TOKEN_CACHE_TIMEOUT)
+        local_tokens.set(key_hash, entry)
+    user_values, expires = entry
+    if user_values is None or expires < time.time():
+        return None
+    # A user with the cached fields; the others, such as the
+    # password, are deferred.
+    user = User.from_db(User.objects.db, TOKEN_USER_FIELDS, user_values)
+    if not user.is_active:
+        return None
+    return user
+
+
+class TokenAuthentication(BaseAuthentication):
+    """
+    Authenticate the requests with "Authorization: Token <token>".
+    """
+    keyword = 'Token'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed('Invalid token header.')
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise AuthenticationFailed('Invalid token header.')
+        user = get_token_user(key)
+        if user is None:
+            raise AuthenticationFailed('Invalid or expired token.')
+        return user, None
+
+    def authenticate_header(self, request):
+        return self.keyword
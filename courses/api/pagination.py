@@ -0,0 +1,56 @@
+from collections import OrderedDict
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from courses.pagination import keyset_page
+
+
+class CourseCursorPagination(BasePagination):
+    """
+    Keyset pagination for courses on (-created, id) with opaque
+    cursors. The response contains the link to the next page and
+    the results of the current page.
+    """
+    page_size = 20
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        cursor = request.query_params.get(self.cursor_query_param)
+        try:
+            page, self.next_cursor = keyset_page(queryset,
+                                                 cursor,
+                                                 self.page_size)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url,
+                                   self.cursor_query_param,
+                                   self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'results': schema,
+            },
+        }
@@ -1,7 +1,17 @@
 from rest_framework.permissions import BasePermission
 
+from courses import enrollment
+
 class IsEnrolled(BasePermission):
     
     def has_object_permission(self, request, view, obj):
-        # Return students who are enrolled in the course.
-        return obj.students.filter(id=request.user.id).exists()
\ No newline at end of file
+        # Whether the user is a student of the course,
+        # from the cached enrollments of the user.
+        return enrollment.is_enrolled(request.user, obj.id)
+
+
+class IsOwner(BasePermission):
+
+    def has_object_permission(self, request, view, obj):
+        # Only the instructor who created the course.
+        return obj.owner_id == request.user.id
@@ -1,6 +1,9 @@
 from rest_framework import serializers
 
-from courses.models import Subject, Course, Module, Content
+from courses import contents
+from courses.api.authentication import MAX_TOKEN_LIFETIME
+from courses.api.sparse import SparseFieldsSerializerMixin
+from courses.models import APIToken, Subject, Course, Module, Content
 
 
 class ModuleSerializer(serializers.ModelSerializer):
@@ -10,15 +13,36 @@ class ModuleSerializer(serializers.ModelSerializer):
         fields = ['order', 'title', 'description']
 
 
-class SubjectSerializer(serializers.ModelSerializer):
+class CourseSummarySerializer(serializers.ModelSerializer):
+    
+    class Meta:
+        model = Course
+        fields = ['id', 'title', 'slug']
+
+
+class SubjectSerializer(SparseFieldsSerializerMixin,
+                        serializers.ModelSerializer):
+    # The courses of the subject are only listed
+    # with "?expand=courses".
+    expandable_fields = {
+        'courses': (CourseSummarySerializer, {'many': True}),
+    }
     
     class Meta:
         model = Subject
         fields = ['id', 'title', 'slug']
      
         
-class CourseSerializer(serializers.ModelSerializer):
+class CourseSerializer(SparseFieldsSerializerMixin,
+                       serializers.ModelSerializer):
     modules = ModuleSerializer(many=True, read_only = True)
+    # "?expand=subject" nests the subject instead of its id.
+    # The modules are left out when "?fields=" does not
+    # list them and they are not expanded.
+    expandable_fields = {
+        'subject': (SubjectSerializer, {}),
+        'modules': (ModuleSerializer, {'many': True}),
+    }
     
     class Meta:
         model = Course
@@ -33,6 +57,11 @@ class ItemRalatedField(serializers.RelatedField):
     # and returns the representation should be used
     # to serialize the target.
     def to_representation(self, value):
+        # The HTML rendered beforehand for all the items of the
+        # course (see courses.contents.render_items).
+        rendered = self.context.get('rendered_items')
+        if rendered is not None:
+            return rendered[contents.item_html_key(value)]
         return value.render()
     
     
@@ -62,4 +91,17 @@ class CourseWithContentsSerializer(
         model = Course
         fields = ['id', 'subject', 'title', 'slug',
                   'overview', 'created', 'owner',
-                  'modules']
\ No newline at end of file
+                  'modules']
+
+
+class APITokenSerializer(serializers.ModelSerializer):
+    # Number of days the token is valid, when issuing it.
+    lifetime = serializers.IntegerField(write_only=True,
+                                        required=False,
+                                        min_value=1,
+                                        max_value=MAX_TOKEN_LIFETIME.days)
+    
+    class Meta:
+        model = APIToken
+        fields = ['id', 'name', 'prefix', 'created', 'expires', 'lifetime']
+        read_only_fields = ['prefix', 'created', 'expires']
@@ -0,0 +1,165 @@
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+
+# Clients choose the fields of the objects with "?fields=" and nest the
+# related objects they need with "?expand=", both comma separated:
+#
+#     /api/courses/?fields=id,title
+#     /api/courses/?fields=id,title&expand=subject
+#
+# The query is built from the requested shape: only the columns of the
+# requested fields are loaded, and related objects are only joined or
+# prefetched when they are part of the response.
+
+
+def parse_names(value):
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+class SparseFieldsSerializerMixin:
+    """
+    Keep the fields named in the "fields" entry of the context, and
+    replace the fields named in its "expand" entry with the nested
+    serializers of expandable_fields, a dict mapping a field name to
+    a serializer class and its keyword arguments. Serializers nested
+    in this one are not affected.
+    """
+    expandable_fields = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self._context.get('fields')
+        expand = self._context.get('expand') or ()
+        for name in expand:
+            serializer_class, kwargs = self.expandable_fields[name]
+            fields[name] = serializer_class(read_only=True, **kwargs)
+        if requested:
+            fields = OrderedDict((name, field)
+                                 for name, field in fields.items()
+                                 if name in requested or name in expand)
+        return fields
+
+
+def _concrete_columns(serializer, model):
+    # The columns of the model read by the fields of the serializer.
+    columns = []
+    for field in serializer.fields.values():
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if model_field.concrete and not model_field.many_to_many:
+            columns.append(model_field.name)
+    return columns
+
+
+def shape_queryset(queryset, serializer, required=()):
+    """
+    Return the given queryset loading only the columns used by the
+    fields of the given serializer, joining the expanded foreign keys
+    and prefetching the nested lists. The queryset is returned as is if
+    a field cannot be mapped to the model, such as a method field.
+    """
+    model = queryset.model
+    columns = set(required)
+    selects = []
+    prefetches = []
+    for field in serializer.fields.values():
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return queryset
+        if model_field.one_to_many or model_field.many_to_many:
+            related = model_field.related_model
+            related_queryset = related._default_manager.all()
+            child = getattr(field, 'child', None)
+            if isinstance(child, serializers.BaseSerializer):
+                related_columns = _concrete_columns(child, related)
+                if model_field.one_to_many:
+                    # The foreign key matching the objects
+                    # to their parent.
+                    related_columns.append(model_field.field.name)
+                related_queryset = related_queryset.only(*related_columns)
+            prefetches.append(Prefetch(model_field.name,
+                                       queryset=related_queryset))
+        elif isinstance(field, serializers.BaseSerializer):
+            # Expanded foreign key.
+            selects.append(model_field.name)
+            columns.update(
+                f'{model_field.name}__{column}'
+                for column in _concrete_columns(field,
+                                                model_field.related_model))
+        else:
+            columns.add(model_field.name)
+    queryset = queryset.prefetch_related(None).prefetch_related(*prefetches)
+    if selects:
+        # Without arguments, select_related() follows every foreign key.
+        queryset = queryset.select_related(*selects)
+    return queryset.only(*columns)
+
+
+class SparseFieldsMixin:
+    """
+    Support "?fields=" and "?expand=" in the sparse_actions of a view
+    whose serializer uses SparseFieldsSerializerMixin. Unknown names
+    are rejected with a 400 response. sparse_required_fields are the
+    columns always loaded, for example the keys of the pagination.
+    """
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+    sparse_actions = ('list', 'retrieve')
+    sparse_required_fields = ()
+
+    def is_sparse_action(self):
+        return getattr(self, 'action', 'list') in self.sparse_actions
+
+    def get_sparse_fields(self):
+        """
+        Return the requested fields, or None for all of them, and
+        the fields to expand.
+        """
+        if not hasattr(self, '_sparse_fields'):
+            params = self.request.query_params
+            fields = parse_names(params.get(self.fields_query_param))
+            expand = parse_names(params.get(self.expand_query_param))
+            serializer_class = self.get_serializer_class()
+            expandable = serializer_class.expandable_fields
+            errors = {}
+            unknown = set(fields) - set(serializer_class().fields) \
+                                  - set(expandable)
+            if unknown:
+                errors[self.fields_query_param] = \
+                    f'Unknown fields: {", ".join(sorted(unknown))}'
+            unknown = set(expand) - set(expandable)
+            if unknown:
+                errors[self.expand_query_param] = \
+                    f'Cannot expand: {", ".join(sorted(unknown))}'
+            if errors:
+                raise ValidationError(errors)
+            self._sparse_fields = set(fields) or None, set(expand)
+        return self._sparse_fields
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.is_sparse_action():
+            context['fields'], context['expand'] = self.get_sparse_fields()
+        return context
+
+    def shape_queryset(self, queryset):
+        fields, expand = self.get_sparse_fields()
+        if fields is None and not expand:
+            return queryset
+        return shape_queryset(queryset,
+                              self.get_serializer(),
+                              self.sparse_required_fields)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.is_sparse_action():
+            queryset = self.shape_queryset(queryset)
+        return queryset
@@ -0,0 +1,136 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.db import connections
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+
+
+# Large lists are serialized and written by chunks of objects, so that
+# neither the rows nor the serialized objects are held in memory all at
+# once, and the first bytes are sent before the last rows are read.
+STREAM_CHUNK_SIZE = 500
+# Replaced with the items in the rendered envelope of a paginated list.
+RESULTS_MARKER = '__streamed_results__'
+
+
+class StreamingJSONRenderer(JSONRenderer):
+    """
+    JSON renderer writing a list from chunks of serialized objects.
+    The output is the same as the one of JSONRenderer for the whole list.
+    """
+
+    def render_list(self, chunks, accepted_media_type=None,
+                    renderer_context=None):
+        """
+        Yield the JSON of a list, as bytes, from an iterable of lists
+        of serialized objects.
+        """
+        yield b'['
+        first = True
+        for chunk in chunks:
+            if not chunk:
+                continue
+            # Render the chunk as a list and drop the brackets.
+            data = self.render(chunk, accepted_media_type, renderer_context)
+            if not first:
+                yield b','
+            yield data[1:-1]
+            first = False
+        yield b']'
+
+    def render_envelope(self, data, chunks, accepted_media_type=None,
+                        renderer_context=None):
+        """
+        Yield the JSON of the given data, a paginated response, with
+        the list made of the given chunks in place of RESULTS_MARKER.
+        """
+        rendered = self.render(data, accepted_media_type, renderer_context)
+        head, tail = rendered.split(self.render(RESULTS_MARKER), 1)
+        yield head
+        yield from self.render_list(chunks, accepted_media_type,
+                                    renderer_context)
+        yield tail
+
+
+def _in_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def iter_sync(iterable):
+    """
+    Yield the items of the given iterable, which may query the database.
+
+    Under ASGI, Django 4.1 iterates the content of streaming responses
+    in the event loop, where the database cannot be used. The iterable
+    is then advanced in a thread of its own, which keeps the same
+    database connection for the whole response and closes it at the end.
+    Under WSGI the items are simply yielded.
+    """
+    if not _in_event_loop():
+        yield from iterable
+        return
+    executor = ThreadPoolExecutor(max_workers=1,
+                                  thread_name_prefix='stream')
+    iterator = iter(iterable)
+    try:
+        while True:
+            item = executor.submit(next, iterator, None).result()
+            if item is None:
+                break
+            yield item
+    finally:
+        executor.submit(connections.close_all).result()
+        executor.shutdown()
+
+
+def iter_chunks(objects, size):
+    """
+    Yield lists of at most size objects from the given iterable.
+    """
+    iterator = iter(objects)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class StreamingListMixin:
+    """
+    Stream the JSON of the list action: the objects are read from the
+    database, serialized and written by chunks of stream_chunk_size
+    objects, with the same output as the list action of DRF. Paginated
+    lists keep the envelope of the paginator. Other formats, such as
+    the browsable API, are rendered as usual.
+    """
+    stream_chunk_size = STREAM_CHUNK_SIZE
+
+    def list(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if not isinstance(renderer, StreamingJSONRenderer):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            objects = page
+        else:
+            # Prefetched relations are fetched for every chunk.
+            objects = queryset.iterator(chunk_size=self.stream_chunk_size)
+        chunks = (self.get_serializer(chunk, many=True).data
+                  for chunk in iter_chunks(objects, self.stream_chunk_size))
+        media_type = request.accepted_media_type
+        context = self.get_renderer_context()
+        if page is not None:
+            envelope = self.get_paginated_response(RESULTS_MARKER).data
+            content = renderer.render_envelope(envelope, chunks,
+                                               media_type, context)
+        else:
+            content = renderer.render_list(chunks, media_type, context)
+        return StreamingHttpResponse(iter_sync(content),
+                                     content_type=renderer.media_type)
@@ -0,0 +1,75 @@
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from courses import ratelimit
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Limit the requests of each client with a token bucket shared by
+    every process. The rate of the bucket is the entry of scope in the
+    DEFAULT_THROTTLE_RATES setting, such as "100/min": a client can
+    send 100 requests at once, then one every 0.6 seconds.
+    """
+    scope = None
+
+    def __init__(self):
+        self.bucket = ratelimit.TokenBucket.from_rate(
+            self.scope, api_settings.DEFAULT_THROTTLE_RATES[self.scope])
+        self.wait_time = None
+
+    def get_ident(self, request):
+        """
+        Return the client the request is counted against, or None to
+        not limit the request.
+        """
+        raise NotImplementedError('.get_ident() must be overridden')
+
+    def allow_request(self, request, view):
+        ident = self.get_ident(request)
+        if ident is None:
+            return True
+        allowed, self.wait_time = self.bucket.consume(ident)
+        return allowed
+
+    def wait(self):
+        return self.wait_time
+
+
+class UserThrottle(TokenBucketThrottle):
+    """
+    Limit the requests of each authenticated user.
+    """
+    scope = 'user'
+
+    def get_ident(self, request):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
+
+
+class AnonThrottle(TokenBucketThrottle):
+    """
+    Limit the anonymous requests of each IP address.
+    """
+    scope = 'anon'
+
+    def get_ident(self, request):
+        if request.user and request.user.is_authenticated:
+            return None
+        return BaseThrottle.get_ident(self, request)
+
+
+class LoadSheddingThrottle(BaseThrottle):
+    """
+    Refuse requests while the process is overloaded, so that the
+    requests it admits are answered in time.
+    """
+    # Seconds after which clients may try again.
+    retry_after = 1
+
+    def allow_request(self, request, view):
+        return not ratelimit.load.overloaded()
+
+    def wait(self):
+        return self.retry_after
@@ -13,9 +13,27 @@ urlpatterns = [
      path('subjects/', 
           views.SubjectListView.as_view(), name='subjects_list'),
     
+     path('autocomplete/',
+          views.AutocompleteView.as_view(), name='autocomplete'),
+    
+     path('autocomplete/stats/',
+          views.AutocompleteStatsView.as_view(), name='autocomplete_stats'),
+    
      path('subjects/<pk>/', 
           views.SubjectDetailView.as_view(), name='subjects_detail'),
     
+     path('search/',
+          views.CourseSearchView.as_view(), name='course_search'),
+    
+     path('tokens/',
+          views.APITokenListView.as_view(), name='token_list'),
+    
+     path('tokens/<int:pk>/',
+          views.APITokenDetailView.as_view(), name='token_detail'),
+    
+     path('courses/import/',
+          views.CourseImportView.as_view(), name='course_import'),
+    
      # path('courses/<pk>/enroll/',
      #      views.CourseEnrollView.as_view(), name='course_enroll'),
      
@@ -1,33 +1,115 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import StreamingHttpResponse
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date
 from django.shortcuts import get_object_or_404
 
 from rest_framework import generics, viewsets
 from rest_framework.decorators import action
-from rest_framework.authentication import BasicAuthentication
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.authentication import (BasicAuthentication,
+                                           SessionAuthentication)
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import (AllowAny, DjangoModelPermissions,
+                                        IsAdminUser, IsAuthenticated)
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from courses.api.permissions import IsEnrolled
-from courses.api.serializers import (CourseSerializer,
+from courses.api import authentication
+from courses.api.authentication import TokenAuthentication
+from courses.api.pagination import CourseCursorPagination
+from courses.api.permissions import IsEnrolled, IsOwner
+from courses.api.sparse import SparseFieldsMixin
+from courses.api.streaming import StreamingJSONRenderer, StreamingListMixin
+from courses.api.serializers import (APITokenSerializer, CourseSerializer,
                                      CourseWithContentsSerializer, 
                                      SubjectSerializer)
-from courses.models import Subject, Course
+from courses import (catalog, cloning, contents, enrollment, packages, search,
+                     typeahead)
+from courses.models import APIToken, Content, Course, Module, Subject
+
+# Authentication of the views that need a user: an issued token (see
+# courses/api/authentication.py), or the username and password, which
+# are much slower to check.
+API_AUTHENTICATION = [TokenAuthentication, BasicAuthentication]
 
-class SubjectListView(generics.ListAPIView):
+class SubjectListView(StreamingListMixin,
+                      SparseFieldsMixin,
+                      generics.ListAPIView):
+    # The JSON of the list is streamed (see courses/api/streaming.py).
+    # "?fields=" and "?expand=" choose the fields (see
+    # courses/api/sparse.py).
     queryset = Subject.objects.all()
     serializer_class = SubjectSerializer
+    renderer_classes = [StreamingJSONRenderer, BrowsableAPIRenderer]
     
     
-class SubjectDetailView(generics.RetrieveAPIView):
+class AutocompleteView(APIView):
+    """
+    Suggest course and subject titles with a word starting with the
+    "q" query parameter. Served from the in-process prefix index
+    without querying the database.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, format=None):
+        try:
+            limit = int(request.query_params.get('limit',
+                                                 typeahead.SUGGESTION_LIMIT))
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+        limit = max(1, min(limit, typeahead.MAX_SUGGESTION_LIMIT))
+        return Response(typeahead.index.suggest(
+                            request.query_params.get('q', ''), limit))
+
+
+class AutocompleteStatsView(APIView):
+    """
+    Return the size and memory footprint of the prefix index
+    of the current process.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, format=None):
+        return Response(typeahead.index.stats())
+
+
+class SubjectDetailView(SparseFieldsMixin, generics.RetrieveAPIView):
     queryset = Subject.objects.all()
     serializer_class = SubjectSerializer
     
     
+class CourseSearchView(generics.ListAPIView):
+    """
+    Return the courses matching the "q" query parameter ranked by
+    relevance. The number of results is set with "limit".
+    """
+    queryset = Course.objects.prefetch_related('modules')
+    serializer_class = CourseSerializer
+
+    def list(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '')
+        try:
+            limit = int(request.query_params.get('limit',
+                                                 search.SEARCH_LIMIT))
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+        courses = search.search_courses(query, limit, self.get_queryset())
+        serializer = self.get_serializer(courses, many=True)
+        return Response(serializer.data)
+
+
 class CourseEnrollView(APIView):
     # The users will be identified by the credential
     # set in the Authorization header of the HTTP
     # request.
-    authentication_classes = [BasicAuthentication]
+    authentication_classes = API_AUTHENTICATION
     # Unauthenticated users will not have access 
     # to this view.
     permission_classes = [IsAuthenticated]
@@ -43,15 +125,149 @@ class CourseEnrollView(APIView):
         return Response({'enrolled': True})
     
     
-class CourseViewSet(viewsets.ReadOnlyModelViewSet):
+class APITokenListView(generics.ListCreateAPIView):
+    """
+    List the API tokens of the current user, or issue a new one. The
+    token is only returned in the response of its creation, with an
+    optional "name" and a "lifetime" in days (30 by default).
+
+    Tokens are only issued to users authenticated with their password
+    or their session, so that a stolen token cannot be renewed.
+    """
+    authentication_classes = [TokenAuthentication,
+                              BasicAuthentication,
+                              SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+    serializer_class = APITokenSerializer
+
+    def get_authenticators(self):
+        authenticators = super().get_authenticators()
+        if self.request.method == 'POST':
+            return [authenticator for authenticator in authenticators
+                    if not isinstance(authenticator, TokenAuthentication)]
+        return authenticators
+
+    def get_queryset(self):
+        return APIToken.objects.filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lifetime = serializer.validated_data.get('lifetime')
+        token, key = authentication.issue_token(
+                        request.user,
+                        serializer.validated_data.get('name', ''),
+                        timedelta(days=lifetime) if lifetime
+                        else authentication.TOKEN_LIFETIME)
+        data = self.get_serializer(token).data
+        data['token'] = key
+        return Response(data, status=201)
+
+
+class APITokenDetailView(generics.RetrieveDestroyAPIView):
+    """
+    Show or revoke an API token of the current user.
+    """
+    authentication_classes = [TokenAuthentication,
+                              BasicAuthentication,
+                              SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+    serializer_class = APITokenSerializer
+
+    def get_queryset(self):
+        return APIToken.objects.filter(user=self.request.user)
+
+
+class CourseImportView(APIView):
+    """
+    Create a course from a package archive uploaded in the "package"
+    field, as made by the export action or "manage.py export_course".
+    The new course belongs to the current user. An optional "slug"
+    field replaces the slug stored in the package.
+    """
+    authentication_classes = API_AUTHENTICATION
+    # Requires the permission to add courses.
+    permission_classes = [DjangoModelPermissions]
+    parser_classes = [MultiPartParser]
     queryset = Course.objects.all()
+
+    def post(self, request, format=None):
+        package = request.FILES.get('package')
+        if package is None:
+            raise ValidationError({'package': 'No file was submitted.'})
+        # Large uploads are written to a temporary file by Django,
+        # which is read back in a single pass.
+        try:
+            course = packages.import_package(package,
+                                             request.user,
+                                             request.data.get('slug'))
+        except packages.PackageError as e:
+            raise ValidationError({'package': str(e)})
+        return Response(CourseSerializer(course).data, status=201)
+
+
+class CourseViewSet(StreamingListMixin,
+                    SparseFieldsMixin,
+                    viewsets.ReadOnlyModelViewSet):
+    # The modules of every course in the page are fetched
+    # with a single extra query. The JSON of the list is
+    # streamed (see courses/api/streaming.py). "?fields="
+    # and "?expand=" choose the fields of the courses
+    # and the query is built for them (see
+    # courses/api/sparse.py).
+    queryset = Course.objects.prefetch_related('modules')
     serializer_class = CourseSerializer
+    pagination_class = CourseCursorPagination
+    # Keys of the cursor pagination.
+    sparse_required_fields = ['created']
+    renderer_classes = [StreamingJSONRenderer, BrowsableAPIRenderer]
+    
+    def get_queryset(self):
+        # The modules are only loaded when the response
+        # is not a 304 nor in the cache.
+        if self.action == 'contents':
+            return Course.objects.all()
+        if self.action == 'retrieve':
+            return self.shape_queryset(Course.objects.all())
+        return super().get_queryset()
+
+    def get_course_validators(self, course):
+        variant = [self.action, self.request.accepted_renderer.format]
+        if self.is_sparse_action():
+            fields, expand = self.get_sparse_fields()
+            variant += ['.'.join(sorted(fields or ())),
+                        '.'.join(sorted(expand))]
+        return catalog.get_course_validators(course.id, *variant)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response,
+                                             *args, **kwargs)
+        validators = getattr(self, 'course_validators', None)
+        if validators is not None:
+            version, etag, last_modified = validators
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ['Accept', 'Authorization'])
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        course = self.get_object()
+        self.course_validators = self.get_course_validators(course)
+        version, etag, last_modified = self.course_validators
+        # 304 Not Modified before serializing anything.
+        response = get_conditional_response(request,
+                                            etag=etag,
+                                            last_modified=last_modified)
+        if response is not None:
+            return response
+        return Response(self.get_serializer(course).data)
     
     # detail=True to specify that this is an action
     # to be performed on a single object.
     @action(detail=True,
             methods=['post'],
-            authentication_classes=[BasicAuthentication],
+            authentication_classes=API_AUTHENTICATION,
             permission_classes=[IsAuthenticated])
     def enroll(self, request, *args, **kwargs):
         # Use self.get_object() to get the current Course
@@ -61,6 +277,35 @@ class CourseViewSet(viewsets.ReadOnlyModelViewSet):
         course = self.get_object()
         course.students.add(request.user)
         return Response({'enrolled': True})
+
+    # Enroll the current user in several courses with one
+    # request and one insert: {"courses": [1, 2, 3]}. The
+    # response has the result for each course, in the order
+    # of the request.
+    @action(detail=False,
+            methods=['post'],
+            url_path='enroll',
+            authentication_classes=API_AUTHENTICATION,
+            permission_classes=[IsAuthenticated])
+    def enroll_batch(self, request, *args, **kwargs):
+        course_ids = request.data.get('courses')
+        if not isinstance(course_ids, list) or not course_ids or \
+                not all(isinstance(course_id, int) and
+                        not isinstance(course_id, bool)
+                        for course_id in course_ids):
+            raise ValidationError({'courses': 'A non-empty list of course '
+                                              'ids is required.'})
+        if len(course_ids) > enrollment.MAX_BATCH_ENROLL:
+            raise ValidationError({'courses': f'At most '
+                                              f'{enrollment.MAX_BATCH_ENROLL} '
+                                              f'courses can be enrolled in '
+                                              f'at once.'})
+        results = enrollment.enroll(request.user, course_ids)
+        return Response({'results': [
+            {'course': course_id,
+             'enrolled': result != enrollment.NOT_FOUND,
+             'status': result}
+            for course_id, result in results.items()]})
        
     # Only students who are enrolled in the course
     # can have access to the course's contents
@@ -68,7 +313,76 @@ class CourseViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=True,
             methods=['get'],
             serializer_class=CourseWithContentsSerializer,
-            authentication_classes=[BasicAuthentication],
+            authentication_classes=API_AUTHENTICATION,
             permission_classes=[IsAuthenticated, IsEnrolled])
     def contents(self, request, *args, **kwargs):
-        return self.retrieve(request, *args, **kwargs)
\ No newline at end of file
+        course = self.get_object()
+        # The version is read first: if the course changes while
+        # the data is built, it is cached under the old version.
+        self.course_validators = self.get_course_validators(course)
+        version, etag, last_modified = self.course_validators
+        response = get_conditional_response(request,
+                                            etag=etag,
+                                            last_modified=last_modified)
+        if response is not None:
+            return response
+        key = f'course_{course.id}_contents_v{version}'
+        data = cache.get(key)
+        if data is None:
+            data = self.get_contents_data(course)
+            cache.set(key, data, catalog.CATALOG_CACHE_TIMEOUT)
+        return Response(data)
+
+    def get_contents_data(self, course):
+        # Load the modules, their contents and the items with one
+        # query per content type, and render the items that are
+        # not in the cache.
+        prefetch_related_objects(
+            [course],
+            Prefetch('modules',
+                     queryset=Module.objects.prefetch_related(
+                        Prefetch('contents',
+                                 queryset=Content.objects.with_items()))))
+        items = [content.item for module in course.modules.all()
+                 for content in module.contents.all()]
+        context = self.get_serializer_context()
+        context['rendered_items'] = contents.render_items(items)
+        return CourseWithContentsSerializer(course, context=context).data
+
+    # Copy a course of the current user with its modules and contents,
+    # which requires the permission to add courses. The title and slug
+    # of the copy can be given in the request.
+    @action(detail=True,
+            methods=['post'],
+            authentication_classes=API_AUTHENTICATION,
+            permission_classes=[DjangoModelPermissions, IsOwner])
+    def clone(self, request, *args, **kwargs):
+        course = self.get_object()
+        slug = request.data.get('slug')
+        if slug and Course.objects.filter(slug=slug).exists():
+            raise ValidationError({'slug': 'A course with this slug '
+                                           'already exists.'})
+        try:
+            clone = cloning.clone_course(course,
+                                         request.user,
+                                         title=request.data.get('title'),
+                                         slug=slug)
+        except IntegrityError:
+            # The slug was taken by a concurrent request.
+            raise ValidationError({'slug': 'A course with this slug '
+                                           'already exists.'})
+        return Response(CourseSerializer(clone).data, status=201)
+
+    # Only the owner of the course can export it. The package
+    # is streamed, the media files are never loaded in memory.
+    @action(detail=True,
+            methods=['get'],
+            authentication_classes=API_AUTHENTICATION,
+            permission_classes=[IsAuthenticated, IsOwner])
+    def export(self, request, *args, **kwargs):
+        course = self.get_object()
+        response = StreamingHttpResponse(packages.export_package(course),
+                                         content_type='application/x-tar')
+        response['Content-Disposition'] = \
+            f'attachment; filename="{course.slug}.tar"'
+        return response
@@ -0,0 +1,159 @@
+import os
+import time
+from collections import Counter
+
+from django.core.files import File as DjangoFile
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import Blob, File, Image
+from .storage import BLOB_DIR, blob_storage, get_hash
+
+
+# Reference counts of the blobs of the content addressed storage. They
+# are updated by the signals of File and Image when a file is set or an
+# item deleted, and by the bulk operations (cloning, import, bulk
+# deletion) which send no signals. The collection recounts them from the
+# items before removing anything, so a count that drifted can only delay
+# the removal of a blob, never remove a blob in use.
+MEDIA_FIELDS = [(File, 'pdf_file'), (Image, 'image_file')]
+# Blobs saved recently are never collected, as the item using them may
+# not be committed yet, for example during an upload.
+COLLECT_GRACE = 60 * 60 * 24  # 1 day
+
+
+def get_field_name(model):
+    return dict(MEDIA_FIELDS)[model]
+
+
+def add_references(names, delta=1):
+    """
+    Add delta references to the blobs of the given file names.
+    Names without a blob are ignored.
+    """
+    counts = Counter(filter(None, map(get_hash, names)))
+    for digest, count in counts.items():
+        with transaction.atomic():
+            updated = Blob.objects.filter(hash=digest).update(
+                references=Greatest(F('references') + count * delta, 0))
+            if not updated and delta > 0:
+                Blob.objects.get_or_create(hash=digest,
+                                           defaults={'references': count})
+
+
+def remove_references(names):
+    add_references(names, -1)
+
+
+def count_references():
+    """
+    Return the number of items using each blob, counted from the items.
+    """
+    counts = Counter()
+    for model, field in MEDIA_FIELDS:
+        names = model.objects.values_list(field, flat=True)
+        counts.update(filter(None, map(get_hash, names.iterator())))
+    return counts
+
+
+def recount():
+    """
+    Set the reference counts of all the blobs from the items and
+    return the counts.
+    """
+    counts = count_references()
+    blobs = {blob.hash: blob for blob in Blob.objects.all()}
+    changed = []
+    for digest, blob in blobs.items():
+        if blob.references != counts.get(digest, 0):
+            blob.references = counts.get(digest, 0)
+            changed.append(blob)
+    Blob.objects.bulk_update(changed, ['references'], batch_size=500)
+    Blob.objects.bulk_create([Blob(hash=digest, references=count)
+                              for digest, count in counts.items()
+                              if digest not in blobs],
+                             batch_size=500,
+                             ignore_conflicts=True)
+    return counts
+
+
+def iter_blob_files():
+    """
+    Yield the hash, path and stat of every blob file in the storage.
+    """
+    root = os.path.join(blob_storage.location, BLOB_DIR)
+    if not os.path.isdir(root):
+        return
+    for prefix in os.listdir(root):
+        directory = os.path.join(root, prefix)
+        if not os.path.isdir(directory):
+            continue
+        for digest in os.listdir(directory):
+            if get_hash(f'{digest}/file') == digest:
+                path = os.path.join(directory, digest)
+                yield digest, path, os.stat(path)
+
+
+def collect(grace=COLLECT_GRACE, dry_run=False):
+    """
+    Remove the blobs that no item uses and that were not saved during
+    the grace period in seconds. Return the number of removed blobs and
+    the number of freed bytes.
+    """
+    counts = recount()
+    deadline = time.time() - grace
+    removed = freed = 0
+    for digest, path, stat in iter_blob_files():
+        if counts.get(digest) or stat.st_mtime > deadline:
+            continue
+        if not dry_run:
+            with transaction.atomic():
+                # An item may have started using the blob since the
+                # recount: its signal made the count positive again.
+                blob = Blob.objects.select_for_update() \
+                                   .filter(hash=digest).first()
+                if blob is not None and blob.references:
+                    continue
+                os.remove(path)
+                Blob.objects.filter(hash=digest).delete()
+        removed += 1
+        freed += stat.st_size
+    # Temporary files of saves that were interrupted.
+    root = os.path.join(blob_storage.location, BLOB_DIR)
+    if not dry_run and os.path.isdir(root):
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if name.endswith('.tmp') and os.stat(path).st_mtime < deadline:
+                os.remove(path)
+    return removed, freed
+
+
+def store_legacy_file(item):
+    """
+    Move the file of the given File or Image item, stored before the
+    blobs, to its blob and return the new name, or None if the file
+    is already a blob. The old file is removed once no item uses it.
+    """
+    model = type(item)
+    field = get_field_name(model)
+    field_file = getattr(item, field)
+    old_name = field_file.name
+    if not old_name or get_hash(old_name):
+        return None
+    storage = field_file.storage
+    with storage.open(old_name, 'rb') as f:
+        new_name = storage.save(old_name,
+                                DjangoFile(f, os.path.basename(old_name)),
+                                max_length=model._meta.get_field(field).max_length)
+    with transaction.atomic():
+        # Queryset updates send no signals.
+        model.objects.filter(pk=item.pk, **{field: old_name}) \
+                     .update(**{field: new_name})
+        add_references([new_name])
+    setattr(item, field, new_name)
+    # Cloned items may still use the old file.
+    if not any(m.objects.filter(**{f: old_name}).exists()
+               for m, f in MEDIA_FIELDS):
+        storage.delete(old_name)
+    return new_name
@@ -0,0 +1,177 @@
+import time
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Content, Course, Subject
+from .pagination import decode_cursor, keyset_page
+
+
+# Cached catalog rows are stored under keys that embed a version stamp.
+# Changing a course, module or subject bumps the stamp, so readers simply
+# stop asking for the old key instead of us having to find and delete it.
+# Old entries are left for Redis to evict.
+CATALOG_VERSION_KEY = 'catalog_version'
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24  # 24 hours
+FILTERED_CACHE_TIMEOUT = 60 * 15  # 15 minutes
+COURSES_PAGE_SIZE = 20
+# Fields of the courses in the cached pages of the catalog.
+COURSE_LIST_FIELDS = ['id', 'title', 'slug', 'created',
+                      'subject__title', 'subject__slug',
+                      'owner__username', 'owner__first_name',
+                      'owner__last_name']
+
+
+def subject_version_key(subject_id):
+    return f'catalog_subject_{subject_id}_version'
+
+
+def get_version(key):
+    """
+    Return the current version stamp stored under the given key.
+    A missing stamp is initialized with the current time in nanoseconds
+    instead of 1, so a stamp evicted by Redis never comes back with a value
+    that still matches stale entries.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    """
+    Increment the version stamp stored under the given key.
+    """
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # The stamp does not exist yet (or was evicted).
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def touch_version(key):
+    """
+    Set the version stamp stored under the given key to the current time
+    in nanoseconds, or to the next value if the clock did not move
+    forward. The stamp always increases and tells when the last change
+    happened, so it can be used for Last-Modified headers.
+    """
+    version = max(time.time_ns(), (cache.get(key) or 0) + 1)
+    cache.set(key, version, timeout=None)
+    return version
+
+
+def invalidate_subjects(*subject_ids):
+    """
+    Invalidate the cached course lists of the given subjects and the
+    global catalog (all courses and the subject list with course counts).
+    """
+    for subject_id in set(subject_ids):
+        if subject_id is not None:
+            bump_version(subject_version_key(subject_id))
+    bump_version(CATALOG_VERSION_KEY)
+
+
+def course_version_key(course_id):
+    return f'course_{course_id}_version'
+
+
+def get_course_version(course_id):
+    """
+    Return the version stamp of the modules and contents of the given
+    course, bumped whenever the course, a module, a content or an item
+    of the course changes.
+    """
+    return get_version(course_version_key(course_id))
+
+
+def invalidate_courses(*course_ids):
+    for course_id in set(course_ids):
+        if course_id is not None:
+            touch_version(course_version_key(course_id))
+
+
+def get_course_validators(course_id, *variant):
+    """
+    Return the version of the given course, the strong ETag and the
+    Last-Modified timestamp of a representation of it. The variant
+    parts tell the representations of the course apart, for example
+    the view and the format.
+    """
+    version = get_course_version(course_id)
+    tag = '-'.join(str(part) for part in (course_id, version, *variant))
+    return version, f'"{tag}"', version // 10 ** 9
+
+
+def invalidate_item_courses(model, item_ids):
+    """
+    Invalidate the courses having a content for one of the given items.
+    """
+    invalidate_courses(*Content.objects.filter(
+        content_type=ContentType.objects.get_for_model(model),
+        object_id__in=item_ids).values_list('module__course_id', flat=True))
+
+
+def get_subjects():
+    """
+    Return a list of all subjects annotated with the number of
+    courses in each of them.
+    """
+    key = f'all_subjects_v{get_version(CATALOG_VERSION_KEY)}'
+    subjects = cache.get(key)
+    if subjects is None:
+        # list() evaluates the QuerySet, so the rows are what gets
+        # cached rather than the lazy query.
+        subjects = list(Subject.objects.annotate(
+                            total_courses=Count('courses')))
+        cache.set(key, subjects, CATALOG_CACHE_TIMEOUT)
+    return subjects
+
+
+def get_courses(subject=None, cursor=None, page_size=COURSES_PAGE_SIZE,
+                filters=None):
+    """
+    Return a page of courses annotated with the number of modules,
+    optionally restricted to the given subject or to the given facet
+    filters (see courses.facets), and the cursor of the next page. The
+    subject and the owner are fetched in the same query because the list
+    template displays both, with the fields of COURSE_LIST_FIELDS only.
+    Raises ValueError if the cursor is malformed.
+    """
+    timeout = CATALOG_CACHE_TIMEOUT
+    if filters is not None and filters.is_active:
+        # Facet filters depend on the current date, so pages
+        # are cached for a shorter time.
+        subject = filters.subject
+        version = get_version(CATALOG_VERSION_KEY)
+        key = f'filtered_courses_v{version}_{filters.key()}'
+        timeout = FILTERED_CACHE_TIMEOUT
+    elif subject:
+        version = get_version(subject_version_key(subject.id))
+        key = f'subject_{subject.id}_courses_v{version}'
+    else:
+        key = f'all_courses_v{get_version(CATALOG_VERSION_KEY)}'
+    if cursor:
+        # Only valid cursors make new cache entries.
+        created, pk = decode_cursor(cursor)
+        key = f'{key}_{created.timestamp()}_{pk}_{page_size}'
+    else:
+        key = f'{key}_first_{page_size}'
+    page = cache.get(key)
+    if page is None:
+        # Only the fields displayed by the list are loaded and cached,
+        # not the whole rows of the owners.
+        qs = Course.objects.annotate(total_modules=Count('modules')) \
+                           .select_related('subject', 'owner') \
+                           .only(*COURSE_LIST_FIELDS)
+        if filters is not None and filters.is_active:
+            qs = filters.apply(qs, timezone.now())
+        elif subject:
+            qs = qs.filter(subject=subject)
+        page = keyset_page(qs, cursor, page_size)
+        cache.set(key, page, timeout)
+    return page
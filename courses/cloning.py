@@ -0,0 +1,114 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, transaction
+from django.utils.text import slugify
+
+from . import blobs, catalog
+from .models import Content, Course, File, Image, Module, Text, Video
+
+
+ITEM_MODELS = [Text, Video, File, Image]
+BATCH_SIZE = 500
+# Number of slugs tried when concurrent copies of a course take the
+# slug chosen for the copy.
+SLUG_ATTEMPTS = 5
+
+
+def get_clone_slug(course):
+    """
+    Return the first free slug among "<slug>-copy", "<slug>-copy-2", ...
+    """
+    base = slugify(f'{course.slug}-copy')[:190]
+    taken = set(Course.objects.filter(slug__startswith=base)
+                              .values_list('slug', flat=True))
+    slug, number = base, 2
+    while slug in taken:
+        slug = f'{base}-{number}'
+        number += 1
+    return slug
+
+
+def _create_clone(course, owner, title, slug):
+    # Each attempt runs in a savepoint, so the slug taken by a
+    # concurrent copy can be replaced by the next free one.
+    for attempt in range(SLUG_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return Course.objects.create(
+                    owner=owner,
+                    subject_id=course.subject_id,
+                    title=title or f'{course.title} (copy)',
+                    slug=slug or get_clone_slug(course),
+                    overview=course.overview)
+        except IntegrityError:
+            if slug or attempt == SLUG_ATTEMPTS - 1:
+                raise
+
+
+def clone_course(course, owner, title=None, slug=None):
+    """
+    Copy the given course with its modules, contents and items for the
+    given user and return the new course.
+
+    The copy takes a fixed number of queries whatever the size of the
+    course: the rows of each model are read with one query and written
+    with bulk_create(), in the order of their dependencies, and the
+    object ids of the new contents are remapped to the new items. The
+    files of File and Image items are shared with the original items
+    instead of being copied.
+
+    Raise IntegrityError if the given slug is taken, or if no free slug
+    was found for the copy.
+    """
+    with transaction.atomic():
+        modules = list(course.modules.all())
+        contents = Content.objects.filter(module__course=course)
+
+        # The post_save signals of the course update the search
+        # index, the typeahead and the catalog.
+        clone = _create_clone(course, owner, title, slug)
+
+        new_modules = {module.id: Module(course=clone,
+                                         title=module.title,
+                                         description=module.description,
+                                         order=module.order)
+                       for module in modules}
+        Module.objects.bulk_create(new_modules.values(), batch_size=BATCH_SIZE)
+
+        # Map (content type id, old item id) to the id of the copy.
+        item_ids = {}
+        content_types = ContentType.objects.get_for_models(*ITEM_MODELS)
+        media_fields = dict(blobs.MEDIA_FIELDS)
+        for model in ITEM_MODELS:
+            content_type_id = content_types[model].id
+            items = list(model.objects.filter(
+                            id__in=contents.filter(content_type_id=content_type_id)
+                                           .values('object_id')))
+            old_ids = [item.id for item in items]
+            for item in items:
+                # Without a primary key the items are inserted as new
+                # rows. The file fields keep the name of the original
+                # file, so the media is shared and not copied.
+                item.pk = None
+                item.owner = owner
+            model.objects.bulk_create(items, batch_size=BATCH_SIZE)
+            for old_id, item in zip(old_ids, items):
+                item_ids[(content_type_id, old_id)] = item.id
+            if model in media_fields:
+                # The copies use the blobs of the original files.
+                blobs.add_references(getattr(item, media_fields[model]).name
+                                     for item in items)
+
+        new_contents = [
+            Content(module=new_modules[content.module_id],
+                    content_type_id=content.content_type_id,
+                    object_id=item_ids[(content.content_type_id,
+                                        content.object_id)],
+                    order=content.order)
+            for content in contents.order_by('module_id', 'order')
+            if (content.content_type_id, content.object_id) in item_ids]
+        Content.objects.bulk_create(new_contents, batch_size=BATCH_SIZE)
+
+        # bulk_create() sends no signals: refresh the number
+        # of modules shown in the catalog.
+        catalog.invalidate_subjects(clone.subject_id)
+    return clone
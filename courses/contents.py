@@ -0,0 +1,84 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
+
+from . import blobs, catalog, media, search
+from .models import Content, Text
+
+
+# The HTML of the items is cached under a key including the date of
+# their last change, so a changed item is simply rendered again.
+ITEM_HTML_TIMEOUT = 60 * 60 * 24  # 24 hours
+
+
+def delete_contents(contents):
+    """
+    Delete the given QuerySet of contents along with their items and
+    return the number of deleted contents.
+
+    The items are deleted with one "IN" query per content type and the
+    contents with a single statement, instead of two deletes for every
+    content. Everything happens in one transaction.
+
+    The rows are deleted with QuerySet._raw_delete(). Content and the
+    item models have delete receivers (see courses/signals.py), so
+    QuerySet.delete() would fetch every row and send the signals one
+    at a time, and there is no public API to delete rows without them.
+    The work of those receivers, releasing the blobs, reindexing the
+    courses whose text changed and invalidating the courses, is done
+    here once for all the rows.
+    """
+    with transaction.atomic():
+        rows = list(contents.values_list('id',
+                                         'content_type_id',
+                                         'object_id',
+                                         'module__course_id'))
+        if not rows:
+            return 0
+        items = {}
+        text_type_id = ContentType.objects.get_for_model(Text).id
+        text_course_ids = set()
+        for content_id, content_type_id, object_id, course_id in rows:
+            items.setdefault(content_type_id, []).append(object_id)
+            if content_type_id == text_type_id:
+                text_course_ids.add(course_id)
+
+        file_names = []
+        media_fields = dict(blobs.MEDIA_FIELDS)
+        for content_type_id, object_ids in items.items():
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            queryset = model._default_manager.filter(id__in=object_ids)
+            if model in media_fields:
+                # File and Image release their blob when they are
+                # deleted: read the names and release them all at once.
+                file_names.extend(queryset.values_list(media_fields[model],
+                                                       flat=True))
+            queryset._raw_delete(queryset.db)
+        blobs.remove_references(file_names)
+        transaction.on_commit(lambda: media.forget_file_courses(file_names))
+
+        queryset = Content.objects.filter(id__in=[row[0] for row in rows])
+        deleted = queryset._raw_delete(queryset.db)
+        search.schedule_reindex(text_course_ids)
+        catalog.invalidate_courses(*(row[3] for row in rows))
+    return deleted
+
+
+def item_html_key(item):
+    return (f'item_html_{item._meta.model_name}_{item.id}_'
+            f'{item.updated.timestamp()}')
+
+
+def render_items(items):
+    """
+    Return the HTML of the given items keyed by their cache key. The
+    cached HTML is fetched with one call and only the items that are
+    not in the cache are rendered.
+    """
+    keys = {item_html_key(item): item for item in items if item is not None}
+    rendered = cache.get_many(keys)
+    missing = {key: keys[key].render() for key in keys.keys() - rendered.keys()}
+    if missing:
+        cache.set_many(missing, ITEM_HTML_TIMEOUT)
+    rendered.update(missing)
+    return rendered
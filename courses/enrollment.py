@@ -0,0 +1,198 @@
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from django.db import transaction
+from django.db.models.signals import m2m_changed
+from redis.exceptions import WatchError
+
+from . import catalog
+from .localcache import LocalCache
+from .models import Course
+
+
+# Largest number of courses enrolled in with one request.
+MAX_BATCH_ENROLL = 1000
+
+# The ids of the courses each user is enrolled in are kept in a Redis
+# set per user, or as a frozenset with other cache backends, with a
+# small LRU cache of the process in front of it, so checking whether a
+# user is enrolled in a course does not query the database. The
+# m2m_changed signals of Course.students update the sets (see
+# courses/signals.py).
+#
+# A course found in the set of the process is trusted. A course that is
+# not is looked up in the shared set, so new enrollments are seen at
+# once by every process, while the removal of a student only reaches
+# the other processes after LOCAL_ENROLLMENT_TIMEOUT seconds.
+ENROLLMENT_CACHE_TIMEOUT = 60 * 60 * 24  # 24 hours
+LOCAL_ENROLLMENT_TIMEOUT = 60
+LOCAL_ENROLLMENT_SIZE = 4096
+# Member of every Redis set built from the database, telling a complete
+# set apart from one created by adding a course to a missing set.
+# Course ids start at 1.
+LOADED = 0
+
+local_enrollments = LocalCache(LOCAL_ENROLLMENT_SIZE, LOCAL_ENROLLMENT_TIMEOUT)
+
+ENROLLED = 'enrolled'
+ALREADY_ENROLLED = 'already_enrolled'
+NOT_FOUND = 'not_found'
+
+
+def enroll(user, course_ids):
+    """
+    Enroll the given user in the courses with the given ids and return
+    the result for each of them: ENROLLED, ALREADY_ENROLLED or
+    NOT_FOUND. The new enrollments are saved with a single insert into
+    the table of Course.students, whatever the number of courses.
+    """
+    course_ids = list(dict.fromkeys(course_ids))
+    Enrollment = Course.students.through
+    with transaction.atomic():
+        existing = set(Course.objects.filter(id__in=course_ids)
+                                     .values_list('id', flat=True))
+        enrolled = set(Enrollment.objects.filter(user=user,
+                                                 course_id__in=existing)
+                                         .values_list('course_id', flat=True))
+        new_ids = existing - enrolled
+        # A concurrent request may have enrolled the user already.
+        Enrollment.objects.bulk_create(
+            [Enrollment(course_id=course_id, user_id=user.id)
+             for course_id in new_ids],
+            ignore_conflicts=True)
+        if new_ids:
+            # The signal sent by user.courses_joined.add(), which
+            # bulk_create() does not send.
+            m2m_changed.send(sender=Enrollment,
+                             instance=user,
+                             action='post_add',
+                             reverse=True,
+                             model=Course,
+                             pk_set=new_ids,
+                             using=Enrollment.objects.db)
+    results = {}
+    for course_id in course_ids:
+        if course_id not in existing:
+            results[course_id] = NOT_FOUND
+        elif course_id in enrolled:
+            results[course_id] = ALREADY_ENROLLED
+        else:
+            results[course_id] = ENROLLED
+    return results
+
+
+def enrollment_key(user_id):
+    return f'enrollments_{user_id}'
+
+
+def enrollment_version_key(user_id):
+    return f'enrollments_{user_id}_version'
+
+
+def _get_redis(key):
+    # Return the Redis client and the full key when the cache is
+    # Redis, to use its sets, or None with other cache backends.
+    backend = caches['default']
+    if isinstance(backend, RedisCache):
+        key = backend.make_key(key)
+        return backend._cache.get_client(key, write=True), key
+    return None, key
+
+
+def _load(user_id):
+    # The only query: the courses of the user.
+    return frozenset(Course.students.through.objects
+                                    .filter(user_id=user_id)
+                                    .values_list('course_id', flat=True))
+
+
+def _get_shared(user_id):
+    # Return the course ids of the user from the shared cache, loading
+    # them from the database if they are not there. An enrollment saved
+    # while they are loaded may be missing from what was read: the set
+    # is only stored if no enrollment of the user changed meanwhile.
+    client, key = _get_redis(enrollment_key(user_id))
+    if client is None:
+        # Without Redis, the set is stored under a version stamp bumped
+        # by every change, so a set missing a change is never read.
+        version = catalog.get_version(enrollment_version_key(user_id))
+        key = f'{key}_v{version}'
+        course_ids = caches['default'].get(key)
+        if course_ids is None:
+            course_ids = _load(user_id)
+            caches['default'].set(key, course_ids, ENROLLMENT_CACHE_TIMEOUT)
+        return course_ids
+    with client.pipeline() as pipe:
+        # Changes of the set after WATCH make the transaction fail. The
+        # set is changed after the enrollments are committed, so any
+        # enrollment the query below cannot see changes it afterwards.
+        pipe.watch(key)
+        members = {int(member) for member in pipe.smembers(key)}
+        if LOADED in members:
+            return frozenset(members - {LOADED})
+        course_ids = _load(user_id)
+        pipe.multi()
+        pipe.delete(key)
+        pipe.sadd(key, LOADED, *course_ids)
+        pipe.expire(key, ENROLLMENT_CACHE_TIMEOUT)
+        try:
+            pipe.execute()
+        except WatchError:
+            # Loaded again on the next check.
+            pass
+        return course_ids
+
+
+def get_course_ids(user_id, refresh=False):
+    """
+    Return the ids of the courses the user with the given id is
+    enrolled in. refresh skips the cache of the process.
+    """
+    course_ids = None if refresh else local_enrollments.get(user_id)
+    if course_ids is None:
+        course_ids = _get_shared(user_id)
+        local_enrollments.set(user_id, course_ids)
+    return course_ids
+
+
+def is_enrolled(user, course_id):
+    """
+    Return whether the given user is a student of the course with the
+    given id, without querying the database once the courses of the
+    user are cached.
+    """
+    if not user.is_authenticated:
+        return False
+    try:
+        course_id = int(course_id)
+    except (TypeError, ValueError):
+        return False
+    if course_id in get_course_ids(user.id):
+        return True
+    # The user may have enrolled through another process.
+    return course_id in get_course_ids(user.id, refresh=True)
+
+
+def update_enrollments(user_ids, added=(), removed=()):
+    """
+    Add or remove the given course ids to the sets of the given users.
+    Without Redis, the versions of the sets of the users are bumped and
+    the sets loaded again on the next check.
+    """
+    user_ids = list(user_ids)
+    for user_id in user_ids:
+        local_enrollments.delete(user_id)
+    keys = [enrollment_key(user_id) for user_id in user_ids]
+    if _get_redis('')[0] is None:
+        for user_id in user_ids:
+            catalog.bump_version(enrollment_version_key(user_id))
+        return
+    for key in keys:
+        client, key = _get_redis(key)
+        # A set that does not exist is created without LOADED,
+        # so it is ignored and loaded from the database.
+        with client.pipeline() as pipe:
+            if added:
+                pipe.sadd(key, *added)
+            if removed:
+                pipe.srem(key, *removed)
+            pipe.execute()
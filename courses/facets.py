@@ -0,0 +1,308 @@
+import hashlib
+from datetime import timedelta
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db.models import (Case, CharField, Count, IntegerField,
+                              OuterRef, Q, Subquery, Value, When)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import catalog
+from .models import Course, Module
+
+
+# Facets used to filter the catalog. Values selected in the same facet
+# are combined with OR and facets are combined with AND. The subject is
+# chosen through the URL path, the other facets through query parameters.
+FACET_CACHE_TIMEOUT = 60 * 15  # 15 minutes
+
+# (value, label, maximum age in days). The buckets are ages counted from
+# now, not calendar weeks, months or years.
+CREATED_BUCKETS = [
+    ('week', 'Last 7 days', 7),
+    ('month', '8 to 30 days ago', 30),
+    ('year', '31 to 365 days ago', 365),
+    ('older', 'More than a year ago', None),
+]
+
+# (value, label, minimum modules, maximum modules)
+MODULE_BUCKETS = [
+    ('0', 'No modules', 0, 0),
+    ('1-5', '1 to 5 modules', 1, 5),
+    ('6-10', '6 to 10 modules', 6, 10),
+    ('11+', '11 modules or more', 11, None),
+]
+
+QUERY_FACETS = ('instructor', 'created', 'modules')
+
+# Largest id of a user: the primary keys are 32-bit integers.
+MAX_USER_ID = 2 ** 31 - 1
+
+
+def parse_ids(values):
+    # isdecimal() and not isdigit(), which accepts characters such
+    # as "²" that int() refuses.
+    return [int(value) for value in values
+            if value.isdecimal() and int(value) <= MAX_USER_ID]
+
+
+class Filters:
+    """
+    The facet values selected in a request.
+    """
+
+    def __init__(self, subject=None, instructor=(), created=(), modules=(),
+                 search=''):
+        self.subject = subject
+        # The search query is kept in the links of the facets,
+        # it does not change their counts.
+        self.search = search
+        self.instructor = sorted(set(instructor))
+        self.created = sorted(set(created))
+        self.modules = sorted(set(modules))
+
+    @classmethod
+    def from_request(cls, request, subject=None):
+        """
+        Return the filters selected in the query parameters of the
+        request. Unknown values are ignored.
+        """
+        created_values = {value for value, *_ in CREATED_BUCKETS}
+        module_values = {value for value, *_ in MODULE_BUCKETS}
+        return cls(
+            subject=subject,
+            instructor=parse_ids(request.GET.getlist('instructor')),
+            created=[value for value in request.GET.getlist('created')
+                     if value in created_values],
+            modules=[value for value in request.GET.getlist('modules')
+                     if value in module_values],
+            search=request.GET.get('q', '').strip())
+
+    @property
+    def is_active(self):
+        return bool(self.instructor or self.created or self.modules)
+
+    def key(self):
+        """
+        Return a short key identifying this combination of filters.
+        """
+        value = repr((self.subject.id if self.subject else None,
+                      self.instructor, self.created, self.modules))
+        return hashlib.md5(value.encode()).hexdigest()
+
+    def params(self):
+        """
+        Return the selected values as a list of (facet, value) pairs.
+        """
+        return [(facet, value) for facet in QUERY_FACETS
+                for value in getattr(self, facet)]
+
+    def query(self, facet=None, value=None):
+        """
+        Return the query string of these filters and the search query
+        with the given facet value toggled.
+        """
+        params = {'q': self.search} if self.search else {}
+        params.update((facet_name, list(getattr(self, facet_name)))
+                      for facet_name in QUERY_FACETS)
+        if facet:
+            if value in params[facet]:
+                params[facet].remove(value)
+            else:
+                params[facet].append(value)
+        return urlencode(params, doseq=True)
+
+    def apply(self, queryset, now):
+        """
+        Filter the given QuerySet of courses. The QuerySet must be
+        annotated with the number of modules as total_modules.
+        """
+        if self.subject:
+            queryset = queryset.filter(subject=self.subject)
+        if self.instructor:
+            queryset = queryset.filter(owner_id__in=self.instructor)
+        if self.created:
+            queryset = queryset.filter(_any(created_range(value, now)
+                                            for value in self.created))
+        if self.modules:
+            queryset = queryset.filter(_any(modules_range(value)
+                                            for value in self.modules))
+        return queryset
+
+
+def _any(conditions):
+    combined = Q()
+    for condition in conditions:
+        combined |= condition
+    return combined
+
+
+def created_range(value, now):
+    """
+    Return the condition selecting the courses in the given date bucket.
+    """
+    newer = None
+    for bucket, label, days in CREATED_BUCKETS:
+        if bucket == value:
+            condition = Q()
+            if days is not None:
+                condition &= Q(created__gte=now - timedelta(days=days))
+            if newer is not None:
+                condition &= Q(created__lt=now - timedelta(days=newer))
+            return condition
+        newer = days
+    raise ValueError(f'Unknown created bucket: {value}')
+
+
+def modules_range(value, field='total_modules'):
+    """
+    Return the condition selecting the courses in the given
+    module count bucket.
+    """
+    for bucket, label, minimum, maximum in MODULE_BUCKETS:
+        if bucket == value:
+            condition = Q(**{f'{field}__gte': minimum})
+            if maximum is not None:
+                condition &= Q(**{f'{field}__lte': maximum})
+            return condition
+    raise ValueError(f'Unknown modules bucket: {value}')
+
+
+def get_cube():
+    """
+    Return the number of courses for every combination of subject,
+    instructor, date bucket and module count bucket. This single
+    aggregated query provides the counts of all the facets.
+    """
+    key = f'facet_cube_v{catalog.get_version(catalog.CATALOG_VERSION_KEY)}'
+    cube = cache.get(key)
+    if cube is not None:
+        return cube
+    now = timezone.now()
+    module_total = Coalesce(Subquery(
+        Module.objects.filter(course=OuterRef('pk'))
+                      .order_by()
+                      .values('course')
+                      .annotate(total=Count('id'))
+                      .values('total'),
+        output_field=IntegerField()), 0)
+    created_bucket = Case(
+        *[When(created_range(value, now), then=Value(value))
+          for value, label, days in CREATED_BUCKETS],
+        output_field=CharField())
+    modules_bucket = Case(
+        *[When(modules_range(value, 'module_total'), then=Value(value))
+          for value, *_ in MODULE_BUCKETS],
+        output_field=CharField())
+    cube = list(Course.objects.order_by()
+                              .annotate(module_total=module_total)
+                              .annotate(created_bucket=created_bucket,
+                                        modules_bucket=modules_bucket)
+                              .values('subject_id',
+                                      'subject__title',
+                                      'subject__slug',
+                                      'owner_id',
+                                      'owner__username',
+                                      'owner__first_name',
+                                      'owner__last_name',
+                                      'created_bucket',
+                                      'modules_bucket')
+                              .annotate(total=Count('id')))
+    cache.set(key, cube, FACET_CACHE_TIMEOUT)
+    return cube
+
+
+def _matches(row, filters, exclude):
+    # Check the row against the selected values of every facet
+    # but the one whose counts are being computed.
+    if exclude != 'subject' and filters.subject \
+            and row['subject_id'] != filters.subject.id:
+        return False
+    if exclude != 'instructor' and filters.instructor \
+            and row['owner_id'] not in filters.instructor:
+        return False
+    if exclude != 'created' and filters.created \
+            and row['created_bucket'] not in filters.created:
+        return False
+    if exclude != 'modules' and filters.modules \
+            and row['modules_bucket'] not in filters.modules:
+        return False
+    return True
+
+
+def get_counts(filters):
+    """
+    Return the values of every facet with the number of courses they
+    would select combined with the filters of the other facets.
+    """
+    version = catalog.get_version(catalog.CATALOG_VERSION_KEY)
+    key = f'facet_counts_v{version}_{filters.key()}'
+    counts = cache.get(key)
+    if counts is not None:
+        return counts
+
+    cube = get_cube()
+    # Start from every subject so that the ones without
+    # matching courses are listed too.
+    subjects = {subject.id: {'value': subject.slug,
+                             'label': subject.title,
+                             'count': 0}
+                for subject in catalog.get_subjects()}
+    instructors = {}
+    created, modules = {}, {}
+    for row in cube:
+        if _matches(row, filters, 'subject'):
+            subject = subjects.setdefault(row['subject_id'], {
+                'value': row['subject__slug'],
+                'label': row['subject__title'],
+                'count': 0})
+            subject['count'] += row['total']
+        if _matches(row, filters, 'instructor'):
+            name = ' '.join(filter(None, [row['owner__first_name'],
+                                          row['owner__last_name']]))
+            instructor = instructors.setdefault(row['owner_id'], {
+                'value': row['owner_id'],
+                'label': name or row['owner__username'],
+                'count': 0})
+            instructor['count'] += row['total']
+        if _matches(row, filters, 'created'):
+            created[row['created_bucket']] = \
+                created.get(row['created_bucket'], 0) + row['total']
+        if _matches(row, filters, 'modules'):
+            modules[row['modules_bucket']] = \
+                modules.get(row['modules_bucket'], 0) + row['total']
+
+    counts = {
+        'subject': sorted(subjects.values(), key=lambda s: s['label']),
+        'instructor': sorted(instructors.values(), key=lambda i: i['label']),
+        'created': [{'value': value, 'label': label,
+                     'count': created.get(value, 0)}
+                    for value, label, days in CREATED_BUCKETS],
+        'modules': [{'value': value, 'label': label,
+                     'count': modules.get(value, 0)}
+                    for value, label, *_ in MODULE_BUCKETS],
+    }
+    cache.set(key, counts, FACET_CACHE_TIMEOUT)
+    return counts
+
+
+def get_facets(filters):
+    """
+    Return the facet counts with, for every value, whether it is
+    selected and the query string that toggles it.
+    """
+    counts = get_counts(filters)
+    facets = {}
+    for facet, values in counts.items():
+        if facet == 'subject':
+            selected = [filters.subject.slug] if filters.subject else []
+        else:
+            selected = getattr(filters, facet)
+        facets[facet] = [
+            {**value,
+             'selected': value['value'] in selected,
+             'query': filters.query() if facet == 'subject'
+             else filters.query(facet, value['value'])}
+            for value in values]
+    return facets
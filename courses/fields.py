@@ -1,28 +1,32 @@
 from django.db import models
-from django.core.exceptions import ObjectDoesNotExist
 
-class OrderField(models.PositiveIntegerField):
+class OrderFieldMixin:
+    # Allocates the order of new objects (see courses/ordering.py).
+
     def __init__(self, for_fields=None, *args, **kwargs):
         self.for_fields = for_fields
         super().__init__(*args, **kwargs)
-    
+
     def pre_save(self, model_instance, add):
         if getattr(model_instance, self.attname) is None:
-            # no current value
-            try:
-                qs = self.model.objects.all()
-                if self.for_fields:
-                    # filter by objects with the same field values
-                    # for the fields in "for_fields"
-                    query = {field: getattr(model_instance, field) for field in self.for_fields}
-                    qs = qs.filter(**query)
-                # get the order of the last item
-                last_item = qs.latest(self.attname)
-                value = last_item.order + 1
-            except ObjectDoesNotExist:
-                value = 0
+            # no current value: take the next value of the sequence
+            # of the objects with the same field values for the
+            # fields in "for_fields". The sequence row is locked
+            # while the value is allocated, so concurrent inserts
+            # never get the same order.
+            from .ordering import allocate
+            value = allocate(model_instance, self.name)
             setattr(model_instance, self.attname, value)
             return value
         else:
             return super().pre_save(model_instance, add)
-                
\ No newline at end of file
+
+
+class OrderField(OrderFieldMixin, models.PositiveIntegerField):
+    # The 32-bit field of the migrations that created the columns.
+    pass
+
+
+class BigOrderField(OrderFieldMixin, models.PositiveBigIntegerField):
+    # 64-bit values, so that the gaps between the values are not used up.
+    pass
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from courses.models import APIToken
+
+
+class Command(BaseCommand):
+    help = 'Remove the API tokens that expired'
+
+    def handle(self, *args, **options):
+        # delete() sends the post_delete signals removing
+        # the tokens from the cache.
+        removed, _ = APIToken.objects.filter(
+                        expires__lt=timezone.now()).delete()
+        self.stdout.write(f'Removed {removed} tokens')
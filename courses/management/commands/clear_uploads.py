@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from courses import uploads
+
+
+class Command(BaseCommand):
+    help = ('Remove the chunked uploads that were not completed in time '
+            'and their staging files')
+
+    def handle(self, *args, **options):
+        removed = uploads.clear_expired()
+        self.stdout.write(f'Removed {removed} uploads')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from courses import blobs
+
+
+class Command(BaseCommand):
+    help = ('Remove the stored files that are no longer used by any File '
+            'or Image item')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace',
+                            type=int,
+                            default=blobs.COLLECT_GRACE,
+                            help='Keep the files saved less than this '
+                                 'number of seconds ago (default: '
+                                 f'{blobs.COLLECT_GRACE})')
+        parser.add_argument('--dry-run',
+                            action='store_true',
+                            help='Only report the files that would '
+                                 'be removed')
+
+    def handle(self, *args, **options):
+        removed, freed = blobs.collect(options['grace'], options['dry_run'])
+        verb = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(f'{verb} {removed} unused files, '
+                          f'{freed} bytes')
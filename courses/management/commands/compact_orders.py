@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from courses import catalog, ordering
+from courses.models import Content, Module
+
+
+class Command(BaseCommand):
+    help = ('Spread out the order values of the modules of every course '
+            'and the contents of every module when their gaps run out')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-gap',
+                            type=int,
+                            default=2,
+                            help='Compact the siblings whose smallest gap '
+                                 'between two order values is below this')
+
+    def handle(self, *args, **options):
+        for model, parent in [(Module, 'course_id'), (Content, 'module_id')]:
+            compacted = 0
+            parent_ids = model.objects.order_by(parent) \
+                                      .values_list(parent, flat=True) \
+                                      .distinct()
+            for parent_id in parent_ids.iterator():
+                first = model.objects.filter(**{parent: parent_id}).first()
+                key, siblings = ordering.get_scope(first)
+                gap = ordering.min_gap(siblings)
+                if gap is not None and gap < options['min_gap']:
+                    ordering.compact(first)
+                    # The order values are part of the course contents.
+                    catalog.invalidate_courses(
+                        first.course_id if model is Module
+                        else first.module.course_id)
+                    compacted += 1
+            self.stdout.write(f'{model._meta.verbose_name_plural}: '
+                              f'compacted {compacted} groups')
@@ -0,0 +1,36 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses import packages
+from courses.models import Course
+
+
+class Command(BaseCommand):
+    help = ('Export a course with its modules, contents and media '
+            'to a package archive')
+
+    def add_arguments(self, parser):
+        parser.add_argument('course', help='Slug or id of the course')
+        parser.add_argument('-o', '--output',
+                            help='File to write the package to, '
+                                 'instead of the standard output')
+
+    def handle(self, *args, **options):
+        lookup = options['course']
+        courses = Course.objects.select_related('subject')
+        course = (courses.filter(pk=lookup).first() if lookup.isdigit()
+                  else None) or courses.filter(slug=lookup).first()
+        if course is None:
+            raise CommandError(f'Course "{lookup}" does not exist')
+
+        chunks = packages.export_package(course)
+        if options['output']:
+            with open(options['output'], 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            self.stderr.write(f'Exported "{course}" to {options["output"]}')
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
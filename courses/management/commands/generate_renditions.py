@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from courses import renditions
+from courses.models import Image
+
+
+class Command(BaseCommand):
+    help = ('Generate the resized copies of the images that do not have '
+            'them for their current file')
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids',
+                            nargs='*',
+                            type=int,
+                            help='Ids of the images, all of them by default')
+        parser.add_argument('--force',
+                            action='store_true',
+                            help='Generate the renditions again even if '
+                                 'they are up to date')
+
+    def handle(self, *args, **options):
+        images = Image.objects.order_by('id')
+        if options['ids']:
+            images = images.filter(id__in=options['ids'])
+        generated = failed = 0
+        for image in images.iterator():
+            try:
+                if renditions.generate_renditions(image, options['force']):
+                    generated += 1
+            except Exception as e:
+                self.stderr.write(f'Image {image.id}: {e}')
+                failed += 1
+        self.stdout.write(f'Generated the renditions of {generated} images, '
+                          f'{failed} failed')
@@ -0,0 +1,40 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from courses import packages
+
+
+class Command(BaseCommand):
+    help = 'Create a course from a package archive made by export_course'
+
+    def add_arguments(self, parser):
+        parser.add_argument('package',
+                            help='Package file, or "-" for the standard input')
+        parser.add_argument('--owner',
+                            required=True,
+                            help='Username of the owner of the new course')
+        parser.add_argument('--slug',
+                            help='Slug of the new course, instead of the '
+                                 'one in the package')
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["owner"]}" does not exist')
+
+        try:
+            if options['package'] == '-':
+                course = packages.import_package(sys.stdin.buffer,
+                                                 owner,
+                                                 options['slug'])
+            else:
+                with open(options['package'], 'rb') as f:
+                    course = packages.import_package(f, owner, options['slug'])
+        except packages.PackageError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported "{course}" ({course.slug}) with '
+            f'{course.modules.count()} modules'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from courses import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of the courses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size',
+                            type=int,
+                            default=1000,
+                            help='Number of courses indexed per batch')
+
+    def handle(self, *args, **options):
+        total = search.rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} courses'))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from courses import videos
+from courses.models import Video
+
+
+class Command(BaseCommand):
+    help = ('Resolve the provider, thumbnail and embed code of the videos '
+            'again, for example after changing the resolver')
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids',
+                            nargs='*',
+                            type=int,
+                            help='Ids of the videos, all of them by default')
+        parser.add_argument('--missing',
+                            action='store_true',
+                            help='Only resolve the videos without an '
+                                 'embed code or a thumbnail')
+
+    def handle(self, *args, **options):
+        items = Video.objects.order_by('id')
+        if options['ids']:
+            items = items.filter(id__in=options['ids'])
+        if options['missing']:
+            items = items.filter(Q(embed_html='') | Q(thumbnail_url=''))
+        refreshed = unresolved = 0
+        for video in items.iterator():
+            videos.update_embed(video)
+            # The URL did not change, so the pre_save signal keeps the
+            # fields, and the post_save signal invalidates the courses.
+            video.save(update_fields=['resolved_url', 'thumbnail_url',
+                                      'updated', *videos.EMBED_FIELDS])
+            # Not in the background: the command waits for the provider.
+            videos.fetch_thumbnail(video)
+            refreshed += 1
+            if not video.embed_html:
+                unresolved += 1
+        self.stdout.write(f'Refreshed {refreshed} videos, '
+                          f'{unresolved} could not be resolved')
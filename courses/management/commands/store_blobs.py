@@ -0,0 +1,30 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from courses import blobs, renditions
+from courses.models import Image
+
+
+class Command(BaseCommand):
+    help = ('Move the files of the File and Image items stored before the '
+            'content addressed storage to their blobs')
+
+    def handle(self, *args, **options):
+        moved = failed = 0
+        for model, field in blobs.MEDIA_FIELDS:
+            items = model.objects.exclude(**{field: ''}).order_by('id')
+            for item in items.iterator():
+                try:
+                    if blobs.store_legacy_file(item) is None:
+                        continue
+                    if model is Image:
+                        # The renditions are named after the source.
+                        old_sizes = item.renditions.get('sizes', [])
+                        renditions.generate_renditions(item)
+                        for size in old_sizes:
+                            default_storage.delete(size['name'])
+                    moved += 1
+                except Exception as e:
+                    self.stderr.write(f'{model.__name__} {item.id}: {e}')
+                    failed += 1
+        self.stdout.write(f'Moved {moved} files, {failed} failed')
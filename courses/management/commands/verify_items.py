@@ -0,0 +1,38 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.models import Content, File, Image, Text, Video
+
+
+class Command(BaseCommand):
+    help = ('Check that every content references an existing item '
+            'of one of the item types')
+
+    def handle(self, *args, **options):
+        item_models = [Text, File, Image, Video]
+        content_types = ContentType.objects.get_for_models(*item_models)
+        errors = 0
+
+        for model in item_models:
+            content_type = content_types[model]
+            contents = Content.objects.filter(content_type=content_type)
+            # Contents whose object_id has no row in the item table.
+            dangling = contents.exclude(
+                object_id__in=model.objects.values('id')).count()
+            self.stdout.write(f'{model._meta.model_name}: '
+                              f'{model.objects.count()} items, '
+                              f'{contents.count()} contents, '
+                              f'{dangling} dangling')
+            errors += dangling
+
+        # Contents pointing to any other content type, for example
+        # the removed courses.itembase model.
+        unknown = Content.objects.exclude(
+            content_type__in=content_types.values()).count()
+        if unknown:
+            self.stdout.write(f'{unknown} contents with an unknown type')
+        errors += unknown
+
+        if errors:
+            raise CommandError(f'{errors} contents do not resolve to an item')
+        self.stdout.write(self.style.SUCCESS('All contents resolve to an item'))
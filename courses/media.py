@@ -0,0 +1,206 @@
+import hashlib
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db.models import Q
+
+from . import enrollment
+from .models import Content, Course, File, Image
+from .renditions import RENDITION_DIR
+
+
+# The files of File and Image items, and the renditions of the images,
+# are only served to the owner and the students of the courses that
+# contain them. The courses of each file are cached for a few minutes
+# and the enrollments come from the cache of courses.enrollment, so
+# repeated requests, like the range requests of a video player or the
+# downloads of the same PDF, do not query the database, and a student
+# gets access as soon as they enroll.
+#
+# The courses are cached under the name of the file of the item, also
+# for its renditions, and removed from the cache when an item or a
+# content changes (see courses/signals.py). Files found in no course
+# are not cached, since their content may be about to be created.
+MEDIA_ACCESS_TIMEOUT = 60 * 5  # 5 minutes
+READ_SIZE = 64 * 1024
+
+RENDITION_RE = re.compile(
+    rf'^{re.escape(RENDITION_DIR)}/(?P<stem>.+)_\d+w\.\w+$')
+
+
+def _source_name(name):
+    # Return the name of the image file a rendition was made from.
+    match = RENDITION_RE.match(name)
+    if match is None:
+        return name
+    # The stem is the source name without its extension
+    # (see renditions.rendition_name).
+    candidates = Image.objects.filter(
+                    image_file__startswith=match.group('stem') + '.')
+    for image in candidates.only('image_file', 'renditions'):
+        sizes = image.renditions.get('sizes', [])
+        if any(size['name'] == name for size in sizes):
+            return image.image_file.name
+    return None
+
+
+def _name_key(prefix, name):
+    digest = hashlib.md5(name.encode()).hexdigest()
+    return f'{prefix}_{digest}'
+
+
+def get_source_name(name):
+    """
+    Return the name of the file of the item the given storage name
+    belongs to: the name itself, or the image of a rendition.
+    """
+    if RENDITION_RE.match(name) is None:
+        return name
+    # The names of the renditions are made from the name of their
+    # image, which never changes: the image is cached as long as
+    # the courses.
+    key = _name_key('media_source', name)
+    source = cache.get(key)
+    if source is None:
+        source = _source_name(name)
+        if source:
+            cache.set(key, source, MEDIA_ACCESS_TIMEOUT)
+    return source
+
+
+def forget_file_courses(names):
+    """
+    Remove the cached courses of the given names of item files, after
+    their items or contents changed.
+    """
+    cache.delete_many([_name_key('media_courses', name)
+                       for name in names if name])
+
+
+def get_file_courses(name):
+    """
+    Return the (id, owner id) of the courses with a File or Image item
+    whose file is the given storage name.
+    """
+    source = get_source_name(name)
+    if not source:
+        return []
+    key = _name_key('media_courses', source)
+    courses = cache.get(key)
+    if courses is not None:
+        return courses
+
+    content_types = ContentType.objects.get_for_models(File, Image)
+    items = Q(content_type=content_types[File],
+              object_id__in=File.objects.filter(pdf_file=source)
+                                        .values('id')) | \
+            Q(content_type=content_types[Image],
+              object_id__in=Image.objects.filter(image_file=source)
+                                         .values('id'))
+    course_ids = Content.objects.filter(items) \
+                                .values('module__course_id')
+    courses = list(Course.objects.filter(id__in=course_ids)
+                                 .values_list('id', 'owner_id'))
+    if courses:
+        cache.set(key, courses, MEDIA_ACCESS_TIMEOUT)
+    return courses
+
+
+def can_access(user, name):
+    """
+    Return whether the given user owns or is enrolled in a course with
+    a File or Image item whose file is the given storage name.
+    """
+    if not user.is_authenticated:
+        return False
+    if user.is_staff:
+        return True
+    return any(owner_id == user.id or enrollment.is_enrolled(user, course_id)
+               for course_id, owner_id in get_file_courses(name))
+
+
+def get_etag(stat):
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def get_content_type(name):
+    content_type, encoding = mimetypes.guess_type(name)
+    return content_type or 'application/octet-stream'
+
+
+def parse_range(header, size):
+    """
+    Return the (start, end) byte positions, end included, of a single
+    "bytes=" range header, None if the header must be ignored, or
+    raise ValueError if the range cannot be satisfied.
+    """
+    match = re.fullmatch(r'\s*bytes=(\d*)-(\d*)\s*', header or '')
+    if match is None or match.groups() == ('', ''):
+        # No header, several ranges or another unit:
+        # send the whole file.
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # Suffix range: the last bytes of the file.
+        start = max(0, size - int(last))
+        end = size - 1
+    if start > end or start >= size:
+        raise ValueError(f'Range not satisfiable: {header}')
+    return start, end
+
+
+def iter_range(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining:
+            data = f.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def get_offload_headers(path):
+    """
+    Return the header handing the transfer of the file to the front
+    proxy, if one is configured:
+
+    - MEDIA_ACCEL_REDIRECT: prefix of an internal nginx location
+      serving MEDIA_ROOT, for example "/protected-media/".
+    - MEDIA_SENDFILE: True for Apache mod_xsendfile or lighttpd.
+    """
+    accel_prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT', None)
+    if accel_prefix:
+        # The location of the file in MEDIA_ROOT, which is not its name
+        # for the files stored as blobs (see courses/storage.py).
+        location = os.path.relpath(path, settings.MEDIA_ROOT)
+        location = location.replace(os.sep, '/')
+        return {'X-Accel-Redirect': accel_prefix.rstrip('/') + '/' + quote(location)}
+    if getattr(settings, 'MEDIA_SENDFILE', False):
+        return {'X-Sendfile': path}
+    return {}
+
+
+def get_path(name):
+    # Only files stored on the local file system can be served.
+    # Renditions are in the default storage, the files of the
+    # items in the storage of their field.
+    if RENDITION_RE.match(name):
+        return default_storage.path(name)
+    return File._meta.get_field('pdf_file').storage.path(name)
+
+
+def get_stat(path):
+    if not os.path.isfile(path):
+        return None
+    return os.stat(path)
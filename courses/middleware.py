@@ -0,0 +1,26 @@
+from django.conf import settings
+
+from courses import ratelimit
+
+
+class LoadMonitorMiddleware:
+    """
+    Count the requests in progress and record their duration, used to
+    shed load (see courses/ratelimit.py). Only the requests under
+    LOAD_MONITOR_PATHS, which are shed, are measured: long requests
+    that are never shed, such as the chunks of uploads or the media,
+    would make the site look overloaded.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.paths = tuple(settings.LOAD_MONITOR_PATHS)
+
+    def __call__(self, request):
+        if not request.path_info.startswith(self.paths):
+            return self.get_response(request)
+        token = ratelimit.load.start()
+        try:
+            return self.get_response(request)
+        finally:
+            ratelimit.load.finish(token)
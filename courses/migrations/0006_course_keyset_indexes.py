@@ -0,0 +1,26 @@
+# Generated by Django 4.1.9 on 2026-10-17 04:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0005_course_students"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(
+                fields=["-created", "id"], name="courses_cou_created_112d71_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(
+                fields=["subject", "-created", "id"],
+                name="courses_cou_subject_a98174_idx",
+            ),
+        ),
+    ]
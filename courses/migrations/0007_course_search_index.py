@@ -0,0 +1,43 @@
+from django.db import migrations
+
+
+# The search index is a backend specific table that is not managed by
+# the ORM. It is created only on the databases supported by
+# courses.search and filled by the rebuild_search_index command.
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE courses_search USING fts5("
+            "title, overview, modules, texts, "
+            "tokenize = 'porter unicode61')"
+        )
+    elif vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE TABLE courses_search ("
+            "course_id bigint PRIMARY KEY "
+            "REFERENCES courses_course (id) "
+            "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX courses_search_document_idx "
+            "ON courses_search USING GIN (document)"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ("sqlite", "postgresql"):
+        schema_editor.execute("DROP TABLE courses_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0006_course_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,174 @@
+# ItemBase was meant to be abstract but its Meta class was misspelled, so
+# Text, File, Image and Video were stored as multi-table children of a
+# concrete courses_itembase table. This migration moves every item type to
+# a single table of its own:
+#
+# 1. create a flat table for each item type,
+# 2. copy the rows with INSERT ... SELECT, keeping the primary keys so
+#    that the Content.object_id references stay valid,
+# 3. drop the child tables and courses_itembase,
+# 4. rename the flat tables to the original model names.
+#
+# The content types of the item models are kept, so Content.content_type
+# does not change either. Run "manage.py verify_items" afterwards to check
+# that every content still resolves to its item.
+# Unapplying copies the rows back into the multi-table layout.
+
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+ITEM_MODELS = {
+    "text": "content",
+    "file": "pdf_file",
+    "image": "image_file",
+    "video": "url",
+}
+
+
+def reset_sequences(schema_editor, models):
+    connection = schema_editor.connection
+    for sql in connection.ops.sequence_reset_sql(no_style(), models):
+        schema_editor.execute(sql)
+
+
+def copy_to_flat_tables(apps, schema_editor):
+    qn = schema_editor.quote_name
+    item_table = apps.get_model("courses", "ItemBase")._meta.db_table
+    flat_models = []
+    for model_name, field in ITEM_MODELS.items():
+        child_table = apps.get_model("courses", model_name)._meta.db_table
+        flat_model = apps.get_model("courses", f"flat{model_name}")
+        flat_models.append(flat_model)
+        schema_editor.execute(
+            f"INSERT INTO {qn(flat_model._meta.db_table)} "
+            f"(id, owner_id, title, created, updated, {qn(field)}) "
+            f"SELECT i.id, i.owner_id, i.title, i.created, i.updated, "
+            f"c.{qn(field)} "
+            f"FROM {qn(child_table)} c "
+            f"INNER JOIN {qn(item_table)} i ON i.id = c.itembase_ptr_id"
+        )
+    # The primary keys were inserted explicitly, so the sequences
+    # must continue after the highest copied id.
+    reset_sequences(schema_editor, flat_models)
+
+
+def copy_to_child_tables(apps, schema_editor):
+    qn = schema_editor.quote_name
+    item_model = apps.get_model("courses", "ItemBase")
+    item_table = item_model._meta.db_table
+    for model_name, field in ITEM_MODELS.items():
+        child_table = apps.get_model("courses", model_name)._meta.db_table
+        flat_table = apps.get_model("courses", f"flat{model_name}")._meta.db_table
+        # Item ids are only unique per type once the tables are flat,
+        # so this fails with an integrity error if two items of
+        # different types got the same id in the meantime.
+        schema_editor.execute(
+            f"INSERT INTO {qn(item_table)} "
+            f"(id, owner_id, title, created, updated) "
+            f"SELECT id, owner_id, title, created, updated "
+            f"FROM {qn(flat_table)}"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {qn(child_table)} (itembase_ptr_id, {qn(field)}) "
+            f"SELECT id, {qn(field)} FROM {qn(flat_table)}"
+        )
+    reset_sequences(schema_editor, [item_model])
+
+
+def merge_content_types(apps, schema_editor):
+    # RenameModel also renames the content type of the model when it
+    # exists. When the migration is unapplied and applied again, the
+    # content types of both Text and FlatText can exist at the same
+    # time, and the contents may be left pointing to the flat one.
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    Content = apps.get_model("courses", "Content")
+    for model_name in ITEM_MODELS:
+        flat = ContentType.objects.filter(
+            app_label="courses", model=f"flat{model_name}"
+        ).first()
+        if flat is None:
+            continue
+        target = ContentType.objects.filter(
+            app_label="courses", model=model_name
+        ).first()
+        if target is None:
+            flat.model = model_name
+            flat.save()
+        else:
+            Content.objects.filter(content_type=flat).update(content_type=target)
+            flat.delete()
+
+
+def item_fields(*fields):
+    return [
+        (
+            "id",
+            models.BigAutoField(
+                auto_created=True,
+                primary_key=True,
+                serialize=False,
+                verbose_name="ID",
+            ),
+        ),
+        ("title", models.CharField(max_length=250)),
+        ("created", models.DateTimeField(auto_now_add=True)),
+        ("updated", models.DateTimeField(auto_now=True)),
+        *fields,
+        (
+            "owner",
+            models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="%(class)s_related",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("courses", "0007_course_search_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FlatText",
+            fields=item_fields(("content", models.TextField())),
+            options={"abstract": False},
+        ),
+        migrations.CreateModel(
+            name="FlatFile",
+            fields=item_fields(("pdf_file", models.FileField(upload_to="files"))),
+            options={"abstract": False},
+        ),
+        migrations.CreateModel(
+            name="FlatImage",
+            fields=item_fields(
+                ("image_file", models.FileField(upload_to="images"))
+            ),
+            options={"abstract": False},
+        ),
+        migrations.CreateModel(
+            name="FlatVideo",
+            fields=item_fields(("url", models.URLField())),
+            options={"abstract": False},
+        ),
+        migrations.RunPython(copy_to_flat_tables, copy_to_child_tables),
+        migrations.DeleteModel(name="Text"),
+        migrations.DeleteModel(name="File"),
+        migrations.DeleteModel(name="Image"),
+        migrations.DeleteModel(name="Video"),
+        migrations.DeleteModel(name="ItemBase"),
+        migrations.RunPython(migrations.RunPython.noop, merge_content_types),
+        migrations.RenameModel(old_name="FlatText", new_name="Text"),
+        migrations.RenameModel(old_name="FlatFile", new_name="File"),
+        migrations.RenameModel(old_name="FlatImage", new_name="Image"),
+        migrations.RenameModel(old_name="FlatVideo", new_name="Video"),
+        migrations.RunPython(merge_content_types, migrations.RunPython.noop),
+    ]
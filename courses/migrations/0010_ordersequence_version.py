@@ -0,0 +1,18 @@
+# Generated by Django 4.1.9 on 2026-10-17 04:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0009_ordersequence"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ordersequence",
+            name="version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
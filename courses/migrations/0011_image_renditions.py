@@ -0,0 +1,28 @@
+# Generated by Django 4.1.9 on 2026-10-17 04:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0010_ordersequence_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="height",
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="image",
+            name="renditions",
+            field=models.JSONField(default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name="image",
+            name="width",
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.1.9 on 2026-10-17 04:55
+
+import courses.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0012_upload"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Blob",
+            fields=[
+                (
+                    "hash",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("references", models.PositiveIntegerField(default=0)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="file",
+            name="pdf_file",
+            field=models.FileField(
+                max_length=255,
+                storage=courses.storage.get_blob_storage,
+                upload_to="files",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="image",
+            name="image_file",
+            field=models.FileField(
+                max_length=255,
+                storage=courses.storage.get_blob_storage,
+                upload_to="images",
+            ),
+        ),
+    ]
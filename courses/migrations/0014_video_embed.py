@@ -0,0 +1,38 @@
+# Generated by Django 4.1.9 on 2026-10-17 04:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0013_blob_storage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="video",
+            name="embed_html",
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name="video",
+            name="embed_url",
+            field=models.URLField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name="video",
+            name="provider",
+            field=models.CharField(blank=True, editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name="video",
+            name="thumbnail_url",
+            field=models.URLField(blank=True, editable=False, max_length=500),
+        ),
+        migrations.AddField(
+            model_name="video",
+            name="video_id",
+            field=models.CharField(blank=True, editable=False, max_length=200),
+        ),
+    ]
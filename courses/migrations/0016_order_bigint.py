@@ -0,0 +1,24 @@
+# Generated by Django 4.1.9 on 2026-10-17 09:12
+
+import courses.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0015_api_token"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="content",
+            name="order",
+            field=courses.fields.BigOrderField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name="module",
+            name="order",
+            field=courses.fields.BigOrderField(blank=True),
+        ),
+    ]
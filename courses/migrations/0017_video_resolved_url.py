@@ -0,0 +1,22 @@
+# Generated by Django 4.1.9 on 2026-10-17 09:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # The videos saved before the embed code was stored with them keep
+    # empty embed fields, and are rendered as links, until
+    # "manage.py refresh_videos --missing" resolves them. The resolver
+    # is not called here, since it may change after this migration.
+
+    dependencies = [
+        ("courses", "0016_order_bigint"),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name="video",
+            old_name="embed_url",
+            new_name="resolved_url",
+        ),
+    ]
@@ -1,11 +1,29 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
+from django.core.files.storage import default_storage
 from django.template.loader import render_to_string
 
-from .fields import OrderField
+from .fields import BigOrderField
+from .storage import get_blob_storage
 
+class OrderSequence(models.Model):
+    # Last order value allocated to the objects sharing the same
+    # values for the "for_fields" of an OrderField, such as the
+    # modules of a course (see courses/ordering.py).
+    scope = models.CharField(max_length=200, unique=True)
+    value = models.PositiveBigIntegerField(default=0)
+    # Incremented whenever the objects are reordered, so that
+    # reorders based on an outdated list can be rejected.
+    version = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f'{self.scope}: {self.value}'
+    
+    
 class Subject(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
@@ -33,6 +51,12 @@ class Course(models.Model):
     
     class Meta:
         ordering = ['-created']
+        # Support the keyset pagination of the catalog on
+        # (-created, id), for all courses and per subject.
+        indexes = [
+            models.Index(fields=['-created', 'id']),
+            models.Index(fields=['subject', '-created', 'id']),
+        ]
         
     def __str__(self):
         return self.title
@@ -43,7 +67,7 @@ class Module(models.Model):
                                on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
-    order = OrderField(blank=True, for_fields=['course'])
+    order = BigOrderField(blank=True, for_fields=['course'])
     
     class Meta:
         ordering = ['order']
@@ -51,6 +75,17 @@ class Module(models.Model):
     def __str__(self):
         return f'{self.order}. {self.title}'
     
+class ContentQuerySet(models.QuerySet):
+    
+    def with_items(self):
+        # Fetch the items of all the contents with one query
+        # per content type instead of one query per content.
+        # The generic foreign key groups the contents by
+        # content_type and looks up each item model with an
+        # "IN" query on the object ids.
+        return self.prefetch_related('item')
+    
+    
 class Content(models.Model):
     module = models.ForeignKey(Module,
                                related_name='contents',
@@ -64,7 +99,9 @@ class Content(models.Model):
                                          'file')})
     object_id = models.PositiveBigIntegerField()
     item = GenericForeignKey('content_type', 'object_id')
-    order = OrderField(blank=True, for_fields=['module'])
+    order = BigOrderField(blank=True, for_fields=['module'])
+    
+    objects = ContentQuerySet.as_manager()
     
     class Meta:
         ordering = ['order']
@@ -86,7 +123,7 @@ class ItemBase(models.Model):
             f'courses/content/{self._meta.model_name}.html',
             {'item':self})
     
-    class Mate:
+    class Meta:
         abstract = True
         
     def __str__(self):
@@ -95,13 +132,133 @@ class ItemBase(models.Model):
 class Text(ItemBase):
     content = models.TextField()
     
+# Files are stored once per distinct content (see courses/storage.py).
 class File(ItemBase):
-    pdf_file = models.FileField(upload_to='files')
+    pdf_file = models.FileField(upload_to='files',
+                                storage=get_blob_storage,
+                                max_length=255)
     
 class Image(ItemBase):
-    image_file = models.FileField(upload_to='images')
+    image_file = models.FileField(upload_to='images',
+                                  storage=get_blob_storage,
+                                  max_length=255)
+    # Size of the original image and resized copies of it, which are
+    # generated after the image is saved (see courses/renditions.py).
+    # "renditions" holds the name of the file they were made from and
+    # the name, width and height of every copy, smallest first.
+    width = models.PositiveIntegerField(null=True, editable=False)
+    height = models.PositiveIntegerField(null=True, editable=False)
+    renditions = models.JSONField(default=dict, editable=False)
+    
+    def get_renditions(self):
+        # Renditions of a previous file are ignored until the
+        # ones of the current file are generated.
+        if self.renditions.get('source') != self.image_file.name:
+            return []
+        return [{**size, 'url': default_storage.url(size['name'])}
+                for size in self.renditions['sizes']]
+    
+    def get_src(self):
+        # For browsers without srcset support: the smallest rendition
+        # filling the 600px wide module column.
+        renditions = self.get_renditions()
+        if not renditions:
+            return self.image_file.url
+        return next((size['url'] for size in renditions
+                     if size['width'] >= 600), renditions[-1]['url'])
+    
+    def get_srcset(self):
+        renditions = self.get_renditions()
+        if not renditions:
+            return ''
+        candidates = [f"{size['url']} {size['width']}w" for size in renditions]
+        candidates.append(f'{self.image_file.url} {self.width}w')
+        return ', '.join(candidates)
     
 class Video(ItemBase):
     url = models.URLField()
+    # Resolved from the URL when it changes (see courses/videos.py),
+    # so that rendering the video needs no parsing nor network call.
+    # resolved_url is the URL the other fields were resolved from.
+    resolved_url = models.URLField(blank=True, editable=False)
+    provider = models.CharField(max_length=50, blank=True, editable=False)
+    video_id = models.CharField(max_length=200, blank=True, editable=False)
+    thumbnail_url = models.URLField(max_length=500,
+                                    blank=True,
+                                    editable=False)
+    embed_html = models.TextField(blank=True, editable=False)
+
+
+class Blob(models.Model):
+    # Number of File and Image items using a file of the content
+    # addressed storage, identified by the SHA-256 of its content.
+    # Blobs without references are removed by "manage.py collect_blobs".
+    hash = models.CharField(max_length=64, primary_key=True)
+    references = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f'{self.hash}: {self.references}'
+    
+    
+class Upload(models.Model):
+    # A file or image sent in chunks, possibly over several requests
+    # and out of order, before it becomes the item of a new content of
+    # the module (see courses/uploads.py).
+    id = models.UUIDField(primary_key=True,
+                          default=uuid.uuid4,
+                          editable=False)
+    owner = models.ForeignKey(User,
+                              related_name='uploads',
+                              on_delete=models.CASCADE)
+    module = models.ForeignKey(Module,
+                               related_name='uploads',
+                               on_delete=models.CASCADE)
+    model_name = models.CharField(max_length=10)
+    title = models.CharField(max_length=250)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    # Optional SHA-256 of the whole file, checked when it is complete.
+    checksum = models.CharField(max_length=64, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f'{self.filename} ({self.id})'
+    
+    
+class UploadChunk(models.Model):
+    # A chunk of an upload that was received and matched its checksum.
+    upload = models.ForeignKey(Upload,
+                               related_name='chunks',
+                               on_delete=models.CASCADE)
+    index = models.PositiveIntegerField()
+    checksum = models.CharField(max_length=64)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['upload', 'index'],
+                                    name='unique_upload_chunk'),
+        ]
+
+    
     
+class APIToken(models.Model):
+    # A token issued to a user for the API. Only the SHA-256 of the
+    # token is stored: tokens are long random strings, so a fast digest
+    # is enough, unlike passwords (see courses/api/authentication.py).
+    user = models.ForeignKey(User,
+                             related_name='api_tokens',
+                             on_delete=models.CASCADE)
+    key_hash = models.CharField(max_length=64, unique=True)
+    # The first characters of the token, to tell the tokens apart.
+    prefix = models.CharField(max_length=8)
+    name = models.CharField(max_length=100, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    expires = models.DateTimeField()
     
+    class Meta:
+        ordering = ['-created']
+    
+    def __str__(self):
+        return f'{self.prefix}... ({self.user})'
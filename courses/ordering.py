@@ -0,0 +1,276 @@
+import bisect
+
+from django.db import transaction
+from django.db.models import Max
+
+from .models import OrderSequence
+
+
+# Order values are allocated with gaps between them, so that an object
+# can be moved between two siblings by giving it a value in the gap:
+# one UPDATE of the moved row and no renumbering of the others. When a
+# gap is used up, the siblings are spread out again (compacted).
+#
+# New values are taken from an OrderSequence row per scope (for example
+# "courses.module.order:course_id=3" for the modules of a course). The row is locked while a value is
+# allocated, so concurrent inserts never get the same value.
+ORDER_GAP = 1024
+
+
+def get_order_field(model, field_name='order'):
+    return model._meta.get_field(field_name)
+
+
+def get_scope(instance, field_name='order'):
+    """
+    Return the sequence key and the QuerySet of the siblings of the
+    given instance, i.e. the objects sharing its "for_fields" values.
+    """
+    model = type(instance)
+    field = get_order_field(model, field_name)
+    lookups = {}
+    for name in field.for_fields or []:
+        attname = model._meta.get_field(name).attname
+        lookups[attname] = getattr(instance, attname)
+    scope = ','.join(f'{name}={value}' for name, value in sorted(lookups.items()))
+    key = f'{model._meta.label_lower}.{field.attname}:{scope}'
+    return key, model._default_manager.filter(**lookups)
+
+
+def _lock_sequence(key, siblings, attname):
+    # Must be called inside a transaction. The sequence of a scope is
+    # created on first use, starting after the current highest value.
+    sequence, created = OrderSequence.objects.select_for_update() \
+        .get_or_create(scope=key, defaults={
+            'value': lambda: siblings.aggregate(
+                highest=Max(attname))['highest'] or 0,
+        })
+    return sequence
+
+
+def _take(sequence, count=1):
+    first = sequence.value + ORDER_GAP
+    sequence.value += ORDER_GAP * count
+    sequence.save(update_fields=['value'])
+    return first
+
+
+def allocate(instance, field_name='order', count=1):
+    """
+    Reserve count order values after the last sibling of the given
+    instance and return the first one. The values are ORDER_GAP apart.
+    """
+    key, siblings = get_scope(instance, field_name)
+    attname = get_order_field(type(instance), field_name).attname
+    with transaction.atomic():
+        sequence = _lock_sequence(key, siblings, attname)
+        return _take(sequence, count)
+
+
+def assign_orders(objs, field_name='order'):
+    """
+    Set the order of the given unsaved objects that have none, with one
+    allocation per scope. Call it before bulk_create() so that the order
+    field does not allocate the values one object at a time.
+    """
+    pending = {}
+    for obj in objs:
+        attname = get_order_field(type(obj), field_name).attname
+        if getattr(obj, attname) is None:
+            key, siblings = get_scope(obj, field_name)
+            pending.setdefault(key, []).append(obj)
+    for group in pending.values():
+        attname = get_order_field(type(group[0]), field_name).attname
+        value = allocate(group[0], field_name, count=len(group))
+        for obj in group:
+            setattr(obj, attname, value)
+            value += ORDER_GAP
+    return objs
+
+
+def compact(instance, field_name='order'):
+    """
+    Spread out the order values of the siblings of the given instance,
+    ORDER_GAP apart, keeping their current order.
+    """
+    key, siblings = get_scope(instance, field_name)
+    attname = get_order_field(type(instance), field_name).attname
+    with transaction.atomic():
+        sequence = _lock_sequence(key, siblings, attname)
+        _compact(sequence, siblings, attname)
+
+
+def _compact(sequence, siblings, attname):
+    objs = list(siblings.order_by(attname, 'pk').only('pk', attname))
+    changed = []
+    for position, obj in enumerate(objs, 1):
+        if getattr(obj, attname) != position * ORDER_GAP:
+            setattr(obj, attname, position * ORDER_GAP)
+            changed.append(obj)
+    if changed:
+        siblings.model._default_manager.bulk_update(changed,
+                                                    [attname],
+                                                    batch_size=500)
+    sequence.value = len(objs) * ORDER_GAP
+    sequence.version += 1
+    sequence.save(update_fields=['value', 'version'])
+
+
+def move(instance, after=None, field_name='order'):
+    """
+    Move the given instance right after the sibling "after", or first
+    if "after" is None. Only the row of the instance is updated, unless
+    there is no gap left at that position and the siblings have to be
+    compacted first. Moving an instance after itself does nothing.
+    """
+    key, siblings = get_scope(instance, field_name)
+    attname = get_order_field(type(instance), field_name).attname
+    if after is not None and after.pk == instance.pk:
+        return getattr(instance, attname)
+    others = siblings.exclude(pk=instance.pk)
+    with transaction.atomic():
+        sequence = _lock_sequence(key, siblings, attname)
+        value = None
+        for attempt in range(2):
+            # Read the neighbours under the lock, the values in memory
+            # may be outdated.
+            low = 0
+            following = others
+            if after is not None:
+                low = others.filter(pk=after.pk) \
+                            .values_list(attname, flat=True).get()
+                following = others.filter(**{f'{attname}__gt': low})
+            high = following.order_by(attname) \
+                            .values_list(attname, flat=True).first()
+            if high is None:
+                value = _take(sequence)
+            elif high - low > 1:
+                value = (low + high) // 2
+            else:
+                _compact(sequence, siblings, attname)
+                continue
+            break
+        siblings.filter(pk=instance.pk).update(**{attname: value})
+        sequence.version += 1
+        sequence.save(update_fields=['version'])
+    setattr(instance, attname, value)
+    return value
+
+
+def _stable_positions(values):
+    # Return the indexes of a longest increasing subsequence of the given
+    # values: the objects that are already in the right relative order
+    # and do not need to move.
+    tails, tail_indexes, parents = [], [], [None] * len(values)
+    for index, value in enumerate(values):
+        position = bisect.bisect_left(tails, value)
+        if position:
+            parents[index] = tail_indexes[position - 1]
+        if position == len(tails):
+            tails.append(value)
+            tail_indexes.append(index)
+        else:
+            tails[position] = value
+            tail_indexes[position] = index
+    stable = set()
+    index = tail_indexes[-1] if tail_indexes else None
+    while index is not None:
+        stable.add(index)
+        index = parents[index]
+    return stable
+
+
+class StaleOrder(Exception):
+    """
+    Raised when a reorder is based on an outdated list of siblings.
+    """
+    def __init__(self, version):
+        super().__init__(f'The list has changed (version {version})')
+        self.version = version
+
+
+def get_version(instance, field_name='order'):
+    """
+    Return the version of the list of siblings of the given instance.
+    """
+    key, siblings = get_scope(instance, field_name)
+    return OrderSequence.objects.filter(scope=key) \
+                                .values_list('version', flat=True) \
+                                .first() or 0
+
+
+def _spread(count, low, high):
+    # Return count increasing values strictly between low and high,
+    # or None if there is not enough room.
+    if high - low <= count:
+        return None
+    return [low + (high - low) * (index + 1) // (count + 1)
+            for index in range(count)]
+
+
+def reorder(instance, ordered_pks, version=None, field_name='order'):
+    """
+    Put all the siblings of the given instance in the order of the given
+    primary keys and return the new version of the list. Only the objects
+    outside the longest run already in order get new values, and they are
+    saved with a single bulk_update() in one transaction.
+
+    Raises StaleOrder if the given primary keys are not exactly the
+    current siblings, or if the given version is outdated.
+    """
+    key, siblings = get_scope(instance, field_name)
+    model = type(instance)
+    attname = get_order_field(model, field_name).attname
+    with transaction.atomic():
+        sequence = _lock_sequence(key, siblings, attname)
+        current = dict(siblings.values_list('pk', attname))
+        if (len(ordered_pks) != len(current) or
+                set(ordered_pks) != set(current) or
+                (version is not None and version != sequence.version)):
+            raise StaleOrder(sequence.version)
+
+        values = [current[pk] for pk in ordered_pks]
+        stable = _stable_positions(values)
+        new_values = {}
+        low, run = 0, []
+        for index, pk in enumerate(ordered_pks):
+            if index not in stable:
+                run.append(pk)
+                continue
+            spread = _spread(len(run), low, current[pk])
+            if spread is None:
+                # No room left between the neighbours: renumber the
+                # whole list instead.
+                new_values = {pk: (index + 1) * ORDER_GAP
+                              for index, pk in enumerate(ordered_pks)}
+                sequence.value = len(ordered_pks) * ORDER_GAP
+                run = []
+                break
+            new_values.update(zip(run, spread))
+            low, run = current[pk], []
+        if run:
+            # Objects moved after the last one in order take new values
+            # at the end of the list.
+            first = _take(sequence, len(run))
+            new_values.update((pk, first + index * ORDER_GAP)
+                              for index, pk in enumerate(run))
+
+        changed = [model(pk=pk, **{attname: value})
+                   for pk, value in new_values.items()
+                   if current[pk] != value]
+        if changed:
+            model._default_manager.bulk_update(changed, [attname])
+        sequence.version += 1
+        sequence.save(update_fields=['value', 'version'])
+    return sequence.version
+
+
+def min_gap(siblings, attname='order'):
+    """
+    Return the smallest difference between two consecutive order values
+    of the given siblings, or None if there are less than two of them.
+    """
+    values = list(siblings.order_by(attname).values_list(attname, flat=True))
+    if len(values) < 2:
+        return None
+    return min(b - a for a, b in zip(values, values[1:]))
@@ -0,0 +1,228 @@
+import json
+import os
+import tarfile
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.files import File as DjangoFile
+from django.db import transaction
+
+from . import blobs, catalog, renditions, videos
+from .models import Content, Course, File, Image, Module, Subject, Text, Video
+
+
+# A course package is an uncompressed tar archive. Its first member is
+# a JSON manifest with the course, its modules and their contents in
+# order; the binaries of the file and image items follow it, one member
+# each. Both ends stream the archive: the media is copied from and to
+# the storage in chunks and never loaded in memory as a whole.
+PACKAGE_FORMAT = 1
+MANIFEST_NAME = 'course.json'
+CHUNK_SIZE = 64 * 1024
+
+ITEM_MODELS = {model._meta.model_name: model
+               for model in [Text, Video, File, Image]}
+# Fields holding the data of each item type, besides the title.
+ITEM_FIELDS = {'text': 'content', 'video': 'url'}
+MEDIA_FIELDS = {'file': 'pdf_file', 'image': 'image_file'}
+
+
+class PackageError(Exception):
+    """
+    Raised when a course package cannot be imported.
+    """
+
+
+def _member_header(name, size):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    return info.tobuf(format=tarfile.PAX_FORMAT, encoding='utf-8')
+
+
+def _padding(size):
+    return b'\0' * (-size % tarfile.BLOCKSIZE)
+
+
+def _stream(manifest, media):
+    data = json.dumps(manifest, indent=2).encode()
+    yield _member_header(MANIFEST_NAME, len(data))
+    yield data + _padding(len(data))
+    for member_name, field_file, size in media:
+        yield _member_header(member_name, size)
+        with field_file.storage.open(field_file.name, 'rb') as f:
+            for chunk in f.chunks(CHUNK_SIZE):
+                yield chunk
+        yield _padding(size)
+    # End of archive marker
+    yield b'\0' * (tarfile.BLOCKSIZE * 2)
+
+
+def export_package(course):
+    """
+    Return an iterator over the bytes of the package of the given course.
+    The manifest is built and every media file is checked before the
+    iterator is returned, so that a missing file raises an error before
+    anything is sent.
+    """
+    modules = course.modules.prefetch_related('contents__item')
+    media = []
+    manifest = {
+        'format': PACKAGE_FORMAT,
+        'course': {'title': course.title,
+                   'slug': course.slug,
+                   'overview': course.overview,
+                   'subject': {'title': course.subject.title,
+                               'slug': course.subject.slug}},
+        'modules': [],
+    }
+    for module in modules:
+        contents = []
+        for content in module.contents.all():
+            item = content.item
+            item_type = item._meta.model_name
+            data = {'type': item_type,
+                    'order': content.order,
+                    'title': item.title}
+            if item_type in MEDIA_FIELDS:
+                field_file = getattr(item, MEDIA_FIELDS[item_type])
+                member_name = (f'media/{len(media) + 1}/'
+                               f'{os.path.basename(field_file.name)}')
+                media.append((member_name,
+                              field_file,
+                              field_file.storage.size(field_file.name)))
+                data['file'] = member_name
+            else:
+                data[ITEM_FIELDS[item_type]] = getattr(item, ITEM_FIELDS[item_type])
+            contents.append(data)
+        manifest['modules'].append({'title': module.title,
+                                    'description': module.description,
+                                    'order': module.order,
+                                    'contents': contents})
+    return _stream(manifest, media)
+
+
+def _read_manifest(archive):
+    member = archive.next()
+    if member is None or member.name != MANIFEST_NAME:
+        raise PackageError(f'The package must start with {MANIFEST_NAME}')
+    try:
+        manifest = json.load(archive.extractfile(member))
+    except ValueError as e:
+        raise PackageError(f'Invalid manifest: {e}')
+    if manifest.get('format') != PACKAGE_FORMAT:
+        raise PackageError(f'Unsupported package format: '
+                           f'{manifest.get("format")}')
+    return manifest
+
+
+def import_package(fileobj, owner, slug=None):
+    """
+    Create a course owned by the given user from the package read from
+    the given file object and return it. The archive is read in a single
+    pass, so fileobj does not need to be seekable.
+
+    The objects are created with one bulk_create() per model, in the
+    order of their dependencies: modules, items and then contents.
+    The media are saved as blobs, which may be shared with other
+    items: if the import fails, the blobs left without references are
+    removed by the collection (see courses/blobs.py).
+    """
+    try:
+        with tarfile.open(fileobj=fileobj, mode='r|*') as archive, \
+                transaction.atomic():
+            manifest = _read_manifest(archive)
+            course = _create_course(manifest['course'], owner, slug)
+            modules = Module.objects.bulk_create([
+                Module(course=course,
+                       title=module['title'],
+                       description=module['description'],
+                       order=module['order'])
+                for module in manifest['modules']])
+
+            # Copy the media from the archive to the storage
+            # as the members come.
+            media = {}
+            for module in manifest['modules']:
+                for content in module['contents']:
+                    if content['type'] in MEDIA_FIELDS:
+                        media[content['file']] = content['type']
+            stored = {}
+            # Iterating over the archive would start again from the
+            # manifest, the next members are read one by one instead.
+            for member in iter(archive.next, None):
+                if member.name not in media or not member.isfile():
+                    raise PackageError(f'Unexpected member: {member.name}')
+                model = ITEM_MODELS[media[member.name]]
+                field = model._meta.get_field(MEDIA_FIELDS[media[member.name]])
+                name = field.storage.get_available_name(
+                            field.generate_filename(
+                                None, os.path.basename(member.name)),
+                            max_length=field.max_length)
+                stored[member.name] = field.storage.save(
+                            name,
+                            DjangoFile(archive.extractfile(member), name),
+                            max_length=field.max_length)
+            missing = set(media) - set(stored)
+            if missing:
+                raise PackageError(f'Missing members: {", ".join(sorted(missing))}')
+
+            content_types = ContentType.objects.get_for_models(
+                                *ITEM_MODELS.values())
+            items = {item_type: [] for item_type in ITEM_MODELS}
+            contents = []
+            for module, data in zip(modules, manifest['modules']):
+                for content in data['contents']:
+                    item_type = content['type']
+                    if item_type not in ITEM_MODELS:
+                        raise PackageError(f'Unknown content type: {item_type}')
+                    model = ITEM_MODELS[item_type]
+                    item = model(owner=owner, title=content['title'])
+                    if item_type in MEDIA_FIELDS:
+                        setattr(item, MEDIA_FIELDS[item_type],
+                                stored[content['file']])
+                    else:
+                        setattr(item, ITEM_FIELDS[item_type],
+                                content[ITEM_FIELDS[item_type]])
+                    if item_type == 'video':
+                        # bulk_create() sends no pre_save signal.
+                        videos.update_embed(item)
+                    items[item_type].append(item)
+                    contents.append((Content(module=module,
+                                             content_type=content_types[model],
+                                             order=content['order']),
+                                     item))
+            for item_type, model in ITEM_MODELS.items():
+                model.objects.bulk_create(items[item_type], batch_size=500)
+            # The ids of the items are only known now.
+            for content, item in contents:
+                content.object_id = item.id
+            Content.objects.bulk_create([content for content, item in contents],
+                                        batch_size=500)
+
+            # bulk_create() sends no signals: reference the blobs of the
+            # media, refresh the number of modules shown in the catalog
+            # and resize the images.
+            blobs.add_references(
+                getattr(item, MEDIA_FIELDS[item_type]).name
+                for item_type in MEDIA_FIELDS for item in items[item_type])
+            catalog.invalidate_subjects(course.subject_id)
+            renditions.schedule(image.id for image in items['image'])
+            videos.schedule_thumbnails(video.id for video in items['video'])
+    except (tarfile.TarError, KeyError, TypeError) as e:
+        raise PackageError(f'Invalid package: {e!r}') from e
+    return course
+
+
+def _create_course(data, owner, slug=None):
+    slug = slug or data['slug']
+    if Course.objects.filter(slug=slug).exists():
+        raise PackageError(f'A course with the slug "{slug}" already exists')
+    subject, created = Subject.objects.get_or_create(
+                            slug=data['subject']['slug'],
+                            defaults={'title': data['subject']['title']})
+    # The search index and the typeahead are updated by the
+    # post_save signals of the course.
+    return Course.objects.create(owner=owner,
+                                 subject=subject,
+                                 title=data['title'],
+                                 slug=slug,
+                                 overview=data['overview'])
@@ -0,0 +1,63 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.core import signing
+from django.db.models import Q
+
+
+# Courses are paginated with a keyset (cursor) on (-created, id), the
+# catalog order with the primary key as a tie breaker. Each page filters
+# on the last row of the previous page instead of using OFFSET, so any
+# page costs the same as the first one.
+COURSE_KEYSET = ('-created', 'id')
+# Cursors are signed, so that only the positions of the pages sent by the
+# site are accepted: pages are cached under their cursor, and arbitrary
+# cursors would fill the cache.
+cursor_signer = signing.Signer(salt='courses.pagination.cursor')
+
+
+def encode_cursor(created, pk):
+    """
+    Return an opaque cursor pointing after the given course position.
+    """
+    value = f'{created.isoformat()}|{pk}'.encode()
+    return cursor_signer.sign(
+                base64.urlsafe_b64encode(value).decode().rstrip('='))
+
+
+def decode_cursor(cursor):
+    """
+    Return the (created, id) position encoded in the given cursor.
+    Raises ValueError if the cursor is malformed or was not made by
+    encode_cursor().
+    """
+    try:
+        cursor = cursor_signer.unsign(cursor)
+        padding = '=' * (-len(cursor) % 4)
+        value = base64.urlsafe_b64decode(cursor + padding).decode()
+        created, pk = value.split('|')
+        return datetime.fromisoformat(created), int(pk)
+    except (signing.BadSignature, binascii.Error, UnicodeDecodeError,
+            TypeError, ValueError):
+        raise ValueError(f'Invalid cursor: {cursor!r}')
+
+
+def keyset_page(queryset, cursor=None, page_size=20):
+    """
+    Return a page of courses from the given QuerySet starting after the
+    given cursor, and the cursor of the next page (None on the last page).
+    """
+    queryset = queryset.order_by(*COURSE_KEYSET)
+    if cursor:
+        created, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created__lt=created) |
+                                   Q(created=created, id__gt=pk))
+    # Fetch one extra row to know whether there is a next page.
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(last.created, last.id)
+    return items, next_cursor
@@ -0,0 +1,272 @@
+import contextvars
+import logging
+import math
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from redis.commands.core import Script
+
+logger = logging.getLogger(__name__)
+
+
+# Clients are limited with token buckets shared by every process: a
+# bucket holds at most `capacity` tokens, refilled at `rate` tokens per
+# second, and each request takes one. A client can send `capacity`
+# requests at once, then `rate` requests per second.
+#
+# With the Redis cache backend, a bucket is a hash updated by a Lua
+# script, so taking a token is atomic and costs one round trip. With
+# other cache backends, the bucket is read and written with get() and
+# set(), and concurrent requests may take the same token.
+
+# The clock of Redis is used, so the processes do not need to agree on
+# the time. replicate_commands() allows writing after reading the clock
+# before Redis 5 and does nothing afterwards.
+TOKEN_BUCKET_SCRIPT = '''
+if redis.replicate_commands then redis.replicate_commands() end
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'time')
+local tokens = tonumber(bucket[1]) or capacity
+local last = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - last) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'time', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(wait)}
+'''
+
+# A request is uncounted from the slot in which it started, unless the
+# slot expired meanwhile: DECR would create it again without an expiry.
+FINISH_REQUEST_SCRIPT = '''
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('DECR', KEYS[1])
+end
+return 0
+'''
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+
+# Close code of a WebSocket whose client sends too many messages,
+# in the range left to applications, after the HTTP status.
+CLOSE_RATE_LIMITED = 4429
+# Close code of a WebSocket refused because the server is overloaded.
+CLOSE_TRY_AGAIN_LATER = 1013
+
+# Width of the time slots in which the requests in progress are counted,
+# and number of slots summed: requests are counted for a minute at most
+# (see LoadMonitor).
+SLOT_SECONDS = 10
+IN_FLIGHT_SLOTS = 6
+
+
+def parse_rate(rate):
+    """
+    Return the capacity and the rate, in tokens per second, of a
+    bucket given as "<requests>/<period>", such as "100/min", like the
+    throttle rates of REST framework.
+    """
+    count, period = rate.split('/')
+    count = int(count)
+    return count, count / DURATIONS[period[0]]
+
+
+def _get_redis(key):
+    # Return the Redis client and the full key when the cache is
+    # Redis, or None with other cache backends.
+    backend = caches['default']
+    if isinstance(backend, RedisCache):
+        key = backend.make_key(key)
+        return backend._cache.get_client(key, write=True), key
+    return None, key
+
+
+class TokenBucket:
+    """
+    Token buckets with the given rate and capacity, one per client.
+    """
+    script = None
+
+    def __init__(self, name, rate, capacity):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+
+    @classmethod
+    def from_rate(cls, name, rate):
+        capacity, rate = parse_rate(rate)
+        return cls(name, rate, capacity)
+
+    def get_key(self, ident):
+        return f'ratelimit_{self.name}_{ident}'
+
+    def consume(self, ident, cost=1):
+        """
+        Take cost tokens from the bucket of the given client. Return
+        whether they were taken and, if not, the number of seconds to
+        wait until the bucket holds them.
+
+        Requests are allowed if the cache is unavailable: the limits
+        protect the site, they should not take it down with the cache.
+        """
+        backend = caches['default']
+        key = self.get_key(ident)
+        try:
+            if isinstance(backend, RedisCache):
+                return self._consume_redis(key, cost)
+            return self._consume_cache(backend, key, cost)
+        except Exception:
+            logger.warning('Cannot check the rate limit %s', key,
+                           exc_info=True)
+            return True, 0
+
+    def _consume_redis(self, key, cost):
+        client, key = _get_redis(key)
+        if TokenBucket.script is None:
+            TokenBucket.script = Script(client, TOKEN_BUCKET_SCRIPT)
+        allowed, wait = TokenBucket.script(
+            keys=[key],
+            args=[self.rate, self.capacity, cost],
+            client=client)
+        return bool(allowed), float(wait)
+
+    def _consume_cache(self, backend, key, cost):
+        now = time.time()
+        tokens, last = backend.get(key) or (self.capacity, now)
+        tokens = min(self.capacity, tokens + max(0, now - last) * self.rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        backend.set(key, (tokens, now),
+                    math.ceil(self.capacity / self.rate) + 1)
+        if allowed:
+            return True, 0
+        return False, (cost - tokens) / self.rate
+
+
+class LoadMonitor:
+    """
+    Requests in progress on the whole site, the requests of the API and
+    the chat and the chat messages, and the moving average of their
+    duration in the current process, to shed load before the workers
+    are saturated.
+
+    The site is overloaded when more than max_in_flight requests are in
+    progress. When the average duration exceeds max_latency, a process
+    sheds a share of the requests growing with the excess: half of them
+    at twice max_latency. The requests still admitted keep the average
+    up to date, so it comes down once the spike is over.
+
+    With Redis, the requests are counted in the slot of SLOT_SECONDS
+    seconds in which they started, and the requests in progress are the
+    sum of the last IN_FLIGHT_SLOTS slots: the requests of a process
+    that stopped before finishing them are forgotten when their slot
+    expires. With other cache backends, the requests are counted by
+    each process, and max_in_flight applies to every process.
+    """
+    in_flight_key = 'ratelimit_in_flight'
+    finish_script = None
+
+    def __init__(self, max_in_flight, max_latency, smoothing=0.1):
+        self.max_in_flight = max_in_flight
+        self.max_latency = max_latency
+        self.smoothing = smoothing
+        self.local_in_flight = 0
+        self.latency = 0.0
+        self.lock = threading.Lock()
+        # Requests in progress when the current request started.
+        self.current = contextvars.ContextVar('in_flight', default=None)
+
+    def _slot_keys(self):
+        slot = int(time.time()) // SLOT_SECONDS
+        return [f'{self.in_flight_key}_{slot - offset}'
+                for offset in range(IN_FLIGHT_SLOTS)]
+
+    def start(self):
+        """
+        Count a new request and return the value to pass to finish().
+        """
+        started = time.monotonic()
+        keys = self._slot_keys()
+        client, key = _get_redis(keys[0])
+        if client is not None:
+            try:
+                with client.pipeline(transaction=False) as pipe:
+                    pipe.incr(key)
+                    pipe.expire(key, SLOT_SECONDS * IN_FLIGHT_SLOTS)
+                    pipe.mget([_get_redis(name)[1] for name in keys])
+                    *_, counts = pipe.execute()
+                self.current.set(sum(int(count or 0) for count in counts))
+                return started, client, key
+            except Exception:
+                logger.warning('Cannot count the requests in progress',
+                               exc_info=True)
+        with self.lock:
+            self.local_in_flight += 1
+            self.current.set(self.local_in_flight)
+        return started, None, None
+
+    def finish(self, token):
+        started, client, key = token
+        duration = time.monotonic() - started
+        if client is not None:
+            try:
+                if LoadMonitor.finish_script is None:
+                    LoadMonitor.finish_script = Script(client,
+                                                       FINISH_REQUEST_SCRIPT)
+                LoadMonitor.finish_script(keys=[key], client=client)
+            except Exception:
+                logger.warning('Cannot count the requests in progress',
+                               exc_info=True)
+        with self.lock:
+            if client is None:
+                self.local_in_flight -= 1
+            self.latency += self.smoothing * (duration - self.latency)
+        self.current.set(None)
+
+    def get_in_flight(self):
+        """
+        Return the number of requests in progress, as counted when the
+        current request started, if it was counted.
+        """
+        in_flight = self.current.get()
+        if in_flight is not None:
+            return in_flight
+        keys = self._slot_keys()
+        client, key = _get_redis(keys[0])
+        if client is not None:
+            try:
+                counts = client.mget([_get_redis(name)[1] for name in keys])
+                return sum(int(count or 0) for count in counts)
+            except Exception:
+                logger.warning('Cannot count the requests in progress',
+                               exc_info=True)
+        return self.local_in_flight
+
+    def overloaded(self):
+        """
+        Return whether a new request should be refused.
+        """
+        if self.get_in_flight() > self.max_in_flight:
+            return True
+        if self.latency > self.max_latency:
+            return random.random() > self.max_latency / self.latency
+        return False
+
+
+load = LoadMonitor(settings.MAX_REQUESTS_IN_FLIGHT,
+                   settings.MAX_REQUEST_LATENCY)
@@ -0,0 +1,136 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image as PILImage, ImageOps, features
+
+from . import catalog
+from .models import Image
+
+
+logger = logging.getLogger(__name__)
+
+# Widths of the resized copies of the images. Modules are 600px wide,
+# so this covers them at 1x and 2x density as well as small screens.
+RENDITION_WIDTHS = [320, 640, 960, 1280]
+RENDITION_QUALITY = 80
+RENDITION_DIR = 'images/renditions'
+
+# Renditions are generated by a background thread once the transaction
+# that saved the image commits, so that uploads are not slowed down.
+# Use "manage.py generate_renditions" for images saved by another
+# process that stopped before generating them.
+executor = ThreadPoolExecutor(max_workers=1,
+                              thread_name_prefix='renditions')
+
+
+def _output_format(image):
+    # WebP is much smaller than JPEG and PNG and supports transparency.
+    if features.check('webp'):
+        return 'WEBP', 'webp'
+    if image.mode in ('RGBA', 'LA', 'P'):
+        return 'PNG', 'png'
+    return 'JPEG', 'jpg'
+
+
+def rendition_name(source, width, extension):
+    """
+    Return the storage name of the rendition of the given width of the
+    given source file. The name only depends on the source, so that
+    generating the renditions again reuses the existing files, and the
+    source can be found from it: it is the rendition name without
+    RENDITION_DIR and the "_<width>w" suffix, with another extension.
+    """
+    stem = os.path.splitext(source)[0]
+    return f'{RENDITION_DIR}/{stem}_{width}w.{extension}'
+
+
+def generate_renditions(image, force=False):
+    """
+    Store the size of the given Image item and resized copies of its
+    file, and return True if they were generated. Renditions that
+    already exist for the current file are kept unless force is True.
+    """
+    field_file = image.image_file
+    source = field_file.name
+    if not source:
+        return False
+    if not force and image.renditions.get('source') == source:
+        return False
+    # Renditions are derived files, they are kept in the default
+    # storage and not with the files of the items.
+    storage = default_storage
+
+    with field_file.storage.open(source, 'rb') as f:
+        original = PILImage.open(f)
+        original.load()
+    # Apply the orientation of photos taken with a rotated camera.
+    original = ImageOps.exif_transpose(original)
+    width, height = original.size
+    image_format, extension = _output_format(original)
+    if image_format == 'JPEG' and original.mode != 'RGB':
+        original = original.convert('RGB')
+
+    sizes = []
+    for rendition_width in RENDITION_WIDTHS:
+        if rendition_width >= width:
+            break
+        rendition_height = max(1, round(height * rendition_width / width))
+        name = rendition_name(source, rendition_width, extension)
+        if force or not storage.exists(name):
+            resized = original.resize((rendition_width, rendition_height),
+                                      PILImage.LANCZOS)
+            buffer = io.BytesIO()
+            resized.save(buffer,
+                         image_format,
+                         quality=RENDITION_QUALITY,
+                         optimize=True)
+            if storage.exists(name):
+                storage.delete(name)
+            name = storage.save(name, ContentFile(buffer.getvalue()))
+        sizes.append({'name': name,
+                      'width': rendition_width,
+                      'height': rendition_height})
+
+    renditions = {'source': source, 'sizes': sizes}
+    # Only record them if the file was not replaced in the meantime.
+    # The item is marked as updated, as its HTML changes.
+    updated = timezone.now()
+    if Image.objects.filter(pk=image.pk, image_file=source) \
+                    .update(width=width, height=height,
+                            renditions=renditions, updated=updated):
+        catalog.invalidate_item_courses(Image, [image.pk])
+    image.width, image.height, image.renditions = width, height, renditions
+    image.updated = updated
+    return True
+
+
+def _generate(image_id):
+    close_old_connections()
+    try:
+        image = Image.objects.filter(pk=image_id).first()
+        if image is not None:
+            generate_renditions(image)
+    except Exception:
+        logger.exception('Cannot generate the renditions of image %s',
+                         image_id)
+    finally:
+        close_old_connections()
+
+
+def schedule(image_ids):
+    """
+    Generate the renditions of the given images in the background
+    once the current transaction commits.
+    """
+    image_ids = list(image_ids)
+
+    def submit():
+        for image_id in image_ids:
+            executor.submit(_generate, image_id)
+    transaction.on_commit(submit)
@@ -0,0 +1,242 @@
+import re
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import Content, Course, Module, Text
+
+
+# The search index holds one document per course made of the course
+# title and overview, the titles and descriptions of its modules and
+# the content of its text items. It is stored in a table maintained
+# outside of the ORM (see migration 0007): an FTS5 virtual table on
+# SQLite and a tsvector column with a GIN index on PostgreSQL.
+SEARCH_TABLE = 'courses_search'
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+WORD_RE = re.compile(r'\w+')
+
+
+def _within(column, queryset):
+    # The condition restricting the matches to the courses of the given
+    # QuerySet, as a subquery, so that the limit applies to them.
+    if queryset is None:
+        return '', ()
+    sql, params = queryset.values('id').query.sql_with_params()
+    return f' AND {column} IN ({sql})', params
+
+
+class SQLiteSearchBackend:
+    # bm25() weights of the title, overview, modules and texts columns
+    weights = (10.0, 4.0, 2.0, 1.0)
+
+    def delete(self, cursor, course_ids):
+        cursor.execute(
+            f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN '
+            f'({", ".join(["%s"] * len(course_ids))})',
+            list(course_ids))
+
+    def index(self, cursor, documents):
+        # FTS5 tables have no unique constraint to upsert on,
+        # so the old documents are deleted first.
+        self.delete(cursor, [doc['id'] for doc in documents])
+        # One statement per document rather than executemany(), which
+        # the cursor wrappers of debugging tools do not all support.
+        for doc in documents:
+            cursor.execute(
+                f'INSERT INTO {SEARCH_TABLE} '
+                f'(rowid, title, overview, modules, texts) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                [doc['id'], doc['title'], doc['overview'],
+                 doc['modules'], doc['texts']])
+
+    def clear(self, cursor):
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+
+    def search(self, cursor, words, limit, within=None):
+        # Quote every word so that user input is never parsed as
+        # FTS5 query syntax, and match the last word as a prefix.
+        terms = [f'"{word}"' for word in words]
+        terms[-1] += '*'
+        weights = ', '.join(str(weight) for weight in self.weights)
+        where, params = _within('rowid', within)
+        cursor.execute(
+            f'SELECT rowid FROM {SEARCH_TABLE} '
+            f'WHERE {SEARCH_TABLE} MATCH %s{where} '
+            f'ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT %s',
+            [' '.join(terms), *params, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+class PostgreSQLSearchBackend:
+    config = 'english'
+
+    def delete(self, cursor, course_ids):
+        cursor.execute(
+            f'DELETE FROM {SEARCH_TABLE} WHERE course_id = ANY(%s)',
+            [list(course_ids)])
+
+    def index(self, cursor, documents):
+        for doc in documents:
+            cursor.execute(
+                f'INSERT INTO {SEARCH_TABLE} (course_id, document) VALUES '
+                f'(%s, setweight(to_tsvector(%s, %s), \'A\') || '
+                f'setweight(to_tsvector(%s, %s), \'B\') || '
+                f'setweight(to_tsvector(%s, %s), \'C\') || '
+                f'setweight(to_tsvector(%s, %s), \'D\')) '
+                f'ON CONFLICT (course_id) '
+                f'DO UPDATE SET document = EXCLUDED.document',
+                [doc['id'],
+                 self.config, doc['title'],
+                 self.config, doc['overview'],
+                 self.config, doc['modules'],
+                 self.config, doc['texts']])
+
+    def clear(self, cursor):
+        cursor.execute(f'TRUNCATE {SEARCH_TABLE}')
+
+    def search(self, cursor, words, limit, within=None):
+        where, params = _within('course_id', within)
+        cursor.execute(
+            f'SELECT course_id FROM {SEARCH_TABLE}, '
+            f'plainto_tsquery(%s, %s) query '
+            f'WHERE document @@ query{where} '
+            f'ORDER BY ts_rank(document, query) DESC LIMIT %s',
+            [self.config, ' '.join(words), *params, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgreSQLSearchBackend,
+}
+
+
+def get_backend():
+    """
+    Return the search backend of the default database, or None
+    if the database has no full-text index support.
+    """
+    backend_class = BACKENDS.get(connection.vendor)
+    return backend_class() if backend_class else None
+
+
+def build_documents(course_ids):
+    """
+    Return the search documents of the given courses. The text of all
+    the courses is gathered with a fixed number of queries.
+    """
+    documents = {
+        course['id']: {**course, 'modules': [], 'texts': []}
+        for course in Course.objects.filter(id__in=course_ids)
+                                    .values('id', 'title', 'overview')
+    }
+    for course_id, title, description in Module.objects.filter(
+            course_id__in=documents).values_list('course_id',
+                                                 'title',
+                                                 'description'):
+        documents[course_id]['modules'] += [title, description]
+
+    text_contents = Content.objects.filter(
+        module__course_id__in=documents,
+        content_type=ContentType.objects.get_for_model(Text),
+    ).values_list('object_id', 'module__course_id')
+    text_courses = {}
+    for object_id, course_id in text_contents:
+        text_courses.setdefault(object_id, []).append(course_id)
+    for text_id, content in Text.objects.filter(
+            id__in=text_courses).values_list('id', 'content'):
+        for course_id in text_courses[text_id]:
+            documents[course_id]['texts'].append(content)
+
+    for document in documents.values():
+        document['modules'] = '\n'.join(document['modules'])
+        document['texts'] = '\n'.join(document['texts'])
+    return list(documents.values())
+
+
+def reindex_courses(course_ids):
+    """
+    Update the search documents of the given courses. Courses that no
+    longer exist are removed from the index.
+    """
+    backend = get_backend()
+    course_ids = set(course_ids)
+    if backend is None or not course_ids:
+        return
+    documents = build_documents(course_ids)
+    missing = course_ids - {doc['id'] for doc in documents}
+    with transaction.atomic(), connection.cursor() as cursor:
+        if missing:
+            backend.delete(cursor, missing)
+        if documents:
+            backend.index(cursor, documents)
+
+
+def schedule_reindex(course_ids):
+    """
+    Reindex the given courses once the current transaction commits.
+    """
+    course_ids = [course_id for course_id in course_ids if course_id]
+    if course_ids:
+        transaction.on_commit(lambda: reindex_courses(course_ids))
+
+
+def rebuild_index(batch_size=1000):
+    """
+    Rebuild the whole search index in batches of courses.
+    Return the number of indexed courses.
+    """
+    backend = get_backend()
+    if backend is None:
+        return 0
+    total = 0
+    course_ids = Course.objects.order_by('id').values_list('id', flat=True)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            backend.clear(cursor)
+        last_id = 0
+        while True:
+            batch = list(course_ids.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            documents = build_documents(batch)
+            with connection.cursor() as cursor:
+                backend.index(cursor, documents)
+            total += len(documents)
+            last_id = batch[-1]
+    return total
+
+
+def search_courses(query, limit=SEARCH_LIMIT, queryset=None):
+    """
+    Return a list of the courses matching the given query, most
+    relevant first. The courses are fetched from the given QuerySet
+    so that callers can add annotations and related objects, and only
+    the courses it selects are searched.
+    """
+    if queryset is None:
+        queryset = Course.objects.all()
+    words = WORD_RE.findall(query.lower())
+    if not words:
+        return []
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    backend = get_backend()
+    if backend is None:
+        # No full-text support: fall back to matching every word
+        # in the course title or overview.
+        qs = queryset
+        for word in words:
+            qs = qs.filter(Q(title__icontains=word) |
+                           Q(overview__icontains=word))
+        return list(qs[:limit])
+    # Filters of the QuerySet are applied in the search query itself,
+    # so that filtering does not drop matches from the limit.
+    within = queryset if queryset.query.has_filters() else None
+    with connection.cursor() as cursor:
+        course_ids = backend.search(cursor, words, limit, within)
+    courses = queryset.in_bulk(course_ids)
+    return [courses[course_id] for course_id in course_ids
+            if course_id in courses]
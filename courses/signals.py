@@ -0,0 +1,258 @@
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import (blobs, catalog, enrollment, media, renditions, search,
+               typeahead, videos)
+from .api import authentication
+from .models import (APIToken, Content, Course, File, Image, Module, Subject,
+                     Text, Video)
+
+
+@receiver(pre_save, sender=Course)
+def remember_course_subject(sender, instance, **kwargs):
+    # Keep the subject the course belonged to before this save, so
+    # moving a course to another subject invalidates both lists.
+    instance._previous_subject_id = None
+    if instance.pk:
+        instance._previous_subject_id = Course.objects.filter(
+            pk=instance.pk).values_list('subject_id', flat=True).first()
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_course_catalog(sender, instance, **kwargs):
+    catalog.invalidate_subjects(instance.subject_id,
+                                getattr(instance, '_previous_subject_id', None))
+
+
+@receiver(post_save, sender=Module)
+@receiver(post_delete, sender=Module)
+def invalidate_module_catalog(sender, instance, **kwargs):
+    # The catalog shows the number of modules of each course.
+    subject_id = Course.objects.filter(
+        pk=instance.course_id).values_list('subject_id', flat=True).first()
+    catalog.invalidate_subjects(subject_id)
+
+
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+def invalidate_subject_catalog(sender, instance, **kwargs):
+    catalog.invalidate_subjects(instance.id)
+    # The pages of the courses show the subject.
+    catalog.invalidate_courses(*Course.objects.filter(
+        subject_id=instance.id).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def reindex_course(sender, instance, **kwargs):
+    search.schedule_reindex([instance.id])
+
+
+@receiver(post_save, sender=Module)
+@receiver(post_delete, sender=Module)
+def reindex_module_course(sender, instance, **kwargs):
+    search.schedule_reindex([instance.course_id])
+
+
+@receiver(post_save, sender=Content)
+@receiver(post_delete, sender=Content)
+def reindex_content_course(sender, instance, **kwargs):
+    # Only text items are part of the search documents.
+    if instance.content_type_id == ContentType.objects.get_for_model(Text).id:
+        search.schedule_reindex(Module.objects.filter(
+            id=instance.module_id).values_list('course_id', flat=True))
+
+
+@receiver(post_save, sender=Text)
+def reindex_text_courses(sender, instance, **kwargs):
+    search.schedule_reindex(Content.objects.filter(
+        content_type=ContentType.objects.get_for_model(Text),
+        object_id=instance.id).values_list('module__course_id', flat=True))
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Subject)
+def update_typeahead(sender, instance, **kwargs):
+    kind = sender._meta.model_name
+    transaction.on_commit(lambda: typeahead.index.update(
+        kind, instance.id, instance.title, instance.slug))
+
+
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Subject)
+def remove_typeahead(sender, instance, **kwargs):
+    kind, pk = sender._meta.model_name, instance.id
+    transaction.on_commit(lambda: typeahead.index.remove(kind, pk))
+
+
+@receiver(post_save, sender=Image)
+def generate_image_renditions(sender, instance, **kwargs):
+    # Only when the file changed: generating the renditions
+    # saves the image again with update(), without signals.
+    if instance.renditions.get('source') != instance.image_file.name:
+        renditions.schedule([instance.id])
+
+
+@receiver(pre_save, sender=File)
+@receiver(pre_save, sender=Image)
+def remember_item_file(sender, instance, **kwargs):
+    # Keep the file the item had before this save, to move
+    # the reference to the new one.
+    field = blobs.get_field_name(sender)
+    instance._previous_file = None
+    if instance.pk:
+        instance._previous_file = sender.objects.filter(
+            pk=instance.pk).values_list(field, flat=True).first()
+
+
+@receiver(post_save, sender=File)
+@receiver(post_save, sender=Image)
+def reference_item_file(sender, instance, **kwargs):
+    name = getattr(instance, blobs.get_field_name(sender)).name
+    previous = getattr(instance, '_previous_file', None)
+    if name != previous:
+        blobs.add_references([name])
+        blobs.remove_references([previous])
+
+
+@receiver(post_delete, sender=File)
+@receiver(post_delete, sender=Image)
+def dereference_item_file(sender, instance, **kwargs):
+    blobs.remove_references(
+        [getattr(instance, blobs.get_field_name(sender)).name])
+
+
+def _forget_media(names):
+    names = list(names)
+    transaction.on_commit(lambda: media.forget_file_courses(names))
+
+
+@receiver(post_save, sender=File)
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=File)
+@receiver(post_delete, sender=Image)
+def forget_item_media(sender, instance, **kwargs):
+    # The courses cached for the file, and for the file it replaced.
+    _forget_media([getattr(instance, blobs.get_field_name(sender)).name,
+                   getattr(instance, '_previous_file', None)])
+
+
+@receiver(post_save, sender=Content)
+@receiver(post_delete, sender=Content)
+def forget_content_media(sender, instance, **kwargs):
+    model = ContentType.objects.get_for_id(instance.content_type_id) \
+                              .model_class()
+    if model in (File, Image):
+        _forget_media(model.objects.filter(pk=instance.object_id)
+                                   .values_list(blobs.get_field_name(model),
+                                                flat=True))
+
+
+@receiver(pre_save, sender=Video)
+def resolve_video_embed(sender, instance, **kwargs):
+    # Only resolve new URLs.
+    instance._url_changed = instance.resolved_url != instance.url
+    if instance._url_changed:
+        videos.update_embed(instance)
+
+
+@receiver(post_save, sender=Video)
+def fetch_video_thumbnail(sender, instance, **kwargs):
+    # The provider is called in the background, after the commit.
+    if getattr(instance, '_url_changed', False):
+        videos.schedule_thumbnails([instance.id])
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_course_contents(sender, instance, **kwargs):
+    catalog.invalidate_courses(instance.id)
+
+
+@receiver(post_save, sender=Module)
+@receiver(post_delete, sender=Module)
+def invalidate_module_contents(sender, instance, **kwargs):
+    catalog.invalidate_courses(instance.course_id)
+
+
+@receiver(post_save, sender=Content)
+@receiver(post_delete, sender=Content)
+def invalidate_content_contents(sender, instance, **kwargs):
+    catalog.invalidate_courses(*Module.objects.filter(
+        id=instance.module_id).values_list('course_id', flat=True))
+
+
+@receiver(post_save, sender=Text)
+@receiver(post_save, sender=Video)
+@receiver(post_save, sender=File)
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Text)
+@receiver(post_delete, sender=Video)
+@receiver(post_delete, sender=File)
+@receiver(post_delete, sender=Image)
+def invalidate_item_contents(sender, instance, **kwargs):
+    catalog.invalidate_item_courses(sender, [instance.id])
+
+
+@receiver(post_delete, sender=APIToken)
+def forget_api_token(sender, instance, **kwargs):
+    authentication.forget_tokens([instance.key_hash])
+
+
+@receiver(post_save, sender=User)
+def forget_user_api_tokens(sender, instance, created, update_fields=None,
+                           **kwargs):
+    # The user is cached with the tokens, for example
+    # a deactivated user must not be authenticated.
+    # Logging in only saves the last login date.
+    if not created and update_fields != frozenset(['last_login']):
+        authentication.forget_tokens(APIToken.objects.filter(
+            user=instance).values_list('key_hash', flat=True))
+
+
+@receiver(m2m_changed, sender=Course.students.through)
+def update_enrollment_cache(sender, instance, action, reverse, pk_set,
+                            **kwargs):
+    # With reverse, the instance is a user and pk_set the ids of
+    # courses, otherwise the instance is a course and pk_set the ids
+    # of users.
+    if action == 'pre_clear':
+        # The ids are not sent with the clear signals.
+        field, other = ('user_id', 'course_id') if reverse \
+                       else ('course_id', 'user_id')
+        instance._cleared_enrollment_ids = set(sender.objects.filter(
+            **{field: instance.pk}).values_list(other, flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_enrollment_ids', set())
+    elif action not in ('post_add', 'post_remove'):
+        return
+    if not pk_set:
+        return
+    user_ids, course_ids = ([instance.pk], list(pk_set)) if reverse \
+                           else (list(pk_set), [instance.pk])
+    if action == 'post_add':
+        changes = {'added': course_ids}
+    else:
+        changes = {'removed': course_ids}
+    # Once committed, so that other processes loading the
+    # enrollments from the database find the change.
+    transaction.on_commit(
+        lambda: enrollment.update_enrollments(user_ids, **changes))
+
+
+@receiver(pre_delete, sender=Course)
+def remove_course_enrollments(sender, instance, **kwargs):
+    # The enrollments are deleted with the course,
+    # without m2m_changed signals.
+    user_ids = list(Course.students.through.objects.filter(
+        course_id=instance.pk).values_list('user_id', flat=True))
+    if user_ids:
+        course_id = instance.pk
+        transaction.on_commit(lambda: enrollment.update_enrollments(
+            user_ids, removed=[course_id]))
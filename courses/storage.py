@@ -0,0 +1,108 @@
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+# Files are stored once per distinct content, under the SHA-256 of their
+# bytes, in BLOB_DIR. The names saved in the database keep the upload
+# directory and the original filename around the hash, for example
+# "files/<sha256>/lecture.pdf", so that downloads keep their name while
+# identical uploads, and the items of cloned courses, share one blob.
+BLOB_DIR = 'blobs'
+HASH_RE = re.compile(r'(?:^|/)(?P<hash>[0-9a-f]{64})/[^/]+$')
+READ_SIZE = 64 * 1024
+
+
+def get_hash(name):
+    """
+    Return the hash of the blob of the given file name, or None for
+    the names of files stored before the blobs.
+    """
+    match = HASH_RE.search(name or '')
+    return match.group('hash') if match else None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage keeping a single copy of identical files.
+
+    Deleting a file through the storage does nothing, since its blob may
+    be used by other files: unused blobs are removed by
+    "manage.py collect_blobs" according to their reference counts
+    (see courses/blobs.py). Names without a hash are served from their
+    own path, like with FileSystemStorage.
+    """
+
+    def blob_path(self, digest):
+        return os.path.join(self.location, BLOB_DIR, digest[:2], digest)
+
+    def path(self, name):
+        digest = get_hash(name)
+        if digest:
+            return self.blob_path(digest)
+        return super().path(name)
+
+    def get_available_name(self, name, max_length=None):
+        # Names do not need to be unique, only the blobs. Keep room
+        # for the hash that is added to the name when saving.
+        dir_name, file_name = os.path.split(name)
+        if max_length is not None:
+            room = max_length - len(dir_name) - 66
+            root, ext = os.path.splitext(file_name)
+            if room < len(ext) + 1:
+                raise ValueError(f'The name "{name}" is too long')
+            if len(file_name) > room:
+                file_name = root[:room - len(ext)] + ext
+        return os.path.join(dir_name, file_name)
+
+    def _save(self, name, content):
+        blob_dir = os.path.join(self.location, BLOB_DIR)
+        os.makedirs(blob_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        if hasattr(content, 'temporary_file_path'):
+            # The file is already on disk: hash it and move it.
+            with open(content.temporary_file_path(), 'rb') as f:
+                for data in iter(lambda: f.read(READ_SIZE), b''):
+                    digest.update(data)
+            fd, temp_path = tempfile.mkstemp(dir=blob_dir, suffix='.tmp')
+            os.close(fd)
+            file_move_safe(content.temporary_file_path(), temp_path,
+                           allow_overwrite=True)
+        else:
+            fd, temp_path = tempfile.mkstemp(dir=blob_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    f.write(chunk)
+        digest = digest.hexdigest()
+
+        path = self.blob_path(digest)
+        if os.path.exists(path):
+            # Stored already: touch it, so that it is not collected
+            # before the item using it is saved.
+            os.remove(temp_path)
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+            if self.file_permissions_mode is not None:
+                os.chmod(path, self.file_permissions_mode)
+        dir_name, file_name = os.path.split(name)
+        return os.path.join(dir_name, digest, file_name).replace('\\', '/')
+
+    def delete(self, name):
+        if get_hash(name) is None:
+            super().delete(name)
+
+
+blob_storage = ContentAddressedStorage()
+
+
+def get_blob_storage():
+    return blob_storage
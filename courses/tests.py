@@ -1,3 +1,1778 @@
-from django.test import TestCase
+import base64
+import hashlib
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, Permission, User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image as PILImage
+from rest_framework.settings import api_settings
+
+from . import (blobs, catalog, cloning, contents, enrollment, facets, media,
+               ordering, packages, ratelimit, renditions, search, typeahead,
+               uploads, videos)
+from .api.authentication import (get_token_user, hash_token, issue_token,
+                                 local_tokens, token_cache_key)
+from .api.pagination import CourseCursorPagination
+from .api.streaming import StreamingJSONRenderer
+from .api.views import SubjectListView
+from .pagination import keyset_page
+from .models import (APIToken, Blob, Content, Course, File, Image, Module,
+                     Subject, Text, Upload, Video)
+from .storage import get_hash
+
+
+# The tests use the local memory cache instead of Redis.
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+def thumbnail_offline(url):
+    # Thumbnails of the videos of the tests, without network calls.
+    return f'https://img.example.com/{url.rsplit("=", 1)[-1]}.jpg'
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CoursesTestCase(TestCase):
+    """
+    Start every test with empty caches, an instructor and a subject.
+    """
+
+    def setUp(self):
+        cache.clear()
+        local_tokens.clear()
+        enrollment.local_enrollments.clear()
+        self.owner = User.objects.create_user('instructor',
+                                              password='password')
+        self.subject = Subject.objects.create(title='Mathematics',
+                                              slug='mathematics')
+
+    def create_course(self, title='Algebra', slug=None, **kwargs):
+        kwargs.setdefault('owner', self.owner)
+        kwargs.setdefault('subject', self.subject)
+        kwargs.setdefault('overview', f'Overview of {title}')
+        return Course.objects.create(title=title,
+                                     slug=slug or title.lower()
+                                                       .replace(' ', '-'),
+                                     **kwargs)
+
+    def create_module(self, course, title='Module', **kwargs):
+        return Module.objects.create(course=course, title=title, **kwargs)
+
+    def create_content(self, module, model=Text, **fields):
+        fields.setdefault('owner', self.owner)
+        fields.setdefault('title', f'{model.__name__} item')
+        if model is Text:
+            fields.setdefault('content', 'Some text')
+        elif model is Video:
+            fields.setdefault('url', 'https://www.youtube.com/watch?v=abc')
+        item = model.objects.create(**fields)
+        return Content.objects.create(module=module, item=item)
+
+    def authorize(self, user):
+        # Headers of the API requests of the given user.
+        token, key = issue_token(user)
+        return {'HTTP_AUTHORIZATION': f'Token {key}'}
+
+    def get_json(self, response):
+        # The lists of the API are streamed.
+        if response.streaming:
+            return json.loads(b''.join(response.streaming_content))
+        return response.json()
+
+
+class MediaTestCase(CoursesTestCase):
+    """
+    Store the media files and the chunked uploads of every test in a
+    temporary directory.
+    """
+
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        media_settings = override_settings(
+                            MEDIA_ROOT=os.path.join(root, 'media'),
+                            CHUNKED_UPLOAD_DIR=os.path.join(root, 'uploads'))
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def create_file(self, module, data=b'%PDF-1.4 notes', name='notes.pdf',
+                    **fields):
+        return self.create_content(module, File,
+                                   pdf_file=ContentFile(data, name=name),
+                                   **fields)
+
+    def create_image(self, module, size=(1000, 500), name='photo.png',
+                     **fields):
+        buffer = io.BytesIO()
+        PILImage.new('RGB', size, 'teal').save(buffer, 'PNG')
+        return self.create_content(module, Image,
+                                   image_file=ContentFile(buffer.getvalue(),
+                                                          name=name),
+                                   **fields)
+
+
+class CatalogTests(CoursesTestCase):
+
+    def test_cached_page_takes_no_query(self):
+        self.create_course()
+        courses, _ = catalog.get_courses()
+        with self.assertNumQueries(0):
+            cached, _ = catalog.get_courses()
+        self.assertEqual([course.id for course in cached],
+                         [course.id for course in courses])
+
+    def test_changes_invalidate_the_pages(self):
+        course = self.create_course()
+        catalog.get_courses()
+        catalog.get_courses(self.subject)
+        other = self.create_course('Geometry')
+        self.assertEqual([c.id for c in catalog.get_courses()[0]],
+                         [other.id, course.id])
+        self.assertEqual(len(catalog.get_courses(self.subject)[0]), 2)
+        self.create_module(course)
+        courses, _ = catalog.get_courses()
+        self.assertEqual(courses[1].total_modules, 1)
+
+    def test_pages_follow_the_cursor(self):
+        ids = [self.create_course(f'Course {number}').id
+               for number in range(5)]
+        first, cursor = catalog.get_courses(page_size=3)
+        second, last_cursor = catalog.get_courses(cursor=cursor, page_size=3)
+        self.assertIsNone(last_cursor)
+        self.assertEqual(sorted(c.id for c in first + second), ids)
+
+    def test_owner_is_loaded_without_password(self):
+        self.create_course()
+        courses, _ = catalog.get_courses()
+        self.assertIn('password', courses[0].owner.get_deferred_fields())
+
+    def test_invalid_cursor_is_rejected(self):
+        self.create_course()
+        self.create_course('Geometry')
+        response = self.client.get(reverse('course_list'),
+                                   {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        _, cursor = catalog.get_courses(page_size=1)
+        with self.assertRaises(ValueError):
+            catalog.get_courses(cursor=cursor[:-1] + 'x')
+
+
+class PaginationTests(CoursesTestCase):
+
+    def test_ties_on_created_are_broken_by_id(self):
+        ids = [self.create_course(f'Course {number}').id
+               for number in range(5)]
+        Course.objects.update(created=timezone.now())
+        seen, cursor = [], None
+        while True:
+            page, cursor = keyset_page(Course.objects.all(), cursor, 2)
+            seen += [course.id for course in page]
+            if cursor is None:
+                break
+        self.assertEqual(seen, ids)
+
+    @mock.patch.object(CourseCursorPagination, 'page_size', 2)
+    def test_api_follows_the_next_link(self):
+        ids = [self.create_course(f'Course {number}').id
+               for number in range(3)]
+        data = self.get_json(self.client.get('/api/courses/'))
+        self.assertEqual(len(data['results']), 2)
+        last = self.get_json(self.client.get(data['next']))
+        self.assertIsNone(last['next'])
+        self.assertEqual(
+            sorted(course['id'] for course in data['results'] +
+                                              last['results']),
+            ids)
+
+    def test_api_rejects_invalid_cursors(self):
+        response = self.client.get('/api/courses/', {'cursor': 'abc'})
+        self.assertEqual(response.status_code, 404)
+
+
+class SearchTests(CoursesTestCase):
+
+    def create_indexed_course(self, *args, **kwargs):
+        # The index is updated once the transaction commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.create_course(*args, **kwargs)
+
+    def test_title_matches_rank_first(self):
+        overview = self.create_indexed_course('Vectors', overview='Calculus')
+        title = self.create_indexed_course('Calculus')
+        self.assertEqual(search.search_courses('calculus'), [title, overview])
+
+    def test_last_word_matches_as_prefix(self):
+        course = self.create_indexed_course('Linear algebra')
+        self.assertEqual(search.search_courses('linear alg'), [course])
+        self.assertEqual(search.search_courses('alg linear'), [])
+
+    def test_changes_are_indexed(self):
+        course = self.create_indexed_course()
+        with self.captureOnCommitCallbacks(execute=True):
+            module = self.create_module(course, description='Topology')
+        self.assertEqual(search.search_courses('topology'), [course])
+        with self.captureOnCommitCallbacks(execute=True):
+            module.delete()
+        self.assertEqual(search.search_courses('topology'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            course.delete()
+        self.assertEqual(search.search_courses('algebra'), [])
+
+    def test_filters_apply_before_the_limit(self):
+        physics = Subject.objects.create(title='Physics', slug='physics')
+        for number in range(5):
+            self.create_indexed_course(f'Mechanics {number}')
+        courses = [self.create_indexed_course(f'Physics {number}',
+                                              overview='Mechanics',
+                                              subject=physics)
+                   for number in range(3)]
+        found = search.search_courses(
+                    'mechanics', limit=3,
+                    queryset=Course.objects.filter(subject=physics))
+        self.assertEqual(sorted(course.id for course in found),
+                         [course.id for course in courses])
+
+    def test_api_search(self):
+        course = self.create_indexed_course()
+        response = self.client.get(reverse('api:course_search'),
+                                   {'q': 'algebra'})
+        self.assertEqual([c['id'] for c in self.get_json(response)],
+                         [course.id])
+        response = self.client.get(reverse('api:course_search'),
+                                   {'q': 'algebra', 'limit': 'all'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TypeaheadTests(CoursesTestCase):
+
+    def get_index(self):
+        index = typeahead.PrefixIndex()
+        index.check_interval = 0
+        index.build()
+        return index
+
+    def test_suggests_titles_by_any_word(self):
+        course = self.create_course('Éléments of Linear Algebra')
+        index = self.get_index()
+        titles = [s['title'] for s in index.suggest('ele')]
+        self.assertEqual(titles, ['Éléments of Linear Algebra'])
+        self.assertEqual(index.suggest('linear alg'),
+                         [{'type': 'course', 'id': course.id,
+                           'title': course.title, 'slug': course.slug}])
+        self.assertEqual(index.suggest('math'),
+                         [{'type': 'subject', 'id': self.subject.id,
+                           'title': 'Mathematics', 'slug': 'mathematics'}])
+        self.assertEqual(index.suggest('geometry'), [])
+
+    def test_changes_reach_the_other_processes(self):
+        index, other = self.get_index(), self.get_index()
+        index.update('course', 1000, 'Topology', 'topology')
+        with self.assertNumQueries(0):
+            self.assertEqual([s['id'] for s in other.suggest('topo')], [1000])
+        index.update('course', 1000, 'Geometry', 'geometry')
+        index.remove('subject', self.subject.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(other.suggest('topo'), [])
+            self.assertEqual([s['id'] for s in other.suggest('geo')], [1000])
+            self.assertEqual(other.suggest('math'), [])
+
+    def test_lost_change_rebuilds_the_index(self):
+        index = self.get_index()
+        self.create_course('Topology')
+        catalog.bump_version(typeahead.TYPEAHEAD_VERSION_KEY)
+        # The change may still be written by the process making it.
+        with self.assertNumQueries(0):
+            self.assertEqual(index.suggest('topo'), [])
+        with self.assertNumQueries(2):
+            self.assertEqual(len(index.suggest('topo')), 1)
+
+    def test_api_suggestions(self):
+        typeahead.index.build()
+        with self.captureOnCommitCallbacks(execute=True):
+            course = self.create_course()
+        response = self.client.get(reverse('api:autocomplete'),
+                                   {'q': 'alg'})
+        self.assertEqual([s['id'] for s in response.json()], [course.id])
+
+
+class FacetTests(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user('other', first_name='Ada',
+                                              last_name='Lovelace')
+        now = timezone.now()
+        self.recent = self.create_course('Algebra')
+        self.older = self.create_course('Geometry', owner=self.other)
+        self.create_module(self.older)
+        Course.objects.filter(pk=self.older.pk) \
+                      .update(created=now - timedelta(days=10))
+        self.oldest = self.create_course('Topology')
+        Course.objects.filter(pk=self.oldest.pk) \
+                      .update(created=now - timedelta(days=400))
+
+    def get_counts(self, filters, facet):
+        return {value['value']: value['count']
+                for value in facets.get_counts(filters)[facet]}
+
+    def test_counts_combine_the_other_facets(self):
+        filters = facets.Filters(created=['week', 'month'])
+        self.assertEqual(self.get_counts(filters, 'created'),
+                         {'week': 1, 'month': 1, 'year': 0, 'older': 1})
+        self.assertEqual(self.get_counts(filters, 'instructor'),
+                         {self.owner.id: 1, self.other.id: 1})
+        self.assertEqual(self.get_counts(filters, 'modules'),
+                         {'0': 1, '1-5': 1, '6-10': 0, '11+': 0})
+        filters = facets.Filters(instructor=[self.other.id])
+        self.assertEqual(self.get_counts(filters, 'created'),
+                         {'week': 0, 'month': 1, 'year': 0, 'older': 0})
+
+    def test_counts_come_from_one_cached_query(self):
+        filters = facets.Filters(modules=['0'])
+        # The aggregated query and the subjects.
+        with self.assertNumQueries(2):
+            facets.get_counts(filters)
+        with self.assertNumQueries(0):
+            facets.get_counts(facets.Filters(created=['older']))
+        self.create_course('Calculus')
+        self.assertEqual(self.get_counts(filters, 'modules')['0'], 3)
+
+    def test_filters_select_the_courses(self):
+        filters = facets.Filters(created=['month', 'older'], modules=['0'])
+        courses, _ = catalog.get_courses(filters=filters)
+        self.assertEqual(courses, [self.oldest])
+
+    def test_unknown_values_are_ignored(self):
+        request = RequestFactory().get('/', {'created': ['week', 'today'],
+                                             'instructor': ['1', 'x', '²'],
+                                             'modules': '100'})
+        filters = facets.Filters.from_request(request)
+        self.assertEqual(filters.created, ['week'])
+        self.assertEqual(filters.instructor, [1])
+        self.assertEqual(filters.modules, [])
+
+    def test_catalog_page_shows_the_facets(self):
+        response = self.client.get(reverse('course_list'),
+                                   {'created': 'older'})
+        self.assertEqual(list(response.context['courses']), [self.oldest])
+        self.assertContains(response, 'More than a year ago')
+        response = self.client.get(reverse('course_list'),
+                                   {'instructor': ['²', '9' * 30]})
+        self.assertEqual(response.status_code, 200)
+
+
+class ContentItemTests(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.module = self.create_module(self.create_course())
+
+    def add_contents(self, count):
+        for number in range(count):
+            self.create_content(self.module, Text)
+            self.create_content(self.module, Video)
+
+    def test_items_take_one_query_per_content_type(self):
+        self.add_contents(3)
+        with self.assertNumQueries(3):
+            titles = [content.item.title for content in
+                      Content.objects.filter(module=self.module)
+                                     .with_items()]
+        self.assertEqual(titles, ['Text item', 'Video item'] * 3)
+
+    def test_content_list_queries_do_not_grow_with_the_items(self):
+        self.client.force_login(self.owner)
+        url = reverse('module_content_list', args=[self.module.id])
+        self.add_contents(1)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.add_contents(5)
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(url)
+        self.assertContains(response, 'Video item', count=6)
+
+
+class ItemStorageTests(CoursesTestCase):
+
+    def test_items_are_read_without_join(self):
+        for model in [Text, Video, File, Image]:
+            self.assertEqual(model._meta.parents, {})
+            self.assertNotIn('JOIN', str(model.objects.all().query))
+
+    def test_verify_items_finds_dangling_contents(self):
+        module = self.create_module(self.create_course())
+        content = self.create_content(module)
+        out = StringIO()
+        call_command('verify_items', stdout=out)
+        self.assertIn('text: 1 items, 1 contents, 0 dangling',
+                      out.getvalue())
+        Text.objects.filter(pk=content.object_id).delete()
+        with self.assertRaisesMessage(CommandError, '1 contents'):
+            call_command('verify_items', stdout=StringIO())
+
+
+class OrderingTests(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course = self.create_course()
+        self.first, self.second, self.third = [
+            self.create_module(self.course, f'Module {number}')
+            for number in range(3)]
+
+    def get_titles(self):
+        return list(self.course.modules.values_list('title', flat=True))
+
+    def test_new_objects_are_added_last_with_gaps(self):
+        gap = ordering.ORDER_GAP
+        self.assertEqual([self.first.order, self.second.order,
+                          self.third.order], [gap, 2 * gap, 3 * gap])
+        # Every course has its own sequence.
+        other = self.create_module(self.create_course('Geometry'))
+        self.assertEqual(other.order, gap)
+        modules = ordering.assign_orders(
+            [Module(course=self.course, title='New') for _ in range(2)])
+        self.assertEqual([m.order for m in modules], [4 * gap, 5 * gap])
+
+    def test_move_updates_only_the_moved_row(self):
+        ordering.move(self.third, after=self.first)
+        self.assertEqual(self.get_titles(),
+                         ['Module 0', 'Module 2', 'Module 1'])
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.order, 2 * ordering.ORDER_GAP)
+        ordering.move(self.second)
+        self.assertEqual(self.get_titles(),
+                         ['Module 1', 'Module 0', 'Module 2'])
+
+    def test_move_compacts_when_the_gap_is_used_up(self):
+        Module.objects.filter(pk=self.second.pk) \
+                      .update(order=self.first.order + 1)
+        ordering.move(self.third, after=self.first)
+        self.assertEqual(self.get_titles(),
+                         ['Module 0', 'Module 2', 'Module 1'])
+        self.assertGreater(ordering.min_gap(self.course.modules.all()), 1)
+
+    def test_move_after_itself_does_nothing(self):
+        version = ordering.get_version(self.second)
+        self.assertEqual(ordering.move(self.second, after=self.second),
+                         self.second.order)
+        self.assertEqual(ordering.get_version(self.second), version)
+
+    def test_orders_above_32_bits(self):
+        # A sequence starts after the highest value of its scope.
+        course = self.create_course('Geometry')
+        self.create_module(course, order=2 ** 40)
+        self.assertEqual(self.create_module(course).order,
+                         2 ** 40 + ordering.ORDER_GAP)
+
+    def test_historical_migrations_keep_32_bit_orders(self):
+        # Migrations before 0016 create integer columns, 0016 alters them.
+        from django.db.migrations.loader import MigrationLoader
+        loader = MigrationLoader(connection)
+        state = loader.project_state(('courses', '0015_api_token'))
+        field = state.models['courses', 'module'].fields['order']
+        self.assertEqual(field.get_internal_type(), 'PositiveIntegerField')
+        state = loader.project_state(('courses', '0016_order_bigint'))
+        field = state.models['courses', 'module'].fields['order']
+        self.assertEqual(field.get_internal_type(),
+                         'PositiveBigIntegerField')
+
+
+class ReorderTests(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course = self.create_course()
+        self.modules = [self.create_module(self.course, f'Module {number}')
+                        for number in range(4)]
+        self.client.force_login(self.owner)
+
+    def post_order(self, order, version=None, url='module_order', **data):
+        data.setdefault('course', self.course.id)
+        return self.client.post(reverse(url),
+                                json.dumps({**data, 'order': order,
+                                            'version': version}),
+                                content_type='application/json')
+
+    def test_only_the_moved_objects_change(self):
+        first, second, third, fourth = self.modules
+        ordering.reorder(first, [first.pk, third.pk, fourth.pk, second.pk])
+        orders = dict(Module.objects.values_list('pk', 'order'))
+        self.assertEqual([orders[m.pk] for m in (first, third, fourth)],
+                         [m.order for m in (first, third, fourth)])
+        self.assertEqual(list(self.course.modules.values_list('pk',
+                                                              flat=True)),
+                         [first.pk, third.pk, fourth.pk, second.pk])
+
+    def test_reorder_in_one_request(self):
+        version = ordering.get_version(self.modules[0])
+        course_version = catalog.get_course_version(self.course.id)
+        order = [m.pk for m in reversed(self.modules)]
+        response = self.post_order(order, version)
+        self.assertEqual(response.json(),
+                         {'saved': 'OK', 'version': version + 1})
+        self.assertEqual(list(self.course.modules.values_list('pk',
+                                                              flat=True)),
+                         order)
+        self.assertNotEqual(catalog.get_course_version(self.course.id),
+                            course_version)
+
+    def test_outdated_version_conflicts(self):
+        version = ordering.get_version(self.modules[0])
+        ordering.move(self.modules[3])
+        response = self.post_order([m.pk for m in self.modules], version)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(),
+                         {'saved': False, 'version': version + 1})
+        self.assertEqual(self.course.modules.first(), self.modules[3])
+
+    def test_outdated_list_conflicts(self):
+        self.create_module(self.course)
+        response = self.post_order([m.pk for m in self.modules])
+        self.assertEqual(response.status_code, 409)
+
+    def test_invalid_order_is_rejected(self):
+        self.assertEqual(self.post_order(['first']).status_code, 400)
+
+    def test_body_must_be_an_object(self):
+        for url in ('module_order', 'content_order'):
+            for body in ('null', '[1, 2]', '{"course": [1]}', 'x'):
+                response = self.client.post(reverse(url), body,
+                                            content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+
+    def test_login_and_csrf_token_are_required(self):
+        order = [m.pk for m in reversed(self.modules)]
+        self.client = Client()
+        self.assertEqual(self.post_order(order).status_code, 302)
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.force_login(self.owner)
+        self.assertEqual(self.post_order(order).status_code, 403)
+        self.client.get(reverse('module_content_list',
+                                args=[self.modules[0].id]))
+        self.client.defaults['HTTP_X_CSRFTOKEN'] = \
+            self.client.cookies['csrftoken'].value
+        self.assertEqual(self.post_order(order).status_code, 200)
+
+    def test_reorder_contents(self):
+        module = self.modules[0]
+        contents = [self.create_content(module) for _ in range(3)]
+        order = [c.pk for c in reversed(contents)]
+        response = self.post_order(order, url='content_order',
+                                   module=module.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(module.contents.values_list('pk', flat=True)),
+                         order)
+
+
+class BulkDeleteTests(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.module = self.create_module(self.create_course())
+        self.client.force_login(self.owner)
+
+    def post_delete(self, ids, client=None, **extra):
+        return (client or self.client).post(
+                    reverse('module_content_bulk_delete'),
+                    json.dumps({'contents': ids}),
+                    content_type='application/json', **extra)
+
+    def test_contents_and_items_are_deleted(self):
+        texts = [self.create_content(self.module) for _ in range(3)]
+        video = self.create_content(self.module, Video)
+        response = self.post_delete([texts[0].id, texts[1].id, video.id])
+        self.assertEqual(response.json(), {'deleted': 3})
+        self.assertEqual(list(self.module.contents.all()), [texts[2]])
+        self.assertEqual(list(Text.objects.values_list('id', flat=True)),
+                         [texts[2].object_id])
+        self.assertFalse(Video.objects.exists())
+
+    def test_queries_do_not_grow_with_the_contents(self):
+        def delete(count):
+            ids = [self.create_content(self.module, model).id
+                   for _ in range(count) for model in (Text, Video)]
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(contents.delete_contents(
+                                    Content.objects.filter(id__in=ids)),
+                                 2 * count)
+            return len(queries)
+        self.assertEqual(delete(1), delete(10))
+
+    def test_contents_are_deleted_in_one_statement(self):
+        texts = Text.objects.bulk_create(
+                    [Text(owner=self.owner, title='Text', content='Text')
+                     for _ in range(600)])
+        Content.objects.bulk_create(
+            [Content(module=self.module, item=text, order=number)
+             for number, text in enumerate(texts)])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(contents.delete_contents(Content.objects.all()),
+                             600)
+        deletes = [query['sql'] for query in queries
+                   if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 2)
+        self.assertFalse(Text.objects.exists())
+
+    def test_contents_of_others_are_not_deleted(self):
+        other = User.objects.create_user('other')
+        content = self.create_content(self.module)
+        foreign = self.create_content(
+                    self.create_module(self.create_course('Geometry',
+                                                          owner=other)))
+        response = self.post_delete([content.id, foreign.id])
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Content.objects.count(), 2)
+
+    def test_login_and_csrf_token_are_required(self):
+        content = self.create_content(self.module)
+        response = self.post_delete([content.id], client=Client())
+        self.assertEqual(response.status_code, 302)
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.owner)
+        self.assertEqual(self.post_delete([content.id], client).status_code,
+                         403)
+        client.get(reverse('module_content_list', args=[self.module.id]))
+        token = client.cookies['csrftoken'].value
+        response = self.post_delete([content.id], client,
+                                    HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.json(), {'deleted': 1})
+
+
+class PackageTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course = self.create_course()
+        module = self.create_module(self.course, description='Basics')
+        self.create_content(module, Text, content='Vectors')
+        self.create_content(module, Video)
+        self.create_file(module)
+        self.create_module(self.course, 'Empty')
+        self.student = User.objects.create_user('student')
+
+    def export(self, course):
+        return io.BytesIO(b''.join(packages.export_package(course)))
+
+    def describe(self, course):
+        return [(module.title, module.description,
+                 [(content.item._meta.model_name, content.item.title)
+                  for content in module.contents.all()])
+                for module in course.modules.all()]
+
+    def test_round_trip(self):
+        course = packages.import_package(self.export(self.course),
+                                         self.student, slug='copy')
+        self.assertEqual((course.owner, course.slug, course.title),
+                         (self.student, 'copy', self.course.title))
+        self.assertEqual(self.describe(course), self.describe(self.course))
+        items = [content.item for content in
+                 Content.objects.filter(module__course=course)]
+        self.assertEqual(items[0].content, 'Vectors')
+        self.assertEqual(items[1].provider, 'youtube')
+        self.assertEqual(items[2].pdf_file.read(), b'%PDF-1.4 notes')
+        # The imported file shares the blob of the original one.
+        blob = Blob.objects.get(hash=get_hash(items[2].pdf_file.name))
+        self.assertEqual(blob.references, 2)
+
+    def test_existing_slug_is_refused(self):
+        with self.assertRaisesMessage(packages.PackageError, 'algebra'):
+            packages.import_package(self.export(self.course), self.student)
+
+    def test_invalid_packages_are_refused(self):
+        with self.assertRaises(packages.PackageError):
+            packages.import_package(io.BytesIO(b'not a package'),
+                                    self.student)
+        # An archive without the media of the manifest.
+        package = self.export(self.course)
+        truncated = io.BytesIO()
+        with tarfile.open(fileobj=package) as source, \
+                tarfile.open(fileobj=truncated, mode='w') as target:
+            manifest = source.getmember(packages.MANIFEST_NAME)
+            target.addfile(manifest, source.extractfile(manifest))
+        truncated.seek(0)
+        with self.assertRaisesMessage(packages.PackageError, 'Missing'):
+            packages.import_package(truncated, self.student, slug='copy')
+        self.assertFalse(Course.objects.filter(slug='copy').exists())
+
+    def test_failed_import_keeps_the_files(self):
+        # A file stored before the blobs, with the name the
+        # imported file has before it is saved.
+        legacy = os.path.join(settings.MEDIA_ROOT, 'files', 'notes.pdf')
+        os.makedirs(os.path.dirname(legacy), exist_ok=True)
+        with open(legacy, 'wb') as f:
+            f.write(b'legacy')
+        package = self.export(self.course)
+        self.course.delete()
+        File.objects.all().delete()
+        with mock.patch.object(Content.objects, 'bulk_create',
+                               side_effect=RuntimeError('failed')), \
+                self.assertRaisesMessage(RuntimeError, 'failed'):
+            packages.import_package(package, self.student)
+        with open(legacy, 'rb') as f:
+            self.assertEqual(f.read(), b'legacy')
+        # The blob of the imported file is left to the collection.
+        self.assertFalse(Course.objects.exists())
+        self.assertEqual(blobs.collect(grace=0), (1, len(b'%PDF-1.4 notes')))
+
+    def test_api_export_and_import(self):
+        response = self.client.get(reverse('api:course-export',
+                                           args=[self.course.id]),
+                                   **self.authorize(self.owner))
+        package = b''.join(response.streaming_content)
+        self.assertEqual(response['Content-Type'], 'application/x-tar')
+        self.student.user_permissions.add(
+            Permission.objects.get(codename='add_course'))
+        response = self.client.post(reverse('api:course_import'),
+                                    {'package': ContentFile(package,
+                                                            'algebra.tar'),
+                                     'slug': 'copy'},
+                                    **self.authorize(self.student))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.describe(Course.objects.get(slug='copy')),
+                         self.describe(self.course))
+
+
+class CloningTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course = self.create_course()
+        self.owner.user_permissions.add(
+            Permission.objects.get(codename='add_course'))
+
+    def add_module(self, count=1):
+        module = self.create_module(self.course)
+        for number in range(count):
+            self.create_content(module, Text)
+            self.create_content(module, Video)
+            self.create_file(module)
+        return module
+
+    def describe(self, course):
+        return [(module.title, module.order,
+                 [(content.item.title, content.order)
+                  for content in module.contents.all()])
+                for module in course.modules.all()]
+
+    def test_clone_copies_the_course(self):
+        self.add_module(2)
+        clone = cloning.clone_course(self.course, self.owner)
+        self.assertEqual((clone.title, clone.slug),
+                         ('Algebra (copy)', 'algebra-copy'))
+        self.assertEqual(self.describe(clone), self.describe(self.course))
+        files = File.objects.order_by('id')
+        self.assertEqual(files[0].pdf_file.name, files[2].pdf_file.name)
+        self.assertEqual(Blob.objects.get().references, 4)
+
+    def test_queries_do_not_grow_with_the_course(self):
+        def clone(count):
+            self.add_module(count)
+            with CaptureQueriesContext(connection) as queries:
+                cloning.clone_course(self.course, self.owner)
+            return len(queries)
+        self.assertEqual(clone(1), clone(5))
+
+    def test_slugs_are_numbered(self):
+        slugs = [cloning.clone_course(self.course, self.owner).slug
+                 for _ in range(3)]
+        self.assertEqual(slugs, ['algebra-copy', 'algebra-copy-2',
+                                 'algebra-copy-3'])
+
+    def test_slug_taken_by_a_concurrent_copy_is_replaced(self):
+        self.create_course('Other', slug='algebra-copy')
+        with mock.patch.object(cloning, 'get_clone_slug',
+                               side_effect=['algebra-copy',
+                                            'algebra-copy-2']):
+            clone = cloning.clone_course(self.course, self.owner)
+        self.assertEqual(clone.slug, 'algebra-copy-2')
+
+    def test_clone_views(self):
+        self.client.force_login(self.owner)
+        response = self.client.post(reverse('course_clone',
+                                            args=[self.course.id]))
+        clone = Course.objects.get(slug='algebra-copy')
+        self.assertRedirects(response,
+                             reverse('course_edit', args=[clone.id]),
+                             fetch_redirect_response=False)
+        url = reverse('api:course-clone', args=[self.course.id])
+        headers = self.authorize(self.owner)
+        response = self.client.post(url, {'slug': 'algebra-copy'}, **headers)
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {'slug': 'template',
+                                          'title': 'Template'}, **headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['title'], 'Template')
+
+
+class RenditionTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.module = self.create_module(self.create_course())
+
+    def test_renditions_are_generated_in_the_background(self):
+        with mock.patch.object(renditions.executor, 'submit') as submit, \
+                self.captureOnCommitCallbacks(execute=True):
+            image = self.create_image(self.module).item
+        submit.assert_called_once_with(renditions._generate, image.id)
+
+    def test_smaller_copies_are_generated(self):
+        image = self.create_image(self.module).item
+        self.assertEqual(image.get_renditions(), [])
+        self.assertTrue(renditions.generate_renditions(image))
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height), (1000, 500))
+        sizes = image.get_renditions()
+        self.assertEqual([(size['width'], size['height']) for size in sizes],
+                         [(320, 160), (640, 320), (960, 480)])
+        self.assertIn(', /media/images/', image.get_srcset())
+        self.assertIn(' 1000w', image.get_srcset())
+        self.assertEqual(image.get_src(), sizes[1]['url'])
+        self.assertIn('srcset=', image.render())
+        # Kept as long as the file does not change.
+        self.assertFalse(renditions.generate_renditions(image))
+
+    def test_renditions_of_a_replaced_file_are_ignored(self):
+        image = self.create_image(self.module).item
+        renditions.generate_renditions(image)
+        image.image_file = ContentFile(b'other', name='other.png')
+        image.save()
+        self.assertEqual(image.get_renditions(), [])
+        self.assertEqual(image.get_src(), image.image_file.url)
+
+    def test_small_images_have_no_renditions(self):
+        image = self.create_image(self.module, size=(200, 100)).item
+        renditions.generate_renditions(image)
+        self.assertEqual(image.get_renditions(), [])
+        self.assertEqual(image.width, 200)
+
+
+class UploadTests(MediaTestCase):
+    chunk_size = uploads.MIN_CHUNK_SIZE
+
+    def setUp(self):
+        super().setUp()
+        self.module = self.create_module(self.create_course())
+        self.data = os.urandom(self.chunk_size * 2 + 1000)
+        self.client.force_login(self.owner)
+
+    def start(self, checksum=None, model_name='file'):
+        if checksum is None:
+            checksum = hashlib.sha256(self.data).hexdigest()
+        response = self.client.post(
+            reverse('module_content_upload', args=[self.module.id,
+                                                   model_name]),
+            json.dumps({'title': 'Lecture', 'filename': 'lecture.pdf',
+                        'size': len(self.data),
+                        'chunk_size': self.chunk_size,
+                        'checksum': checksum}),
+            content_type='application/json')
+        return response
+
+    def send(self, upload_id, index, data=None, checksum=None):
+        if data is None:
+            start = index * self.chunk_size
+            data = self.data[start:start + self.chunk_size]
+        return self.client.put(
+                    reverse('upload_chunk', args=[upload_id, index]),
+                    data, content_type='application/octet-stream',
+                    HTTP_X_CHUNK_CHECKSUM=checksum or
+                                          hashlib.sha256(data).hexdigest())
+
+    def complete(self, upload_id):
+        return self.client.post(reverse('upload_complete',
+                                        args=[upload_id]))
+
+    def test_interrupted_upload_is_resumed(self):
+        status = self.start().json()
+        self.assertEqual((status['chunks'], status['missing']), (3, [0, 1, 2]))
+        upload_id = status['id']
+        self.send(upload_id, 2)
+        self.send(upload_id, 0)
+        response = self.complete(upload_id)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['missing'], [1])
+        status = self.client.get(reverse('upload_detail',
+                                         args=[upload_id])).json()
+        self.assertEqual((status['received'], status['missing']),
+                         ([0, 2], [1]))
+        self.send(upload_id, 1)
+        # A chunk sent again is accepted.
+        self.assertEqual(self.send(upload_id, 1).status_code, 200)
+        response = self.complete(upload_id)
+        content = Content.objects.get(pk=response.json()['content'])
+        self.assertEqual(content.module, self.module)
+        self.assertEqual(content.item.title, 'Lecture')
+        self.assertEqual(content.item.pdf_file.read(), self.data)
+        self.assertFalse(Upload.objects.exists())
+        self.assertEqual(os.listdir(uploads.get_upload_dir()), [])
+
+    def test_chunk_checksum_mismatch_is_refused(self):
+        upload_id = self.start().json()['id']
+        response = self.send(upload_id, 0, checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Checksum mismatch', response.json()['error'])
+        response = self.send(upload_id, 0, data=b'short')
+        self.assertIn('must be', response.json()['error'])
+        status = self.client.get(reverse('upload_detail',
+                                         args=[upload_id])).json()
+        self.assertEqual(status['received'], [])
+
+    def test_file_checksum_mismatch_is_refused(self):
+        upload_id = self.start(checksum='0' * 64).json()['id']
+        for index in range(3):
+            self.send(upload_id, index)
+        response = self.complete(upload_id)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['error'],
+                         'Checksum mismatch for the file')
+        self.assertFalse(File.objects.exists())
+
+    def test_invalid_uploads_are_refused(self):
+        self.assertEqual(self.start(model_name='text').status_code, 400)
+        response = self.client.post(
+                    reverse('module_content_upload', args=[self.module.id,
+                                                           'file']),
+                    '[1]', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        upload_id = self.start().json()['id']
+        self.assertEqual(self.send(upload_id, 3, b'x').status_code, 400)
+        other = User.objects.create_user('other')
+        self.client.force_login(other)
+        self.assertEqual(self.send(upload_id, 0).status_code, 404)
+
+    def test_csrf_token_is_required(self):
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.force_login(self.owner)
+        self.assertEqual(self.start().status_code, 403)
+        self.client.get(reverse('module_content_create',
+                                args=[self.module.id, 'file']))
+        self.client.defaults['HTTP_X_CSRFTOKEN'] = \
+            self.client.cookies['csrftoken'].value
+        upload_id = self.start().json()['id']
+        token = self.client.defaults.pop('HTTP_X_CSRFTOKEN')
+        self.assertEqual(self.send(upload_id, 0).status_code, 403)
+        self.assertEqual(self.complete(upload_id).status_code, 403)
+        self.client.defaults['HTTP_X_CSRFTOKEN'] = token
+        for index in range(3):
+            self.assertEqual(self.send(upload_id, index).status_code, 200)
+        self.assertEqual(self.complete(upload_id).status_code, 200)
+
+    def test_expired_uploads_are_cleared(self):
+        upload = Upload.objects.get(pk=self.start().json()['id'])
+        self.client.delete(reverse('upload_detail',
+                                   args=[self.start().json()['id']]))
+        self.assertEqual(uploads.clear_expired(), 0)
+        later = timezone.now() + uploads.UPLOAD_EXPIRATION * 2
+        self.assertEqual(uploads.clear_expired(later), 1)
+        self.assertFalse(Upload.objects.exists())
+        self.assertFalse(os.path.exists(uploads.get_path(upload)))
+
+
+class MediaAccessTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course = self.create_course()
+        self.module = self.create_module(self.course)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.content = self.create_file(self.module, b'0123456789')
+        self.name = self.content.item.pdf_file.name
+        self.url = reverse('protected_media', args=[self.name])
+        self.student = User.objects.create_user('student')
+
+    def get(self, user=None, url=None, **headers):
+        if user is not None:
+            self.client.force_login(user)
+        return self.client.get(url or self.url, **headers)
+
+    def read(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_only_the_owner_and_the_students_have_access(self):
+        self.assertEqual(self.get().status_code, 403)
+        self.assertEqual(self.get(self.student).status_code, 403)
+        response = self.get(self.owner)
+        self.assertEqual(self.read(response), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.students.add(self.student)
+        self.assertEqual(self.get(self.student).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.students.remove(self.student)
+        self.assertEqual(self.get(self.student).status_code, 403)
+
+    def test_access_follows_the_contents(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.students.add(self.student)
+        self.assertEqual(self.get(self.student).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.content.delete()
+        self.assertEqual(self.get(self.student).status_code, 403)
+        with self.captureOnCommitCallbacks(execute=True):
+            Content.objects.create(module=self.module,
+                                   item=self.content.item)
+        self.assertEqual(self.get(self.student).status_code, 200)
+
+    def test_access_is_cached(self):
+        media.get_file_courses(self.name)
+        with self.assertNumQueries(0):
+            self.assertEqual(media.get_file_courses(self.name),
+                             [(self.course.id, self.owner.id)])
+
+    def test_renditions_are_served_with_their_image(self):
+        image = self.create_image(self.module).item
+        renditions.generate_renditions(image)
+        url = image.get_renditions()[0]['url']
+        self.assertEqual(self.get(self.student, url).status_code, 403)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.students.add(self.student)
+        self.assertEqual(self.get(self.student, url)['Content-Type'],
+                         'image/webp' if url.endswith('.webp')
+                         else 'image/png')
+
+    def test_ranges(self):
+        self.client.force_login(self.owner)
+        response = self.get(HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(self.read(response), b'2345')
+        self.assertEqual(self.read(self.get(HTTP_RANGE='bytes=-3')), b'789')
+        response = self.get(HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        # A range of another version of the file sends all of it.
+        response = self.get(HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_unchanged_file_is_not_sent_again(self):
+        self.client.force_login(self.owner)
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    @override_settings(MEDIA_SENDFILE=True)
+    def test_transfer_is_handed_to_the_proxy(self):
+        response = self.get(self.owner)
+        self.assertEqual(response['X-Sendfile'], media.get_path(self.name))
+        self.assertEqual(response.content, b'')
+
+
+class BlobStorageTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.module = self.create_module(self.create_course())
+
+    def get_references(self, item):
+        return Blob.objects.get(hash=get_hash(item.pdf_file.name)).references
+
+    def test_identical_files_share_a_blob(self):
+        first = self.create_file(self.module).item
+        second = self.create_file(self.module, name='copy.pdf').item
+        self.assertNotEqual(first.pdf_file.name, second.pdf_file.name)
+        self.assertTrue(second.pdf_file.name.endswith('/copy.pdf'))
+        self.assertEqual(first.pdf_file.path, second.pdf_file.path)
+        self.assertTrue(first.pdf_file.path.startswith(
+                            os.path.join(settings.MEDIA_ROOT, 'blobs')))
+        self.assertEqual(self.get_references(first), 2)
+
+    def test_replaced_file_is_released(self):
+        item = self.create_file(self.module).item
+        old = item.pdf_file.name
+        item.pdf_file = ContentFile(b'new', name='new.pdf')
+        item.save()
+        self.assertEqual(Blob.objects.get(hash=get_hash(old)).references, 0)
+        self.assertEqual(self.get_references(item), 1)
+
+    def test_bulk_delete_releases_the_blobs(self):
+        kept = self.create_file(self.module).item
+        deleted = [self.create_file(self.module),
+                   self.create_file(self.module, b'other')]
+        contents.delete_contents(Content.objects.filter(
+                                    id__in=[c.id for c in deleted]))
+        self.assertEqual(self.get_references(kept), 1)
+        self.assertEqual(self.get_references(deleted[1].item), 0)
+
+    def test_unused_blobs_are_collected(self):
+        kept = self.create_file(self.module).item
+        unused = self.create_file(self.module, b'other').item
+        path, digest = unused.pdf_file.path, get_hash(unused.pdf_file.name)
+        unused.delete()
+        # Blobs saved recently are kept.
+        self.assertEqual(blobs.collect()[0], 0)
+        self.assertEqual(blobs.collect(grace=0), (1, len(b'other')))
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(Blob.objects.filter(hash=digest).exists())
+        self.assertTrue(os.path.exists(kept.pdf_file.path))
+
+    def test_counts_are_recounted_before_collecting(self):
+        item = self.create_file(self.module).item
+        Blob.objects.update(references=0)
+        self.assertEqual(blobs.collect(grace=0), (0, 0))
+        self.assertEqual(self.get_references(item), 1)
+        self.assertTrue(os.path.exists(item.pdf_file.path))
+
+    def test_legacy_files_are_moved_to_blobs(self):
+        legacy = os.path.join(settings.MEDIA_ROOT, 'files', 'old.pdf')
+        os.makedirs(os.path.dirname(legacy))
+        with open(legacy, 'wb') as f:
+            f.write(b'legacy')
+        item = self.create_content(self.module, File,
+                                   pdf_file='files/old.pdf').item
+        name = blobs.store_legacy_file(item)
+        self.assertEqual(name, f'files/{get_hash(name)}/old.pdf')
+        item.refresh_from_db()
+        self.assertEqual(item.pdf_file.read(), b'legacy')
+        self.assertEqual(self.get_references(item), 1)
+        self.assertFalse(os.path.exists(legacy))
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='/protected/')
+    def test_proxy_is_sent_to_the_blob(self):
+        item = self.create_file(self.module).item
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('protected_media',
+                                           args=[item.pdf_file.name]))
+        digest = get_hash(item.pdf_file.name)
+        self.assertEqual(response['X-Accel-Redirect'],
+                         f'/protected/blobs/{digest[:2]}/{digest}')
+
+
+@override_settings(VIDEO_THUMBNAIL_RESOLVER='courses.tests.thumbnail_offline')
+class VideoTests(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.module = self.create_module(self.create_course())
+
+    def create_video(self, url='https://www.youtube.com/watch?v=abc'):
+        return self.create_content(self.module, Video, url=url).item
+
+    def test_embed_is_resolved_when_the_url_changes(self):
+        video = self.create_video()
+        self.assertEqual((video.provider, video.video_id),
+                         ('youtube', 'abc'))
+        self.assertIn('youtube.com/embed/abc', video.embed_html)
+        self.assertIn(video.embed_html, video.render())
+        with mock.patch('courses.videos.resolve_with_embed_video') as resolve:
+            video.title = 'Renamed'
+            video.save()
+            resolve.assert_not_called()
+            video.url = 'https://vimeo.com/123'
+            resolve.return_value = {'provider': 'vimeo', 'video_id': '123',
+                                    'embed_html': '<iframe></iframe>'}
+            video.save()
+        self.assertEqual((video.provider, video.resolved_url),
+                         ('vimeo', 'https://vimeo.com/123'))
+
+    def test_unknown_urls_are_rendered_as_links(self):
+        video = self.create_video('https://example.com/lecture')
+        self.assertEqual((video.provider, video.embed_html), ('', ''))
+        self.assertIn('href="https://example.com/lecture"', video.render())
+
+    def test_thumbnails_are_fetched_in_the_background(self):
+        with mock.patch.object(videos.executor, 'submit') as submit, \
+                self.captureOnCommitCallbacks(execute=True):
+            video = self.create_video()
+        submit.assert_called_once_with(videos._fetch, video.id)
+        self.assertTrue(videos.fetch_thumbnail(video))
+        video.refresh_from_db()
+        self.assertEqual(video.thumbnail_url,
+                         'https://img.example.com/abc.jpg')
+
+    def test_thumbnail_of_a_replaced_url_is_not_saved(self):
+        video = self.create_video()
+        Video.objects.filter(pk=video.pk).update(
+            url='https://www.youtube.com/watch?v=new')
+        self.assertFalse(videos.fetch_thumbnail(video))
+        video.refresh_from_db()
+        self.assertEqual(video.thumbnail_url, '')
+
+    def test_refresh_videos(self):
+        video = self.create_video()
+        out = StringIO()
+        call_command('refresh_videos', '--missing', stdout=out)
+        self.assertIn('Refreshed 1 videos, 0 could not be resolved',
+                      out.getvalue())
+        video.refresh_from_db()
+        self.assertEqual(video.thumbnail_url,
+                         'https://img.example.com/abc.jpg')
+
+    def test_refresh_videos_resolves_the_videos_saved_before(self):
+        # Videos saved before the embed code was stored are left
+        # unresolved by the migrations.
+        video = self.create_video()
+        Video.objects.filter(pk=video.pk).update(
+            resolved_url='', thumbnail_url='',
+            **{field: '' for field in videos.EMBED_FIELDS})
+        call_command('refresh_videos', '--missing', stdout=StringIO())
+        video.refresh_from_db()
+        self.assertEqual((video.provider, video.resolved_url),
+                         ('youtube', video.url))
+        self.assertTrue(video.embed_html)
+
+
+class ContentsAPITests(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course = self.create_course()
+        self.module = self.create_module(self.course)
+        self.text = self.create_content(self.module, Text,
+                                        content='Vectors').item
+        self.create_content(self.module, Video)
+        self.student = User.objects.create_user('student')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.students.add(self.student)
+        self.url = reverse('api:course-contents', args=[self.course.id])
+        self.headers = self.authorize(self.student)
+
+    def get(self, **headers):
+        return self.client.get(self.url, **self.headers, **headers)
+
+    def test_students_get_the_rendered_contents(self):
+        contents = self.get().json()['modules'][0]['contents']
+        self.assertEqual([content['item'] for content in contents],
+                         [self.text.render(),
+                          Video.objects.get().render()])
+        response = self.client.get(self.url,
+                                   **self.authorize(self.owner))
+        self.assertEqual(response.status_code, 403)
+
+    def test_contents_are_cached_per_course_version(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.get()
+        # The course only.
+        with self.assertNumQueries(1):
+            self.get()
+        self.assertLess(1, len(queries))
+        self.text.content = 'Matrices'
+        self.text.save()
+        contents = self.get().json()['modules'][0]['contents']
+        self.assertIn('Matrices', contents[0]['item'])
+
+    def test_unchanged_course_is_not_sent_again(self):
+        response = self.get()
+        response = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_rendered_items_are_cached(self):
+        contents.render_items([self.text])
+        with mock.patch.object(Text, 'render') as render:
+            html = contents.render_items([self.text])
+        render.assert_not_called()
+        self.assertEqual(list(html.values()), [self.text.render()])
+
+
+class CourseValidatorTests(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course = self.create_course()
+        self.url = reverse('course_detail', args=[self.course.slug])
+
+    def test_versions_increase(self):
+        key = catalog.course_version_key(self.course.id)
+        versions = [catalog.touch_version(key) for _ in range(3)]
+        self.assertEqual(versions, sorted(set(versions)))
+        # A version ahead of the clock is still increased.
+        ahead = versions[-1] + 10 ** 18
+        cache.set(key, ahead)
+        self.assertEqual(catalog.touch_version(key), ahead + 1)
+
+    def test_unchanged_course_page_is_not_rendered_again(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+                                    .status_code, 304)
+        self.create_module(self.course)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_items_change_the_version(self):
+        module = self.create_module(self.course)
+        text = self.create_content(module).item
+        version = catalog.get_course_version(self.course.id)
+        text.content = 'Changed'
+        text.save()
+        self.assertGreater(catalog.get_course_version(self.course.id),
+                           version)
+
+    def test_api_representations_have_their_own_tags(self):
+        url = reverse('api:course-detail', args=[self.course.id])
+        etag = self.client.get(url)['ETag']
+        self.assertNotEqual(self.client.get(url, {'fields': 'id'})['ETag'],
+                            etag)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                                    .status_code, 304)
+        self.course.title = 'Linear algebra'
+        self.course.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                                    .status_code, 200)
+
+
+class StreamingTests(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for title in ['Physics', 'Music', 'Biology']:
+            Subject.objects.create(title=title, slug=title.lower())
+
+    def test_chunks_are_rendered_as_one_list(self):
+        renderer = StreamingJSONRenderer()
+        content = b''.join(renderer.render_list([[1, 2], [], [{'a': 3}]]))
+        self.assertEqual(json.loads(content), [1, 2, {'a': 3}])
+        self.assertEqual(b''.join(renderer.render_list([])), b'[]')
+
+    @mock.patch.object(SubjectListView, 'stream_chunk_size', 2)
+    def test_lists_are_streamed(self):
+        response = self.client.get(reverse('api:subjects_list'))
+        self.assertTrue(response.streaming)
+        self.assertEqual(self.get_json(response),
+                         [{'id': subject.id, 'title': subject.title,
+                           'slug': subject.slug}
+                          for subject in Subject.objects.all()])
+
+    @mock.patch.object(CourseCursorPagination, 'page_size', 1)
+    def test_pages_keep_their_envelope(self):
+        course = self.create_course()
+        self.create_course('Geometry')
+        data = self.get_json(self.client.get('/api/courses/',
+                                             {'fields': 'id'}))
+        self.assertEqual(list(data), ['next', 'results'])
+        self.assertIsNotNone(data['next'])
+        self.assertEqual(data['results'], [{'id': course.id + 1}])
+
+    def test_browsable_api_is_not_streamed(self):
+        response = self.client.get(reverse('api:subjects_list'),
+                                   HTTP_ACCEPT='text/html')
+        self.assertFalse(response.streaming)
+        self.assertContains(response, 'Physics')
+
+
+class SparseFieldsTests(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course = self.create_course()
+        self.create_module(self.course, 'Numbers')
+
+    def test_fields_are_selected(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.get_json(self.client.get(
+                '/api/courses/', {'fields': 'id,title'}))
+        self.assertEqual(data['results'],
+                         [{'id': self.course.id, 'title': 'Algebra'}])
+        # The modules are not prefetched and
+        # the overview is not loaded.
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('overview', queries[0]['sql'])
+
+    def test_related_objects_are_expanded(self):
+        data = self.get_json(self.client.get(
+            f'/api/courses/{self.course.id}/',
+            {'fields': 'id', 'expand': 'subject,modules'}))
+        self.assertEqual(data, {
+            'id': self.course.id,
+            'subject': {'id': self.subject.id, 'title': 'Mathematics',
+                        'slug': 'mathematics'},
+            'modules': [{'order': 1024, 'title': 'Numbers',
+                         'description': ''}],
+        })
+        data = self.get_json(self.client.get(
+            reverse('api:subjects_detail', args=[self.subject.id]),
+            {'expand': 'courses'}))
+        self.assertEqual(data['courses'], [
+            {'id': self.course.id, 'title': 'Algebra', 'slug': 'algebra'}])
+
+    def test_subject_courses_need_expanding(self):
+        data = self.get_json(self.client.get(
+            reverse('api:subjects_detail', args=[self.subject.id])))
+        self.assertNotIn('courses', data)
+
+    def test_all_fields_by_default(self):
+        data = self.get_json(self.client.get(
+            f'/api/courses/{self.course.id}/'))
+        self.assertEqual(data['subject'], self.subject.id)
+        self.assertEqual(data['modules'][0]['title'], 'Numbers')
+        self.assertIn('overview', data)
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get('/api/courses/',
+                                   {'fields': 'id,secret',
+                                    'expand': 'owner'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get_json(response), {
+            'fields': 'Unknown fields: secret',
+            'expand': 'Cannot expand: owner',
+        })
+
+
+class BatchEnrollTests(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.student = User.objects.create_user('student',
+                                                password='password')
+        self.algebra = self.create_course()
+        self.geometry = self.create_course('Geometry')
+        self.algebra.students.add(self.student)
+
+    def test_enroll(self):
+        self.assertFalse(enrollment.is_enrolled(self.student,
+                                                self.geometry.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            results = enrollment.enroll(
+                self.student,
+                [self.geometry.id, self.algebra.id, 0, self.geometry.id])
+        self.assertEqual(results, {
+            self.geometry.id: enrollment.ENROLLED,
+            self.algebra.id: enrollment.ALREADY_ENROLLED,
+            0: enrollment.NOT_FOUND,
+        })
+        self.assertQuerysetEqual(self.student.courses_joined.order_by('id'),
+                                 [self.algebra, self.geometry])
+        # The signal updated the enrollment cache.
+        self.assertTrue(enrollment.is_enrolled(self.student,
+                                               self.geometry.id))
+
+    def test_api(self):
+        response = self.client.post(
+            '/api/courses/enroll/',
+            {'courses': [self.algebra.id, self.geometry.id, 0]},
+            content_type='application/json',
+            **self.authorize(self.student))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_json(response), {'results': [
+            {'course': self.algebra.id, 'enrolled': True,
+             'status': 'already_enrolled'},
+            {'course': self.geometry.id, 'enrolled': True,
+             'status': 'enrolled'},
+            {'course': 0, 'enrolled': False, 'status': 'not_found'},
+        ]})
+        self.assertTrue(self.geometry.students.filter(
+            id=self.student.id).exists())
+
+    def test_invalid_requests(self):
+        headers = self.authorize(self.student)
+        for courses in [[], 'all', [1, 'two'], [True],
+                        list(range(enrollment.MAX_BATCH_ENROLL + 1))]:
+            with self.subTest(courses=courses):
+                response = self.client.post(
+                    '/api/courses/enroll/', {'courses': courses},
+                    content_type='application/json', **headers)
+                self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            '/api/courses/enroll/', {'courses': [self.geometry.id]},
+            content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+
+class TokenTests(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.student = User.objects.create_user('student',
+                                                password='password')
+
+    def get_tokens(self, headers):
+        return self.client.get(reverse('api:token_list'), **headers)
+
+    def test_issue_token(self):
+        response = self.client.post(reverse('api:token_list'),
+                                    {'name': 'laptop', 'lifetime': 7},
+                                    HTTP_AUTHORIZATION='Basic ' +
+                                    base64.b64encode(
+                                        b'student:password').decode())
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        token = APIToken.objects.get(id=data['id'])
+        self.assertEqual(token.user, self.student)
+        self.assertEqual(token.prefix, data['token'][:8])
+        self.assertEqual(token.key_hash, hash_token(data['token']))
+        self.assertAlmostEqual(token.expires,
+                               timezone.now() + timedelta(days=7),
+                               delta=timedelta(minutes=1))
+        headers = {'HTTP_AUTHORIZATION': f'Token {data["token"]}'}
+        response = self.get_tokens(headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([token['name'] for token in response.json()],
+                         ['laptop'])
+        self.assertNotIn('token', response.json()[0])
+
+    def test_tokens_do_not_issue_tokens(self):
+        headers = self.authorize(self.student)
+        response = self.client.post(reverse('api:token_list'), **headers)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(APIToken.objects.count(), 1)
+        self.client.force_login(self.student)
+        response = self.client.post(reverse('api:token_list'),
+                                    {'lifetime': 366})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse('api:token_list'),
+                                    {'lifetime': 365})
+        self.assertEqual(response.status_code, 201)
+
+    def test_cached_user(self):
+        headers = self.authorize(self.student)
+        self.assertEqual(self.get_tokens(headers).status_code, 200)
+        key = headers['HTTP_AUTHORIZATION'].split()[1]
+        with self.assertNumQueries(0):
+            user = get_token_user(key)
+        self.assertEqual(user, self.student)
+        self.assertEqual(user.username, 'student')
+        # The password hash is neither cached nor loaded.
+        self.assertIn('password', user.get_deferred_fields())
+        self.assertNotIn(self.student.password, str(cache.get(
+            token_cache_key(hash_token(key)))))
+
+    def test_expired_token(self):
+        token, key = issue_token(self.student,
+                                 lifetime=timedelta(seconds=-1))
+        response = self.get_tokens(
+            {'HTTP_AUTHORIZATION': f'Token {key}'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+        # A cached token expires too.
+        headers = self.authorize(self.student)
+        self.assertEqual(self.get_tokens(headers).status_code, 200)
+        later = time.time() + timedelta(days=31).total_seconds()
+        with mock.patch('time.time', return_value=later):
+            self.assertEqual(self.get_tokens(headers).status_code, 401)
+
+    def test_revoke_token(self):
+        headers = self.authorize(self.student)
+        token = APIToken.objects.get()
+        self.assertEqual(self.get_tokens(headers).status_code, 200)
+        response = self.client.delete(
+            reverse('api:token_detail', args=[token.id]), **headers)
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(APIToken.objects.exists())
+        self.assertEqual(self.get_tokens(headers).status_code, 401)
+
+    def test_tokens_of_other_users(self):
+        self.authorize(self.owner)
+        token = APIToken.objects.get()
+        headers = self.authorize(self.student)
+        response = self.client.delete(
+            reverse('api:token_detail', args=[token.id]), **headers)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(len(self.get_tokens(headers).json()), 1)
+
+    def test_deactivated_user(self):
+        headers = self.authorize(self.student)
+        self.assertEqual(self.get_tokens(headers).status_code, 200)
+        self.student.is_active = False
+        self.student.save()
+        self.assertEqual(self.get_tokens(headers).status_code, 401)
+
+    def test_invalid_tokens(self):
+        for header in ['Token', 'Token a b', 'Token unknown',
+                       f'Token {"x" * 43}']:
+            with self.subTest(header=header):
+                response = self.get_tokens({'HTTP_AUTHORIZATION': header})
+                self.assertEqual(response.status_code, 401)
+        # Malformed tokens are not looked up, unknown
+        # tokens are only remembered by the process.
+        self.assertIsNone(local_tokens.get(hash_token('unknown')))
+        self.assertEqual(local_tokens.get(hash_token('x' * 43)), (None, 0))
+        self.assertIsNone(cache.get(token_cache_key(hash_token('x' * 43))))
+
+    def test_clear_tokens(self):
+        issue_token(self.student, lifetime=timedelta(seconds=-1))
+        issue_token(self.student)
+        out = StringIO()
+        call_command('clear_tokens', stdout=out)
+        self.assertEqual(out.getvalue(), 'Removed 1 tokens\n')
+        self.assertEqual(APIToken.objects.count(), 1)
+
+
+class EnrollmentCacheTests(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.student = User.objects.create_user('student',
+                                                password='password')
+        self.course = self.create_course()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.students.add(self.student)
+
+    def test_enrollments_are_cached(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(enrollment.is_enrolled(self.student,
+                                                   self.course.id))
+        with self.assertNumQueries(0):
+            self.assertTrue(enrollment.is_enrolled(self.student,
+                                                   str(self.course.id)))
+        # Cached in the shared cache for the other processes.
+        enrollment.local_enrollments.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(enrollment.get_course_ids(self.student.id),
+                             {self.course.id})
+        self.assertFalse(enrollment.is_enrolled(self.student, 'abc'))
+        self.assertFalse(enrollment.is_enrolled(AnonymousUser(),
+                                                self.course.id))
+
+    def test_changes_are_seen(self):
+        geometry = self.create_course('Geometry')
+        self.assertFalse(enrollment.is_enrolled(self.student, geometry.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.courses_joined.add(geometry)
+        self.assertTrue(enrollment.is_enrolled(self.student, geometry.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            geometry.students.remove(self.student)
+        self.assertFalse(enrollment.is_enrolled(self.student, geometry.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.students.clear()
+        self.assertFalse(enrollment.is_enrolled(self.student,
+                                                self.course.id))
+
+    def test_deleted_course(self):
+        self.assertTrue(enrollment.is_enrolled(self.student,
+                                               self.course.id))
+        course_id = self.course.id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.delete()
+        self.assertFalse(enrollment.is_enrolled(self.student, course_id))
+
+    def test_changes_bump_the_version(self):
+        # Without Redis, a change loads the
+        # enrollments again on the next check.
+        key = enrollment.enrollment_version_key(self.student.id)
+        version = catalog.get_version(key)
+        enrollment.get_course_ids(self.student.id)
+        enrollment.update_enrollments([self.student.id],
+                                      removed=[self.course.id])
+        self.assertNotEqual(catalog.get_version(key), version)
+        self.assertIsNone(enrollment.local_enrollments.get(self.student.id))
+        with self.assertNumQueries(1):
+            enrollment.get_course_ids(self.student.id)
+
+    def test_contents_permission(self):
+        other = User.objects.create_user('other', password='password')
+        response = self.client.get(
+            f'/api/courses/{self.course.id}/contents/',
+            **self.authorize(other))
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(
+            f'/api/courses/{self.course.id}/contents/',
+            **self.authorize(self.student))
+        self.assertEqual(response.status_code, 200)
+
+
+class RateLimitTests(CoursesTestCase):
+
+    def test_parse_rate(self):
+        self.assertEqual(ratelimit.parse_rate('120/min'), (120, 2))
+        self.assertEqual(ratelimit.parse_rate('30/s'), (30, 30))
+
+    def test_token_bucket(self):
+        bucket = ratelimit.TokenBucket('test', rate=1, capacity=2)
+        with mock.patch('time.time', return_value=1000):
+            self.assertEqual(bucket.consume('a'), (True, 0))
+            self.assertEqual(bucket.consume('a'), (True, 0))
+            self.assertEqual(bucket.consume('a'), (False, 1))
+            # Each client has its own bucket.
+            self.assertEqual(bucket.consume('b'), (True, 0))
+        with mock.patch('time.time', return_value=1000.5):
+            self.assertEqual(bucket.consume('a'), (False, 0.5))
+        with mock.patch('time.time', return_value=1001):
+            self.assertEqual(bucket.consume('a'), (True, 0))
+
+    def test_unavailable_cache(self):
+        bucket = ratelimit.TokenBucket('test', rate=1, capacity=1)
+        with mock.patch.object(bucket, '_consume_cache',
+                               side_effect=ConnectionError), \
+                self.assertLogs('courses.ratelimit', 'WARNING'):
+            self.assertEqual(bucket.consume('a'), (True, 0))
+
+    def test_throttled_requests(self):
+        url = reverse('api:subjects_list')
+        with mock.patch.dict(api_settings.DEFAULT_THROTTLE_RATES,
+                             {'anon': '2/min', 'user': '1/min'}):
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(self.client.get(url).status_code, 200)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], '30')
+            # Users are limited on their own.
+            headers = self.authorize(self.owner)
+            self.assertEqual(self.client.get(url, **headers).status_code,
+                             200)
+            self.assertEqual(self.client.get(url, **headers).status_code,
+                             429)
+
+    def test_overloaded(self):
+        url = reverse('api:subjects_list')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        # The request itself is in progress.
+        with mock.patch.object(ratelimit.load, 'max_in_flight', 0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(ratelimit.load.local_in_flight, 0)
+
+    def test_only_shed_requests_are_counted(self):
+        start = mock.patch.object(ratelimit.load, 'start',
+                                  wraps=ratelimit.load.start)
+        with start as start:
+            self.client.get(reverse('course_list'))
+            self.client.get('/media/files/missing.pdf')
+            self.assertFalse(start.called)
+            self.client.get(reverse('api:subjects_list'))
+            self.assertEqual(start.call_count, 1)
+        self.assertEqual(ratelimit.load.local_in_flight, 0)
+
+    def test_expired_slots_are_not_created_again(self):
+        load = ratelimit.LoadMonitor(max_in_flight=1, max_latency=1)
+        client = mock.Mock()
+        client.get_encoder().encode.side_effect = str.encode
+        with mock.patch.object(ratelimit.LoadMonitor, 'finish_script', None):
+            load.finish((time.monotonic(), client, 'slot'))
+        # The slot is only decremented by the script if it still exists.
+        self.assertFalse(client.decr.called)
+        sha, count, key = client.evalsha.call_args.args
+        self.assertEqual((count, key), (1, 'slot'))
+
+    def test_slow_requests_are_shed(self):
+        load = ratelimit.LoadMonitor(max_in_flight=10, max_latency=1)
+        self.assertFalse(load.overloaded())
+        load.latency = 2
+        with mock.patch('random.random', return_value=0.6):
+            self.assertTrue(load.overloaded())
+        with mock.patch('random.random', return_value=0.4):
+            self.assertFalse(load.overloaded())
+
+    def test_requests_in_progress(self):
+        load = ratelimit.LoadMonitor(max_in_flight=1, max_latency=1)
+        first = load.start()
+        self.assertFalse(load.overloaded())
+        second = load.start()
+        self.assertEqual(load.get_in_flight(), 2)
+        self.assertTrue(load.overloaded())
+        load.finish(second)
+        load.finish(first)
+        self.assertEqual(load.get_in_flight(), 0)
+        self.assertGreater(load.latency, 0)
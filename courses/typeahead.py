@@ -0,0 +1,245 @@
+import bisect
+import logging
+import re
+import sys
+import threading
+import time
+import unicodedata
+
+from django.core.cache import cache
+
+from . import catalog
+from .models import Course, Subject
+
+
+# Every process keeps the titles of all courses and subjects in a sorted
+# list, so that suggestions are found with a binary search instead of a
+# database query. The list is loaded when the server starts.
+#
+# Every change of a title is published in the cache under a sequence
+# number, the version stamp TYPEAHEAD_VERSION_KEY. The processes check
+# the stamp at most every check_interval seconds and apply the changes
+# they have not seen yet to their list, in place. A process only loads
+# the whole list again when it is more than MAX_PENDING_CHANGES changes
+# behind or a change is no longer in the cache.
+TYPEAHEAD_VERSION_KEY = 'typeahead_version'
+TYPEAHEAD_CHANGE_TIMEOUT = 60 * 60  # 1 hour
+MAX_PENDING_CHANGES = 1000
+SUGGESTION_LIMIT = 10
+MAX_SUGGESTION_LIMIT = 50
+
+NON_WORD_RE = re.compile(r'[\W_]+')
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(title):
+    """
+    Return the given title lowercased, without accents and with any run
+    of punctuation or whitespace replaced by a single space.
+    """
+    title = unicodedata.normalize('NFKD', title.casefold())
+    title = ''.join(char for char in title
+                    if not unicodedata.combining(char))
+    return NON_WORD_RE.sub(' ', title).strip()
+
+
+def change_key(version):
+    return f'typeahead_change_{version}'
+
+
+def publish_change(kind, pk, title=None, slug=None):
+    """
+    Publish the new title of an item, or its removal without a title,
+    to the other processes.
+    """
+    version = catalog.bump_version(TYPEAHEAD_VERSION_KEY)
+    if version is not None:
+        cache.set(change_key(version), (kind, pk, title, slug),
+                  TYPEAHEAD_CHANGE_TIMEOUT)
+
+
+class PrefixIndex:
+    """
+    Sorted array of (key, kind, id) entries where key is a normalized
+    title starting at one of its words, so that typing the beginning of
+    any word of a title suggests it.
+    """
+    # Seconds between two checks of the version stamp in the cache.
+    check_interval = 1
+
+    def __init__(self):
+        self._entries = None
+        self._items = {}
+        # Held while the entries are changed or read.
+        self._lock = threading.Lock()
+        # Held while the index is loaded or brought up to date, so
+        # that only one thread of the process does it at a time.
+        self._sync_lock = threading.Lock()
+        self._version = None
+        self._checked = 0
+        self._missing = None
+        self.built = None
+
+    def _item_keys(self, title):
+        words = normalize(title).split(' ')
+        return {' '.join(words[i:]) for i in range(len(words)) if words[i]}
+
+    def build(self):
+        """
+        Load all the courses and subjects and replace the index.
+        """
+        with self._sync_lock:
+            self._build()
+
+    def preload(self):
+        """
+        Build the index when the server starts. If the database or the
+        cache are not ready yet, it is built on first use instead.
+        """
+        try:
+            self.build()
+        except Exception:
+            logger.warning('Cannot load the typeahead index', exc_info=True)
+
+    def _build(self):
+        # The version is read first: changes made while the titles
+        # are loaded are applied again on the next check, which is
+        # harmless since applying a change twice has no effect.
+        version = catalog.get_version(TYPEAHEAD_VERSION_KEY)
+        items = {}
+        for slug, pk, title in Subject.objects.values_list('slug', 'id', 'title'):
+            items[('subject', pk)] = (title, slug)
+        for slug, pk, title in Course.objects.values_list('slug', 'id', 'title'):
+            items[('course', pk)] = (title, slug)
+        entries = sorted((key, kind, pk)
+                         for (kind, pk), (title, slug) in items.items()
+                         for key in self._item_keys(title))
+        with self._lock:
+            self._entries = entries
+            self._items = items
+            self._version = version
+            self._checked = time.monotonic()
+            self._missing = None
+            self.built = time.time()
+
+    def _ensure_current(self):
+        if self._entries is None:
+            # Requests arriving during the first build wait for it.
+            with self._sync_lock:
+                if self._entries is None:
+                    self._build()
+            return
+        if time.monotonic() - self._checked < self.check_interval:
+            return
+        # Another thread is already bringing the index up to date:
+        # answer from the current one.
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._catch_up()
+        finally:
+            self._sync_lock.release()
+
+    def _catch_up(self):
+        self._checked = time.monotonic()
+        version = catalog.get_version(TYPEAHEAD_VERSION_KEY)
+        if version == self._version:
+            return
+        if self._version is None or \
+                not 0 < version - self._version <= MAX_PENDING_CHANGES:
+            self._build()
+            return
+        versions = range(self._version + 1, version + 1)
+        changes = cache.get_many([change_key(v) for v in versions])
+        for v in versions:
+            change = changes.get(change_key(v))
+            if change is None:
+                # The change may be about to be written by its process.
+                # If it is still missing on the next check, it is lost.
+                if self._missing == v:
+                    self._build()
+                else:
+                    self._missing = v
+                return
+            self._apply(*change)
+            self._version = v
+
+    def _apply(self, kind, pk, title=None, slug=None):
+        # The entries are changed in place: a removal or an insertion
+        # keeps the array sorted, and readers hold the lock.
+        with self._lock:
+            if self._entries is None:
+                return
+            entries = self._entries
+            old = self._items.pop((kind, pk), None)
+            if old:
+                for key in self._item_keys(old[0]):
+                    index = bisect.bisect_left(entries, (key, kind, pk))
+                    if index < len(entries) and entries[index] == (key, kind, pk):
+                        del entries[index]
+            if title is not None:
+                self._items[(kind, pk)] = (title, slug)
+                for key in self._item_keys(title):
+                    bisect.insort(entries, (key, kind, pk))
+
+    def update(self, kind, pk, title, slug):
+        publish_change(kind, pk, title, slug)
+        self._apply(kind, pk, title, slug)
+
+    def remove(self, kind, pk):
+        publish_change(kind, pk)
+        self._apply(kind, pk)
+
+    def suggest(self, prefix, limit=SUGGESTION_LIMIT):
+        """
+        Return up to limit suggestions whose title has a word starting
+        with the given prefix, sorted by the matching part of the title.
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        self._ensure_current()
+        suggestions = []
+        seen = set()
+        with self._lock:
+            entries, items = self._entries, self._items
+            index = bisect.bisect_left(entries, (prefix,))
+            while index < len(entries) and len(suggestions) < limit:
+                key, kind, pk = entries[index]
+                if not key.startswith(prefix):
+                    break
+                index += 1
+                if (kind, pk) in seen or (kind, pk) not in items:
+                    continue
+                seen.add((kind, pk))
+                title, slug = items[(kind, pk)]
+                suggestions.append({'type': kind,
+                                    'id': pk,
+                                    'title': title,
+                                    'slug': slug})
+        return suggestions
+
+    def stats(self):
+        """
+        Return the size of the index and an estimate of the memory
+        it uses in bytes.
+        """
+        with self._lock:
+            entries, items = self._entries or [], self._items
+            entries_bytes = sys.getsizeof(entries) + sum(
+                sys.getsizeof(entry) + sys.getsizeof(entry[0])
+                for entry in entries)
+            items_bytes = sys.getsizeof(items) + sum(
+                sys.getsizeof(title) + sys.getsizeof(slug)
+                for title, slug in items.values())
+        return {'items': len(items),
+                'entries': len(entries),
+                'entries_bytes': entries_bytes,
+                'items_bytes': items_bytes,
+                'total_bytes': entries_bytes + items_bytes,
+                'version': self._version,
+                'built': self.built}
+
+
+index = PrefixIndex()
@@ -0,0 +1,226 @@
+import hashlib
+import os
+import tempfile
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File as DjangoFile
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Content, Upload, UploadChunk
+
+
+# Large files are sent in chunks of a few megabytes. Every chunk is
+# streamed to its place in a staging file on disk, so chunks can arrive
+# in any order, be sent again after a failure, and never sit in memory
+# as a whole. Once all of them are received, the staging file is moved
+# to the storage as the file of a new File or Image item.
+CHUNK_SIZE = 5 * 1024 * 1024  # 5 MB
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024 * 1024  # 10 GB
+# Uploads not completed after this are removed by "manage.py clear_uploads".
+UPLOAD_EXPIRATION = timedelta(days=1)
+READ_SIZE = 64 * 1024
+
+UPLOAD_MODELS = {'file': 'pdf_file', 'image': 'image_file'}
+
+
+class UploadError(Exception):
+    """
+    Raised when an upload request is invalid.
+    """
+
+
+class StagedFile(DjangoFile):
+    # FileSystemStorage moves files having a temporary path instead
+    # of copying them, like the uploads Django writes to disk.
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def get_upload_dir():
+    return getattr(settings, 'CHUNKED_UPLOAD_DIR',
+                   os.path.join(settings.FILE_UPLOAD_TEMP_DIR or
+                                tempfile.gettempdir(), 'chunked_uploads'))
+
+
+def get_path(upload):
+    return os.path.join(get_upload_dir(), f'{upload.id}.part')
+
+
+def chunk_count(upload):
+    return max(1, -(-upload.size // upload.chunk_size))
+
+
+def chunk_length(upload, index):
+    """
+    Return the number of bytes of the chunk at the given index.
+    """
+    return min(upload.chunk_size, upload.size - index * upload.chunk_size)
+
+
+def start(owner, module, model_name, title, filename, size,
+          chunk_size=CHUNK_SIZE, checksum=''):
+    """
+    Create an upload of a file of the given size to be sent in chunks
+    and return it. The staging file is created with its final size.
+    """
+    if model_name not in UPLOAD_MODELS:
+        raise UploadError(f'Cannot upload a {model_name}')
+    if not title or not filename:
+        raise UploadError('A title and a filename are required')
+    if not 0 < size <= MAX_UPLOAD_SIZE:
+        raise UploadError(f'The size must be between 1 and '
+                          f'{MAX_UPLOAD_SIZE} bytes')
+    if not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+        raise UploadError(f'The chunk size must be between '
+                          f'{MIN_CHUNK_SIZE} and {MAX_CHUNK_SIZE} bytes')
+    upload = Upload.objects.create(owner=owner,
+                                   module=module,
+                                   model_name=model_name,
+                                   title=title[:250],
+                                   filename=os.path.basename(filename)[:255],
+                                   size=size,
+                                   chunk_size=chunk_size,
+                                   checksum=checksum.lower())
+    os.makedirs(get_upload_dir(), exist_ok=True)
+    with open(get_path(upload), 'wb') as f:
+        f.truncate(size)
+    return upload
+
+
+def write_chunk(upload, index, stream, checksum):
+    """
+    Copy the chunk at the given index from the given stream to the
+    staging file and record it if its SHA-256 matches the given one.
+    A chunk can be sent again, for example after a failure.
+    """
+    if not 0 <= index < chunk_count(upload):
+        raise UploadError(f'Invalid chunk index: {index}')
+    if not checksum:
+        raise UploadError('The checksum of the chunk is required')
+    expected = chunk_length(upload, index)
+    digest = hashlib.sha256()
+    written = 0
+    # Every chunk has its own region of the file, so that chunks
+    # can be written by several requests at the same time.
+    with open(get_path(upload), 'r+b') as f:
+        f.seek(index * upload.chunk_size)
+        while written < expected:
+            data = stream.read(min(READ_SIZE, expected - written))
+            if not data:
+                break
+            f.write(data)
+            digest.update(data)
+            written += len(data)
+    error = None
+    if written != expected or stream.read(1):
+        error = f'Chunk {index} must be {expected} bytes long'
+    elif digest.hexdigest() != checksum.lower():
+        error = f'Checksum mismatch for chunk {index}'
+    if error:
+        # The region of the chunk was overwritten: a copy received
+        # before is no longer there.
+        UploadChunk.objects.filter(upload=upload, index=index).delete()
+        raise UploadError(error)
+    try:
+        with transaction.atomic():
+            UploadChunk.objects.update_or_create(
+                upload=upload, index=index,
+                defaults={'checksum': digest.hexdigest()})
+    except IntegrityError:
+        # The same chunk was recorded by a concurrent request.
+        pass
+
+
+def get_status(upload):
+    """
+    Return the state of the upload, with the chunks that are still
+    missing so that an interrupted upload can be resumed.
+    """
+    received = set(upload.chunks.values_list('index', flat=True))
+    return {'id': str(upload.id),
+            'url': reverse('upload_detail', args=[upload.id]),
+            'size': upload.size,
+            'chunk_size': upload.chunk_size,
+            'chunks': chunk_count(upload),
+            'received': sorted(received),
+            'missing': [index for index in range(chunk_count(upload))
+                        if index not in received]}
+
+
+def _file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def complete(upload):
+    """
+    Create the item and the content of a fully received upload and
+    return the content. The upload is removed.
+    """
+    with transaction.atomic():
+        # Lock the upload, so that it is only completed once.
+        upload = Upload.objects.select_for_update().get(pk=upload.pk)
+        if upload.chunks.count() != chunk_count(upload):
+            raise UploadError('Some chunks are missing')
+        path = get_path(upload)
+        if upload.checksum and _file_checksum(path) != upload.checksum:
+            raise UploadError('Checksum mismatch for the file')
+
+        model = apps.get_model('courses', upload.model_name)
+        item = model(owner=upload.owner, title=upload.title)
+        with open(path, 'rb') as f:
+            getattr(item, UPLOAD_MODELS[upload.model_name]).save(
+                upload.filename, StagedFile(f, upload.filename), save=False)
+        item.save()
+        content = Content.objects.create(module=upload.module, item=item)
+        upload.delete()
+    discard_file(path)
+    return content
+
+
+def discard_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def discard(upload):
+    """
+    Remove an upload and its staging file.
+    """
+    path = get_path(upload)
+    upload.delete()
+    discard_file(path)
+
+
+def clear_expired(now=None):
+    """
+    Remove the uploads started before the expiration delay and the
+    staging files without an upload. Return the number of removed files.
+    """
+    now = now or timezone.now()
+    removed = 0
+    for upload in Upload.objects.filter(created__lt=now - UPLOAD_EXPIRATION):
+        discard(upload)
+        removed += 1
+    upload_dir = get_upload_dir()
+    if os.path.isdir(upload_dir):
+        # List the files first: uploads started in the meantime
+        # are created before their file.
+        names = os.listdir(upload_dir)
+        upload_ids = {str(pk) for pk in Upload.objects.values_list('id', flat=True)}
+        for name in names:
+            if name.endswith('.part') and name[:-5] not in upload_ids:
+                discard_file(os.path.join(upload_dir, name))
+                removed += 1
+    return removed
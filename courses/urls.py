@@ -18,6 +18,10 @@ urlpatterns = [
          views.CourseDeleteView.as_view(),
          name='course_delete'),
     
+    path('<pk>/clone/',
+         views.CourseCloneView.as_view(),
+         name='course_clone'),
+    
     path('<pk>/module/',
          views.CourseModuleUpdateView.as_view(),
          name='course_module_update'),
@@ -26,14 +30,34 @@ urlpatterns = [
          views.ContentCreateUpdateView.as_view(),
          name='module_content_create'),
     
+    path('module/<int:module_id>/content/<model_name>/upload/',
+         views.UploadStartView.as_view(),
+         name='module_content_upload'),
+    
     path('module/<int:module_id>/content/<model_name>/<id>/',
          views.ContentCreateUpdateView.as_view(),
          name='module_content_update'),
     
+    path('upload/<uuid:upload_id>/',
+         views.UploadView.as_view(),
+         name='upload_detail'),
+    
+    path('upload/<uuid:upload_id>/<int:index>/',
+         views.UploadChunkView.as_view(),
+         name='upload_chunk'),
+    
+    path('upload/<uuid:upload_id>/complete/',
+         views.UploadCompleteView.as_view(),
+         name='upload_complete'),
+    
     path('content/<int:id>/delete/',
          views.ContentDeleteView.as_view(),
          name='module_content_delete'),
     
+    path('module/content/delete/',
+         views.ContentBulkDeleteView.as_view(),
+         name='module_content_bulk_delete'),
+    
     path('module/<int:module_id>/',
          views.ModuleContentListView.as_view(),
          name='module_content_list'),
@@ -0,0 +1,135 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import catalog
+from .models import Video
+
+
+logger = logging.getLogger(__name__)
+
+# The provider, id and embed code of a Video item are resolved from its
+# URL when it is saved and stored with it, so that rendering a video does
+# not parse the URL again. The resolver is a function taking the URL and
+# returning a dict with the keys of EMBED_FIELDS, without network calls.
+#
+# The thumbnail is looked up on the network by most backends (oEmbed),
+# so it is fetched by a background thread once the transaction that
+# saved the video commits, with the function of the THUMBNAIL_RESOLVER
+# setting taking the URL and returning the URL of the thumbnail.
+#
+# Both can be replaced in the settings, for example with functions that
+# work offline in tests.
+DEFAULT_RESOLVER = 'courses.videos.resolve_with_embed_video'
+DEFAULT_THUMBNAIL_RESOLVER = 'courses.videos.thumbnail_with_embed_video'
+# Size of the player, the "small" size of django-embed-video.
+EMBED_WIDTH = 480
+EMBED_HEIGHT = 360
+EMBED_FIELDS = ['provider', 'video_id', 'embed_html']
+
+executor = ThreadPoolExecutor(max_workers=1,
+                              thread_name_prefix='videos')
+
+
+def resolve_with_embed_video(url):
+    """
+    Resolve the given URL with the backends of django-embed-video.
+    """
+    from embed_video.backends import detect_backend
+
+    backend = detect_backend(url)
+    return {'provider': backend.__class__.__name__.replace('Backend', '')
+                                                 .lower(),
+            'video_id': backend.get_code(),
+            'embed_html': backend.get_embed_code(EMBED_WIDTH, EMBED_HEIGHT)}
+
+
+def thumbnail_with_embed_video(url):
+    """
+    Return the URL of the thumbnail of the given video, looked up with
+    the backends of django-embed-video.
+    """
+    from embed_video.backends import detect_backend
+
+    return detect_backend(url).get_thumbnail_url() or ''
+
+
+def get_resolver():
+    return import_string(getattr(settings, 'VIDEO_RESOLVER', DEFAULT_RESOLVER))
+
+
+def get_thumbnail_resolver():
+    return import_string(getattr(settings, 'VIDEO_THUMBNAIL_RESOLVER',
+                                 DEFAULT_THUMBNAIL_RESOLVER))
+
+
+def update_embed(video):
+    """
+    Resolve the URL of the given Video item and set its embed fields
+    without saving it. A URL that cannot be resolved clears them, and
+    the video is then rendered as a link. The thumbnail is cleared, it
+    is fetched by fetch_thumbnail().
+    """
+    try:
+        info = get_resolver()(video.url)
+    except Exception as e:
+        # Any URL can be entered: this is not an error of the site.
+        logger.info('Cannot resolve the video %s: %r', video.url, e)
+        info = {}
+    for field in EMBED_FIELDS:
+        setattr(video, field, info.get(field) or '')
+    video.thumbnail_url = ''
+    video.resolved_url = video.url
+
+
+def fetch_thumbnail(video):
+    """
+    Look up the thumbnail of the given Video item and save it, unless
+    its URL changed meanwhile. Return whether the thumbnail was saved.
+    """
+    if not video.embed_html:
+        return False
+    try:
+        thumbnail_url = get_thumbnail_resolver()(video.url)
+    except Exception as e:
+        # The video is still playable without a thumbnail.
+        logger.warning('Cannot get the thumbnail of the video %s: %r',
+                       video.url, e)
+        return False
+    updated = timezone.now()
+    if not Video.objects.filter(pk=video.pk, url=video.url) \
+                        .update(thumbnail_url=thumbnail_url,
+                                updated=updated):
+        return False
+    catalog.invalidate_item_courses(Video, [video.pk])
+    video.thumbnail_url, video.updated = thumbnail_url, updated
+    return True
+
+
+def _fetch(video_id):
+    close_old_connections()
+    try:
+        video = Video.objects.filter(pk=video_id).first()
+        if video is not None:
+            fetch_thumbnail(video)
+    except Exception:
+        logger.exception('Cannot update the thumbnail of video %s', video_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_thumbnails(video_ids):
+    """
+    Fetch the thumbnails of the given videos in the background once
+    the current transaction commits.
+    """
+    video_ids = list(video_ids)
+
+    def submit():
+        for video_id in video_ids:
+            executor.submit(_fetch, video_id)
+    transaction.on_commit(submit)
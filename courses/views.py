@@ -1,20 +1,29 @@
+import hashlib
 from typing import Any, Dict
-from braces.views import CsrfExemptMixin, JsonRequestResponseMixin
+from braces.views import JSONResponseMixin, JsonRequestResponseMixin
 from django.apps import apps
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
-from django.core.cache import cache
 from django.db.models import Count
 from django.db.models.query import QuerySet
 from django.forms.models import modelform_factory
+from django.core.exceptions import BadRequest, PermissionDenied
+from django.http import (FileResponse, Http404, HttpResponse,
+                         StreamingHttpResponse)
 from django.shortcuts import redirect, get_object_or_404
 from django.views.generic.list import ListView
 from django.views.generic.base import TemplateResponseMixin, View
-from django.views.generic.detail import DetailView
+from django.views.generic.detail import DetailView, SingleObjectMixin
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.utils import timezone
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date
 
 from students.forms import CourseEnrollForm
-from .models import Content, Course, Module, Subject
+from . import (catalog, cloning, contents, facets, media, ordering, search,
+               uploads)
+from .models import Content, Course, Module, Subject, Upload
 from .forms import ModuleFormset
 
 
@@ -68,7 +77,28 @@ class CourseDeleteView(OwnerCourseMixin, DeleteView):
     template_name = 'courses/manage/course/delete.html'
     permission_required = 'courses.delete_course'
 
-    
+
+
+class CourseCloneView(OwnerCourseMixin, SingleObjectMixin, View):
+    """
+    Copies a course of the current user with its modules and contents,
+    to be used as a template for a new course, and redirects to the
+    form of the copy so that its title and slug can be changed.
+
+    Args:
+        OwnerCourseMixin (Mixin): Restrict the courses to the ones of
+            the current user and check the permission.
+        SingleObjectMixin (Mixin): Retrieve the course with the pk
+            given in the URL.
+        View (class): The parent class of all views.
+    """
+    permission_required = 'courses.add_course'
+
+    def post(self, request, pk):
+        clone = cloning.clone_course(self.get_object(), request.user)
+        return redirect('course_edit', clone.id)
+
+   
 class CourseModuleUpdateView(TemplateResponseMixin, View):
     template_name = 'courses/manage/module/formset.html'
     course = None
@@ -166,8 +196,14 @@ class ContentCreateUpdateView(TemplateResponseMixin, View):
         """
 
         form = self.get_form(self.model, instance=self.obj)
+        upload_url = None
+        if not self.obj and model_name in uploads.UPLOAD_MODELS:
+            # New files and images are sent in chunks by the page.
+            upload_url = reverse('module_content_upload',
+                                 args=[module_id, model_name])
         return self.render_to_response({'form': form,
-                                        'object': self.obj})
+                                        'object': self.obj,
+                                        'upload_url': upload_url})
         
     def post(self, request, module_id, model_name, id=None):
         """
@@ -189,6 +225,114 @@ class ContentCreateUpdateView(TemplateResponseMixin, View):
                                         'object': self.obj})
             
 
+class UploadStartView(LoginRequiredMixin,
+                      JsonRequestResponseMixin,
+                      View):
+    """
+    Starts the upload of a file or image sent in chunks, which becomes
+    a new content of the module once complete. The request describes
+    the file:
+
+        {"title": "Lecture 1", "filename": "lecture1.pdf",
+         "size": 73400320, "chunk_size": 5242880, "checksum": "..."}
+
+    "chunk_size" and the SHA-256 "checksum" of the whole file are
+    optional. The response contains the id of the upload and the number
+    of chunks to send to UploadChunkView. The page sends the CSRF token
+    in the X-CSRFToken header of every request of the upload.
+
+    Args:
+        LoginRequiredMixin (Mixin): Only for authenticated users.
+        JsonRequestResponseMixin (InheritedMixin): Parse the JSON of the
+            request into self.request_json and serialize the response.
+        View (class): The parent of all views
+    """
+    def post(self, request, module_id, model_name):
+        module = get_object_or_404(Module,
+                                   id=module_id,
+                                   course__owner=request.user)
+        data = self.request_json
+        if not isinstance(data, dict):
+            return self.render_bad_request_response()
+        try:
+            upload = uploads.start(request.user,
+                                   module,
+                                   model_name,
+                                   str(data.get('title', '')),
+                                   str(data.get('filename', '')),
+                                   int(data['size']),
+                                   int(data.get('chunk_size',
+                                                uploads.CHUNK_SIZE)),
+                                   str(data.get('checksum', '')))
+        except (KeyError, TypeError, ValueError):
+            return self.render_bad_request_response()
+        except uploads.UploadError as e:
+            return self.render_json_response({'error': str(e)}, status=400)
+        return self.render_json_response(uploads.get_status(upload),
+                                         status=201)
+
+
+class UploadMixin(LoginRequiredMixin, JSONResponseMixin):
+    """
+    Retrieves the upload of the current user with the id given in the
+    URL. The request body is not parsed, so that chunks are streamed.
+    """
+    def get_upload(self):
+        return get_object_or_404(Upload,
+                                 id=self.kwargs['upload_id'],
+                                 owner=self.request.user)
+
+
+class UploadView(UploadMixin, View):
+    """
+    Returns the chunks received and missing for an upload, to resume
+    it after a failure, or cancels it with a DELETE request.
+    """
+    def get(self, request, upload_id):
+        return self.render_json_response(
+                    uploads.get_status(self.get_upload()))
+
+    def delete(self, request, upload_id):
+        uploads.discard(self.get_upload())
+        return self.render_json_response({'deleted': True})
+
+
+class UploadChunkView(UploadMixin, View):
+    """
+    Receives the chunk of an upload at the given index in the raw body
+    of a PUT request, with its SHA-256 in the X-Chunk-Checksum header.
+    The chunk is written to disk as it is read.
+    """
+    def put(self, request, upload_id, index):
+        try:
+            uploads.write_chunk(self.get_upload(),
+                                index,
+                                request,
+                                request.headers.get('X-Chunk-Checksum', ''))
+        except uploads.UploadError as e:
+            return self.render_json_response({'error': str(e)}, status=400)
+        return self.render_json_response({'received': index})
+
+
+class UploadCompleteView(UploadMixin, View):
+    """
+    Creates the item and the content of an upload once all its chunks
+    are received.
+    """
+    def post(self, request, upload_id):
+        upload = self.get_upload()
+        try:
+            content = uploads.complete(upload)
+        except uploads.UploadError as e:
+            return self.render_json_response(
+                        {'error': str(e), **uploads.get_status(upload)},
+                        status=409)
+        return self.render_json_response({
+            'content': content.id,
+            'redirect': reverse('module_content_list',
+                                args=[content.module_id])})
+
+
 class ContentDeleteView(View):
     """
     Retrives a content object with the given id, and deletes
@@ -210,6 +354,40 @@ class ContentDeleteView(View):
         return redirect('module_content_list', module.id)
     
     
+class ContentBulkDeleteView(LoginRequiredMixin,
+                            JsonRequestResponseMixin,
+                            View):
+    """
+    Deletes several contents of the current user and their related
+    objects (Text, Image, Video and File) in one request. The request
+    contains the list of content ids:
+
+        {"contents": [3, 1, 2]}
+
+    If any of the contents does not exist or does not belong to the
+    current user, nothing is deleted and a 404 response is returned.
+    The page sends the CSRF token in the X-CSRFToken header.
+
+    Args:
+        LoginRequiredMixin (Mixin): Only for authenticated users.
+        JsonRequestResponseMixin (InheritedMixin): Parse the JSON of the
+            request into self.request_json and serialize the response.
+        View (class): The parent of all views
+    """
+    def post(self, request):
+        try:
+            ids = {int(pk) for pk in self.request_json['contents']}
+        except (KeyError, TypeError, ValueError):
+            return self.render_bad_request_response()
+        # A single query checks the ownership of all the contents.
+        owned = Content.objects.filter(id__in=ids,
+                                       module__course__owner=request.user)
+        if owned.count() != len(ids):
+            raise Http404('No content matches the given query.')
+        deleted = contents.delete_contents(owned)
+        return self.render_json_response({'deleted': deleted})
+
+
 class ModuleContentListView(TemplateResponseMixin, View):
     """
     Get a module object with the given id that belings
@@ -228,41 +406,103 @@ class ModuleContentListView(TemplateResponseMixin, View):
         module = get_object_or_404(Module,
                                    id=module_id,
                                    course__owner=request.user)
-        return self.render_to_response({'module': module})
+        # Order values are sparse, so the position of the module
+        # is the number of modules before it.
+        position = module.course.modules.filter(
+                        order__lt=module.order).count() + 1
+        # The versions of both lists are sent back when they are
+        # reordered, to detect changes made in the meantime.
+        return self.render_to_response({
+            'module': module,
+            'position': position,
+            'modules_version': ordering.get_version(
+                                    Module(course=module.course)),
+            'contents_version': ordering.get_version(
+                                    Content(module=module))})
     
     
-class ModuleOrderView(CsrfExemptMixin,
+class ReorderMixin:
+    """
+    Apply the order posted by the drag and drop list of the content
+    list page. The request contains the full list of ids in their new
+    order and the version of the list it was built from:
+
+        {"course": 1, "order": [3, 1, 2], "version": 4}
+
+    The list is reordered in a single transaction that updates only the
+    rows whose position changed. If the list changed since the page was
+    loaded, nothing is saved and a 409 response with the current version
+    is returned.
+    """
+    def get_list_id(self, key):
+        # The id of the course or module of the list, None if the body
+        # is not a JSON object with an integer id.
+        try:
+            return int(self.request_json[key])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def reorder(self, instance, course_id):
+        try:
+            order = [int(pk) for pk in self.request_json['order']]
+            version = self.request_json.get('version')
+            version = ordering.reorder(instance,
+                                       order,
+                                       None if version is None else int(version))
+        except (KeyError, TypeError, ValueError):
+            return self.render_bad_request_response()
+        except ordering.StaleOrder as e:
+            return self.render_json_response({'saved': False,
+                                              'version': e.version},
+                                             status=409)
+        # The order is saved with bulk_update(), without signals.
+        catalog.invalidate_courses(course_id)
+        return self.render_json_response({'saved': 'OK',
+                                          'version': version})
+
+
+class ModuleOrderView(LoginRequiredMixin,
                       JsonRequestResponseMixin,
+                      ReorderMixin,
                       View):
     """
-    Allows to update the order of the course modules.
+    Allows to update the order of the course modules. The page sends
+    the CSRF token in the X-CSRFToken header.
 
     Args:
-        CsrfExemptMixin (InheritedMixin): Aviod checking CSRF token
-            in POST request. 
+        LoginRequiredMixin (Mixin): Only for authenticated users.
         JsonRequestResponseMixin (InheritedMixin): Analyze the request
             data. If the request data is properly formatted, the JSON is saved
             to self.request_json as Python object. For the response, it will 
             serializes the response as JSON and returns an HTTP response with 
             the application/json content type
+        ReorderMixin (InheritedMixin): Reorder all the modules of the
+            course in one request.
         View (class): Parent class for all views.
     """
     def post(self, request):
-        for id, order in self.request_json.items():
-            Module.objects.filter(id=id,
-                                  course__owner=request.user).update(order=order)
-        return self.render_json_response({'order': order})
+        course_id = self.get_list_id('course')
+        if course_id is None:
+            return self.render_bad_request_response()
+        course = get_object_or_404(Course,
+                                   id=course_id,
+                                   owner=request.user)
+        return self.reorder(Module(course=course), course.id)
     
 
-class ContentOrderView(CsrfExemptMixin,
+class ContentOrderView(LoginRequiredMixin,
                        JsonRequestResponseMixin,
+                       ReorderMixin,
                        View):
     """ Allows to update the order of the content. """
     def post(self, request):
-        for id, order in self.request_json.items():
-            Content.objects.filter(id=id,
-                                   module__course__owner=request.user).update(order=order)
-        return self.render_json_response({'saved': 'OK'})
+        module_id = self.get_list_id('module')
+        if module_id is None:
+            return self.render_bad_request_response()
+        module = get_object_or_404(Module,
+                                   id=module_id,
+                                   course__owner=request.user)
+        return self.reorder(Content(module=module), module.course_id)
     
 
 class CourseListView(TemplateResponseMixin, View):
@@ -282,44 +522,86 @@ class CourseListView(TemplateResponseMixin, View):
             Render the objects to a template and return an HTTP response.
         """
         
-        # If the cache.get('all_subjects') returns None, this means the key is 
-        # not found. In other words, it has not been cacahed or cached but timed 
-        # expired. Therefore, it will perform the query to retrieve all the 
-        # Subject objects and the number of courses, and use cache.set() to cache 
-        # the results.
-        subjects = cache.get('all_subjects')
-        if not subjects:
-            subjects = Subject.objects.annotate(
-                            total_courses=Count('courses'))
-            cache.set('all_subjects', subjects)
-            
-        all_courses = Course.objects.annotate(
-                            total_modules=Count('modules'))
-        
         # if the subject is given, filter the courses by the subject
         if subject:
             subject = get_object_or_404(Subject, slug=subject)
-            key = f'subject_{subject.id}_courses'
-            courses = cache.get(key)
-            if not courses:
-                courses = all_courses.filter(subject=subject)
-                cache.set(key, courses)
+        # The other facets (instructor, creation date and number of
+        # modules) are selected with query parameters. The counts of
+        # all the facets come from a single cached aggregated query.
+        filters = facets.Filters.from_request(request, subject)
+        query = request.GET.get('q', '').strip()
+        if query:
+            # Search results are ranked by relevance and not paginated.
+            qs = Course.objects.annotate(total_modules=Count('modules')) \
+                               .select_related('subject', 'owner')
+            qs = filters.apply(qs, timezone.now())
+            courses = search.search_courses(query, queryset=qs)
+            next_cursor = None
         else:
-            courses = cache.get('all_courses')
-            if not courses:
-                courses = all_courses
-                cache.get('all_courses', courses)
+            # Courses come from the catalog cache, which stores evaluated
+            # rows under version stamps that are bumped whenever a course,
+            # module or subject changes (see courses/signals.py). They are
+            # paginated with an opaque cursor pointing after the last
+            # course of the previous page.
+            try:
+                courses, next_cursor = catalog.get_courses(
+                                        subject,
+                                        request.GET.get('cursor'),
+                                        filters=filters)
+            except ValueError:
+                raise BadRequest('Invalid cursor')
         
-        return self.render_to_response ({'subjects': subjects,
+        return self.render_to_response ({'facets': facets.get_facets(filters),
+                                          'filter_query': filters.query(),
+                                          'filter_params': filters.params(),
                                           'subject': subject,
-                                          'courses': courses})
+                                          'courses': courses,
+                                          'next_cursor': next_cursor,
+                                          'query': query})
     
     
-class CourseDetailView(DetailView):
+class CourseConditionalMixin:
+    """
+    Answer the GET requests for a page of a course with a 304 response
+    when the client already has the current version of the course,
+    before building the context and rendering the template. The ETag
+    and Last-Modified headers come from the version of the course
+    (see catalog.get_course_validators), which changes with the course,
+    its modules, contents and items.
+
+    The pages show the current user and contain a CSRF token, so the
+    ETag also depends on the user and the CSRF cookie.
+    """
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        csrf = hashlib.md5(
+            request.META.get('CSRF_COOKIE', '').encode()).hexdigest()[:8]
+        self.course_version, etag, last_modified = \
+            catalog.get_course_validators(self.object.id,
+                                          request.resolver_match.view_name,
+                                          request.user.id,
+                                          csrf)
+        response = get_conditional_response(request,
+                                            etag=etag,
+                                            last_modified=last_modified)
+        if response is None:
+            context = self.get_context_data(object=self.object)
+            response = self.render_to_response(context)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        # Browsers check the page again on every visit.
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Cookie'])
+        return response
+
+
+class CourseDetailView(CourseConditionalMixin, DetailView):
     """
     Displays a single course overview.
 
     Args:
+        CourseConditionalMixin (mixin): Answer with a 304 response
+            when the course did not change.
         DetailView (generic): Render a "detail" view of an object.
     """
     model = Course
@@ -335,8 +617,70 @@ class CourseDetailView(DetailView):
         context['enroll_form'] = CourseEnrollForm(
                                     initial={'course':self.object})
         return context
-    
-    
-    
-    
-    
\ No newline at end of file
+
+
+class ProtectedMediaView(View):
+    """
+    Serves the files of the File and Image items, and the renditions of
+    the images, to the owner and the students of their courses only.
+
+    Supports conditional requests (ETag and Last-Modified) and single
+    byte ranges, so that videos can be seeked and downloads resumed.
+    When MEDIA_ACCEL_REDIRECT or MEDIA_SENDFILE is set, the transfer is
+    handed to the front proxy, otherwise whole files are sent with
+    FileResponse, which the WSGI server can send with sendfile().
+
+    Args:
+        View (class): The parent class of all views.
+    """
+    def get(self, request, name):
+        if not media.can_access(request.user, name):
+            raise PermissionDenied
+        path = media.get_path(name)
+        stat = media.get_stat(path)
+        if stat is None:
+            raise Http404('File not found')
+        etag = media.get_etag(stat)
+        last_modified = http_date(stat.st_mtime)
+        # 304 Not Modified for If-None-Match and If-Modified-Since.
+        response = get_conditional_response(request,
+                                            etag=etag,
+                                            last_modified=int(stat.st_mtime))
+        if response is not None:
+            return response
+
+        content_type = media.get_content_type(name)
+        offload = media.get_offload_headers(path)
+        byte_range = None
+        if not offload and request.headers.get('If-Range') in (None, etag,
+                                                               last_modified):
+            try:
+                byte_range = media.parse_range(request.headers.get('Range'),
+                                               stat.st_size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{stat.st_size}'
+                return response
+
+        if offload:
+            # The proxy sends the file and handles the ranges.
+            response = HttpResponse(content_type=content_type)
+            for header, value in offload.items():
+                response[header] = value
+        elif byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                            media.iter_range(path, start, end),
+                            status=206,
+                            content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = end - start + 1
+        else:
+            response = FileResponse(open(path, 'rb'),
+                                    content_type=content_type)
+        response['ETag'] = etag
+        response['Last-Modified'] = last_modified
+        response['Accept-Ranges'] = 'bytes'
+        response['Cache-Control'] = 'private, max-age=3600'
+        return response
+
@@ -18,6 +18,11 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "educa.settings")
 
 django_asgi_app = get_asgi_application()
 
+# Load the typeahead index of the process before the first request.
+from courses import typeahead  # noqa: E402
+
+typeahead.index.preload()
+
 application = ProtocolTypeRouter({
     'http': django_asgi_app,
     # URLRouter map websocket connection to the URL patterns
@@ -47,6 +47,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'debug_toolbar.middleware.DebugToolbarMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'courses.middleware.LoadMonitorMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     # 'django.middleware.cache.UpdateCacheMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -128,6 +129,17 @@ STATIC_URL = 'static/'
 
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Media files are served by courses.views.ProtectedMediaView, which
+# hands the transfer to the front proxy when one of these is set: the
+# prefix of an internal nginx location aliasing MEDIA_ROOT for
+# X-Accel-Redirect, or True for X-Sendfile (Apache, lighttpd).
+MEDIA_ACCEL_REDIRECT = None
+MEDIA_SENDFILE = False
+
+# Functions resolving the embed code of Video items when they are saved
+# and looking up their thumbnail in the background (see courses/videos.py).
+VIDEO_RESOLVER = 'courses.videos.resolve_with_embed_video'
+VIDEO_THUMBNAIL_RESOLVER = 'courses.videos.thumbnail_with_embed_video'
 
 
 # Default primary key field type
@@ -159,11 +171,42 @@ INTERNAL_IPS = [
 
 
 REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+      'courses.api.authentication.TokenAuthentication',
+      'rest_framework.authentication.SessionAuthentication',
+      'rest_framework.authentication.BasicAuthentication',
+    ],
     'DEFAULT_PERMISSION_CLASSES': [
       'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'
-    ]
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+      'courses.api.throttling.LoadSheddingThrottle',
+      'courses.api.throttling.UserThrottle',
+      'courses.api.throttling.AnonThrottle',
+    ],
+    # Token buckets: "100/min" allows bursts of 100 requests
+    # and 100 requests per minute on average.
+    'DEFAULT_THROTTLE_RATES': {
+      'user': '600/min',
+      'anon': '120/min',
+    },
 }
 
+# Admission control (see courses/ratelimit.py): API requests are refused
+# with a 429 response, and chat connections and messages with a close
+# code, while more than MAX_REQUESTS_IN_FLIGHT requests and chat messages
+# are in progress on the whole site, or, for a share of them, while the
+# requests of a process take more than MAX_REQUEST_LATENCY seconds on
+# average. Without the Redis cache, the requests are counted by each
+# process and the limit applies to every process.
+MAX_REQUESTS_IN_FLIGHT = 256
+MAX_REQUEST_LATENCY = 2.0
+# Paths of the HTTP requests that are counted and shed: the API and the
+# chat.
+LOAD_MONITOR_PATHS = ['/api/', '/chat/']
+# Messages each user can send to the chat rooms.
+CHAT_MESSAGE_RATE = '30/min'
+
 
 ASGI_APPLICATION = 'educa.asgi.application'
 
@@ -13,11 +13,10 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from courses.views import CourseListView
+from courses.views import CourseListView, ProtectedMediaView
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static 
 from django.contrib.auth import views as auth_views
 
 urlpatterns = [
@@ -34,6 +33,11 @@ urlpatterns = [
     path('', CourseListView.as_view(), name='course_list'),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL,
-                            document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# Media files are only served to the owner and the students of the
+# courses containing them, also in production, where the view hands
+# the transfer to the front proxy (see courses/media.py).
+urlpatterns += [
+    path(f'{settings.MEDIA_URL.strip("/")}/<path:name>',
+         ProtectedMediaView.as_view(),
+         name='protected_media'),
+]
\ No newline at end of file
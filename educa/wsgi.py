@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "educa.settings")
 
 application = get_wsgi_application()
+
+# Load the typeahead index of the process before the first request.
+from courses import typeahead  # noqa: E402
+
+typeahead.index.preload()
@@ -1,3 +1,34 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.urls import reverse
 
-# Create your tests here.
+from courses.tests import CoursesTestCase
+
+
+class StudentCourseTests(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course = self.create_course()
+        self.module = self.create_module(self.course)
+        self.create_content(self.module)
+        self.student = User.objects.create_user('student')
+        self.client.force_login(self.student)
+        self.url = reverse('student_course_detail', args=[self.course.id])
+
+    def enroll(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.students.add(self.student)
+
+    def test_only_students_see_the_course(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.enroll()
+        self.assertContains(self.client.get(self.url), 'Text item')
+
+    def test_unchanged_course_is_not_rendered_again(self):
+        self.enroll()
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.create_content(self.module, title='New item')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'New item')
@@ -1,5 +1,4 @@
 from django.urls import path
-from django.views.decorators.cache import cache_page
 
 from . import views
 
@@ -16,11 +15,13 @@ urlpatterns = [
          views.StudentCourseListView.as_view(),
          name='student_course_list'),
 
+     # Not cached with cache_page(): the views answer with a 304
+     # response as long as the course does not change.
      path('courses/<pk>/',
-          cache_page(60 * 15)(views.StudentCourseDetailView.as_view()),
+          views.StudentCourseDetailView.as_view(),
           name='student_course_detail'),
      
      path('courses<pk>/<module_id>/',
-          cache_page(60 * 15)(views.StudentCourseDetailView.as_view()),
+          views.StudentCourseDetailView.as_view(),
           name='student_course_detail_module')
 ]
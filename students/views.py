@@ -3,13 +3,16 @@ from django.contrib.auth import authenticate, login
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.forms import UserCreationForm
 from django.db.models.query import QuerySet
+from django.http import Http404
 from django.shortcuts import render
 from django.urls import reverse_lazy
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import CreateView, FormView
 from django.views.generic.list import ListView
 
+from courses import enrollment
 from courses.models import Course
+from courses.views import CourseConditionalMixin
 from .forms import CourseEnrollForm
 
 
@@ -78,25 +81,32 @@ class StudentCourseListView(LoginRequiredMixin,
     
     
     
-class StudentCourseDetailView(DetailView):
+class StudentCourseDetailView(CourseConditionalMixin, DetailView):
     """
     Display the first module or the given module 
     id of the course that the current user is 
-    enrolled in.
+    enrolled in. Unchanged courses are answered
+    with a 304 response (see CourseConditionalMixin).
     """
     model = Course
     template_name = 'students/course/detail.html'
     
-    def get_queryset(self):
+    def get_object(self, queryset=None):
         # Retrieve only the courses that the 
-        # current user os enrolled in.
-        qs = super().get_queryset()
-        return qs.filter(students__in=[self.request.user])
+        # current user is enrolled in, checked
+        # in the cached enrollments of the user.
+        if not enrollment.is_enrolled(self.request.user,
+                                      self.kwargs.get('pk')):
+            raise Http404('No course found matching the query')
+        return super().get_object(queryset)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # get course object
-        course = self.get_object()
+        course = self.object
+        # The contents of the module are cached for
+        # the current version of the course.
+        context['course_version'] = self.course_version
         # If the module_id is in the URL parameter, get
         # the module with the given id, otherwise get 
         # the first module of the course.